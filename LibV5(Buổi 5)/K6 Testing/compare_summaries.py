@@ -0,0 +1,106 @@
+"""
+So sánh hai file summary JSON do các kịch bản trong scenarios/ ghi ra (handleSummary).
+
+    # V1 và V2 cùng kịch bản
+    python compare_summaries.py results/search_uncached-v1-*.json results/search_uncached-v2-*.json
+
+    # Lần chạy mới nhất với lần trước đó của cùng kịch bản + version
+    python compare_summaries.py --latest search_uncached v2
+
+In ra thời gian phản hồi (từng sub-metric theo tag name), throughput, tỉ lệ lỗi và
+trạng thái threshold của hai lần chạy. Exit code 1 nếu lần chạy thứ hai có threshold fail.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+TREND_STATS = ('med', 'p(95)', 'p(99)', 'max')
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def latest_pair(scenario, api_version, results_dir=RESULTS_DIR):
+    paths = sorted(glob.glob(os.path.join(results_dir, f'{scenario}-{api_version}-*.json')))
+    if len(paths) < 2:
+        raise SystemExit(f'Cần ít nhất 2 summary cho {scenario}-{api_version} trong {results_dir}')
+    return paths[-2], paths[-1]
+
+
+def _label(summary, path):
+    run = summary.get('run') or {}
+    if not run:
+        return os.path.basename(path)
+    return f"{run.get('scenario', '?')}/{run.get('api_version', '?')} ({run.get('finished_at', '?')})"
+
+
+def _change(old, new):
+    if old in (None, 0) or new is None:
+        return ''
+    return f'{(new / old - 1):+.0%}'
+
+
+def _fmt(value):
+    return '-' if value is None else f'{value:.2f}'
+
+
+def compare(a, b, label_a, label_b):
+    failed = False
+    metrics_a, metrics_b = a.get('metrics', {}), b.get('metrics', {})
+    names = sorted(set(metrics_a) | set(metrics_b))
+
+    print(f'A = {label_a}\nB = {label_b}\n')
+    print(f"{'metric':<48} {'stat':>6} {'A':>10} {'B':>10} {'Δ':>6}")
+    for name in names:
+        values_a = metrics_a.get(name, {}).get('values', {})
+        values_b = metrics_b.get(name, {}).get('values', {})
+        kind = (metrics_b.get(name) or metrics_a.get(name)).get('type')
+        if kind == 'trend' and (name.startswith('http_req_duration') or not name.startswith('http_req_')):
+            stats = TREND_STATS
+        elif kind in ('counter', 'rate'):
+            stats = ('rate',) if kind == 'rate' else ('count', 'rate')
+        else:
+            continue
+        for stat in stats:
+            old, new = values_a.get(stat), values_b.get(stat)
+            print(f'{name[:48]:<48} {stat:>6} {_fmt(old):>10} {_fmt(new):>10} {_change(old, new):>6}')
+
+    print('\nThreshold:')
+    for name in names:
+        thresholds_a = metrics_a.get(name, {}).get('thresholds', {})
+        thresholds_b = metrics_b.get(name, {}).get('thresholds', {})
+        for expression in sorted(set(thresholds_a) | set(thresholds_b)):
+            ok_a = thresholds_a.get(expression, {}).get('ok')
+            ok_b = thresholds_b.get(expression, {}).get('ok')
+            failed = failed or ok_b is False
+            status = {True: 'ok', False: 'FAIL', None: '-'}
+            print(f'  {name} {expression}: A={status[ok_a]} B={status[ok_b]}')
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='So sánh hai summary JSON của k6.')
+    parser.add_argument('files', nargs='*', help='Hai file summary: A (cũ/V1) và B (mới/V2)')
+    parser.add_argument('--latest', nargs=2, metavar=('SCENARIO', 'API_VERSION'),
+                        help='So sánh hai lần chạy gần nhất của một kịch bản')
+    parser.add_argument('--results-dir', default=RESULTS_DIR)
+    args = parser.parse_args(argv)
+
+    if args.latest:
+        path_a, path_b = latest_pair(*args.latest, results_dir=args.results_dir)
+    elif len(args.files) == 2:
+        path_a, path_b = args.files
+    else:
+        parser.error('Cần đúng hai file hoặc --latest SCENARIO API_VERSION')
+
+    a, b = load(path_a), load(path_b)
+    return 1 if compare(a, b, _label(a, path_a), _label(b, path_b)) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+// --- Hàm dùng chung cho các kịch bản k6 trong scenarios/ ---
+//
+// Biến môi trường (k6 run -e KEY=VALUE):
+//   BASE_URL     mặc định http://127.0.0.1:5000
+//   API_VERSION  v7 (appV7.py, /api), v1 hoặc v2 (appV7 blueprint.py, /api/v1, /api/v2). Mặc định v7
+//   RESULTS_DIR  thư mục ghi summary JSON, mặc định results
+//   PASSWORD     mật khẩu cho user tạo trong setup, mặc định k6-password
+import http from 'k6/http';
+import { check } from 'k6';
+import { textSummary } from 'https://jslib.k6.io/k6-summary/0.0.2/index.js';
+
+export const BASE_URL = __ENV.BASE_URL || 'http://127.0.0.1:5000';
+export const API_VERSION = __ENV.API_VERSION || 'v7';
+export const API = BASE_URL + (API_VERSION === 'v7' ? '/api' : `/api/${API_VERSION}`);
+// V1 không có route admin, dùng của V2 (cùng process); token admin cũng lấy/refresh ở đó
+export const ADMIN_AUTH_API = BASE_URL + (API_VERSION === 'v7' ? '/api' : '/api/v2');
+export const ADMIN_API = `${ADMIN_AUTH_API}/admin`;
+// p(99) để compare_summaries.py so được đuôi phân phối
+export const SUMMARY_TREND_STATS = ['avg', 'min', 'med', 'max', 'p(90)', 'p(95)', 'p(99)'];
+const PASSWORD = __ENV.PASSWORD || 'k6-password';
+const JSON_HEADERS = { 'Content-Type': 'application/json' };
+
+export function authHeaders(token) {
+  return { 'Content-Type': 'application/json', 'x-access-token': token };
+}
+
+// Đăng ký (bỏ qua nếu đã tồn tại) rồi đăng nhập, trả về phiên { token, refresh_token, expires_at }.
+// V1 không có refresh token: refresh_token = null, token sống 60 phút như cũ.
+export function registerAndLoginSession(username) {
+  const credentials = JSON.stringify({ username, password: PASSWORD });
+  http.post(`${API}/register`, credentials, { headers: JSON_HEADERS, tags: { name: 'register' } });
+  const res = http.post(`${API}/login`, credentials, { headers: JSON_HEADERS, tags: { name: 'login' } });
+  check(res, { 'login 200': (r) => r.status === 200 });
+  return sessionFrom(res);
+}
+
+export function registerAndLogin(username) {
+  return registerAndLoginSession(username).token;
+}
+
+function sessionFrom(res) {
+  const body = res.json();
+  return {
+    token: body.token,
+    refresh_token: body.refresh_token || null,
+    expires_at: body.expires_in ? Date.now() + body.expires_in * 1000 : null,
+  };
+}
+
+// Đổi refresh token lấy phiên mới; null nếu refresh token không còn dùng được
+export function refreshSession(refreshToken, api = API) {
+  const res = http.post(`${api}/token/refresh`, JSON.stringify({ refresh_token: refreshToken }), {
+    headers: JSON_HEADERS,
+    tags: { name: 'token_refresh' },
+  });
+  return check(res, { 'token refresh 200': (r) => r.status === 200 }) ? sessionFrom(res) : null;
+}
+
+// Mỗi VU một user riêng: tạo trong setup(), VU lấy token theo __VU
+export function createUsers(prefix, count) {
+  const runId = Date.now().toString(36);
+  const sessions = [];
+  for (let i = 0; i < count; i++) {
+    sessions.push(registerAndLoginSession(`k6_${prefix}_${runId}_${i}`));
+  }
+  return sessions;
+}
+
+// Phiên của VU này (mỗi VU là một JS runtime riêng nên biến module không dùng chung giữa các VU)
+let vuSession = null;
+
+// Access token của VU; gần hết hạn thì đổi bằng refresh token thay vì đăng nhập lại (không tốn bcrypt).
+// Refresh token chỉ dùng được một lần, nên chỉ VU "chủ" của phiên (__VU <= số phiên) được đổi;
+// các VU dùng chung phiên (khi có ít user hơn VU) giữ access token ban đầu.
+export function tokenForVu(sessions) {
+  if (vuSession === null) {
+    vuSession = Object.assign({}, sessions[(__VU - 1) % sessions.length]);
+    vuSession.owner = __VU <= sessions.length;
+  }
+  if (vuSession.owner && vuSession.refresh_token && vuSession.expires_at - Date.now() < 30000) {
+    const session = refreshSession(vuSession.refresh_token);
+    if (session) {
+      vuSession = Object.assign(session, { owner: true });
+    }
+  }
+  return vuSession.token;
+}
+
+// Phân trang nằm ở top-level (V1, v7) hoặc trong meta (V2)
+export function pagination(res) {
+  const body = res.json();
+  return (body.meta && body.meta.pagination) || body.pagination || {};
+}
+
+export function bookIds(res) {
+  const body = res.json();
+  return (body.data || []).map((b) => b.id);
+}
+
+export function randomItem(items) {
+  return items[Math.floor(Math.random() * items.length)];
+}
+
+// Tham số làm cache key khác nhau mỗi request (route /books cache theo query string)
+export function cacheBuster() {
+  return `_r=${Math.random().toString(36).slice(2)}`;
+}
+
+// Summary JSON có tên kịch bản + version API để so sánh các lần chạy (compare_summaries.py)
+export function makeHandleSummary(scenarioName) {
+  return function (data) {
+    const stamp = new Date().toISOString().replace(/[:.]/g, '-');
+    const dir = __ENV.RESULTS_DIR || 'results';
+    data.run = { scenario: scenarioName, api_version: API_VERSION, base_url: BASE_URL, finished_at: stamp };
+    return {
+      stdout: textSummary(data, { indent: ' ', enableColors: true }),
+      [`${dir}/${scenarioName}-${API_VERSION}-${stamp}.json`]: JSON.stringify(data, null, 2),
+    };
+  };
+}
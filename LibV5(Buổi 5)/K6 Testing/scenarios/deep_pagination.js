@@ -0,0 +1,50 @@
+// Phân trang sâu: đọc các trang ở 10% cuối danh sách (skip lớn), không trúng cache.
+//   k6 run -e API_VERSION=v2 scenarios/deep_pagination.js
+// Nên chạy với dữ liệu lớn từ gen_dataset.py.
+import http from 'k6/http';
+import { check } from 'k6';
+import {
+  API, authHeaders, registerAndLogin, pagination, cacheBuster, makeHandleSummary, SUMMARY_TREND_STATS,
+} from '../lib/common.js';
+
+const LIMIT = 20;
+
+export const options = {
+  summaryTrendStats: SUMMARY_TREND_STATS,
+  scenarios: {
+    deep_pages: {
+      executor: 'constant-arrival-rate',
+      rate: parseInt(__ENV.RATE || '20', 10),
+      timeUnit: '1s',
+      duration: __ENV.DURATION || '1m',
+      preAllocatedVUs: 20,
+      maxVUs: 200,
+    },
+  },
+  thresholds: {
+    http_req_failed: ['rate<0.01'],
+    'http_req_duration{name:first_page}': ['p(95)<500'],
+    'http_req_duration{name:deep_page}': ['p(95)<2000'],
+  },
+};
+
+export function setup() {
+  const token = registerAndLogin(`k6_deep_${Date.now().toString(36)}`);
+  const res = http.get(`${API}/books?page=1&limit=${LIMIT}&${cacheBuster()}`, { headers: authHeaders(token) });
+  return { token, totalPages: Math.max(1, pagination(res).totalPages || 1) };
+}
+
+export default function (data) {
+  const headers = authHeaders(data.token);
+  // 1/10 request đọc trang đầu để so sánh với trang sâu trong cùng lần chạy
+  const deep = Math.random() >= 0.1;
+  const tail = Math.max(1, Math.floor(data.totalPages / 10));
+  const page = deep ? data.totalPages - Math.floor(Math.random() * tail) : 1;
+  const res = http.get(`${API}/books?page=${page}&limit=${LIMIT}&${cacheBuster()}`, {
+    headers,
+    tags: { name: deep ? 'deep_page' : 'first_page' },
+  });
+  check(res, { 'page 200': (r) => r.status === 200 });
+}
+
+export const handleSummary = makeHandleSummary('deep_pagination');
@@ -0,0 +1,49 @@
+// Đọc danh sách sách ĐÃ CACHE, tăng dần tốc độ tới khi server bão hòa.
+//   k6 run -e API_VERSION=v2 scenarios/read_cached_ramp.js
+// Dừng sớm khi lỗi > 1% hoặc p95 > 500ms kéo dài (abortOnFail), mốc dừng chính là điểm bão hòa.
+import http from 'k6/http';
+import { check } from 'k6';
+import { API, authHeaders, registerAndLogin, makeHandleSummary, SUMMARY_TREND_STATS } from '../lib/common.js';
+
+const MAX_RATE = parseInt(__ENV.MAX_RATE || '2000', 10);
+
+export const options = {
+  summaryTrendStats: SUMMARY_TREND_STATS,
+  scenarios: {
+    cached_read_ramp: {
+      executor: 'ramping-arrival-rate',
+      startRate: 50,
+      timeUnit: '1s',
+      preAllocatedVUs: 50,
+      maxVUs: 500,
+      stages: [
+        { duration: '30s', target: Math.round(MAX_RATE / 4) },
+        { duration: '30s', target: Math.round(MAX_RATE / 2) },
+        { duration: '30s', target: MAX_RATE },
+        { duration: '30s', target: MAX_RATE },
+      ],
+    },
+  },
+  thresholds: {
+    http_req_failed: [{ threshold: 'rate<0.01', abortOnFail: true, delayAbortEval: '10s' }],
+    'http_req_duration{name:books_cached}': [{ threshold: 'p(95)<500', abortOnFail: true, delayAbortEval: '10s' }],
+    dropped_iterations: ['count<100'],
+  },
+};
+
+export function setup() {
+  const token = registerAndLogin(`k6_read_${Date.now().toString(36)}`);
+  // Làm nóng cache cho đúng URL sẽ đọc
+  http.get(`${API}/books?page=1&limit=20`, { headers: authHeaders(token) });
+  return { token };
+}
+
+export default function (data) {
+  const res = http.get(`${API}/books?page=1&limit=20`, {
+    headers: authHeaders(data.token),
+    tags: { name: 'books_cached' },
+  });
+  check(res, { 'books 200': (r) => r.status === 200 });
+}
+
+export const handleSummary = makeHandleSummary('read_cached_ramp');
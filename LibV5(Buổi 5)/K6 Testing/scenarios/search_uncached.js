@@ -0,0 +1,50 @@
+// Tìm kiếm KHÔNG trúng cache: title/author ngẫu nhiên + tham số _r để mỗi request là một cache key mới.
+//   k6 run -e API_VERSION=v1 scenarios/search_uncached.js
+import http from 'k6/http';
+import { check } from 'k6';
+import {
+  API, authHeaders, createUsers, tokenForVu, randomItem, cacheBuster, makeHandleSummary, SUMMARY_TREND_STATS,
+} from '../lib/common.js';
+
+const VUS = parseInt(__ENV.VUS || '20', 10);
+// Từ khóa khớp với dữ liệu mẫu và gen_dataset.py (có cả từ không khớp gì)
+const TITLE_TERMS = ['lão', 'số đỏ', 'mắt', 'mùa', 'người', 'the', 'night', 'river', 'war', 'tập', 'vol', 'zzz'];
+const AUTHOR_TERMS = ['nguyễn', 'nam cao', 'tô hoài', 'trần', 'smith', 'orwell', 'austen', 'văn', 'thị', 'zzz'];
+
+export const options = {
+  summaryTrendStats: SUMMARY_TREND_STATS,
+  setupTimeout: '5m', // Đăng ký + đăng nhập từng user (bcrypt) khá chậm
+  scenarios: {
+    search_mix: {
+      executor: 'constant-vus',
+      vus: VUS,
+      duration: __ENV.DURATION || '1m',
+    },
+  },
+  thresholds: {
+    http_req_failed: ['rate<0.01'],
+    'http_req_duration{name:search_title}': ['p(95)<800'],
+    'http_req_duration{name:search_author}': ['p(95)<800'],
+    'http_req_duration{name:search_both}': ['p(95)<800'],
+  },
+};
+
+export function setup() {
+  return { sessions: createUsers('search', Math.min(VUS, 10)) };
+}
+
+export default function (data) {
+  const headers = authHeaders(tokenForVu(data.sessions));
+  const title = encodeURIComponent(randomItem(TITLE_TERMS));
+  const author = encodeURIComponent(randomItem(AUTHOR_TERMS));
+  const page = 1 + Math.floor(Math.random() * 3);
+  const kind = randomItem(['search_title', 'search_author', 'search_both']);
+  let query = `page=${page}&limit=20&${cacheBuster()}`;
+  if (kind !== 'search_author') query += `&title=${title}`;
+  if (kind !== 'search_title') query += `&author=${author}`;
+
+  const res = http.get(`${API}/books?${query}`, { headers, tags: { name: kind } });
+  check(res, { 'search 200': (r) => r.status === 200 });
+}
+
+export const handleSummary = makeHandleSummary('search_uncached');
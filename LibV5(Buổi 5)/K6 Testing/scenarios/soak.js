@@ -0,0 +1,117 @@
+// Soak: tải vừa phải, kéo dài, để phát hiện rò rỉ bộ nhớ và độ trễ tăng dần theo thời gian.
+//   k6 run -e API_VERSION=v2 -e DURATION=2h -e ADMIN_REFRESH_TOKEN=<refresh_token admin> scenarios/soak.js
+// Khi có ADMIN_REFRESH_TOKEN (lấy từ /login của admin), một scenario phụ đọc /admin/memory/caches
+// mỗi 30s và đưa kích thước cache vào metric flask_cache_resident_bytes / flask_cache_entries để xem
+// có tăng mãi không. Access token admin được đổi bằng refresh token trước khi hết hạn (15 phút), nên
+// chạy được lâu; refresh token chỉ dùng một lần, sau lần chạy này cần đăng nhập lại để lấy cái mới.
+import http from 'k6/http';
+import { check, sleep } from 'k6';
+import { Trend } from 'k6/metrics';
+import {
+  API, ADMIN_API, ADMIN_AUTH_API, authHeaders, createUsers, tokenForVu, refreshSession, bookIds, randomItem,
+  cacheBuster, makeHandleSummary, SUMMARY_TREND_STATS,
+} from '../lib/common.js';
+
+const VUS = parseInt(__ENV.VUS || '20', 10);
+const DURATION = __ENV.DURATION || '1h';
+const cacheBytes = new Trend('flask_cache_resident_bytes');
+const cacheEntries = new Trend('flask_cache_entries');
+
+http.setResponseCallback(http.expectedStatuses({ min: 200, max: 299 }, 404));
+
+const scenarios = {
+  soak_mix: {
+    executor: 'constant-vus',
+    vus: VUS,
+    duration: DURATION,
+    exec: 'mixedWorkload',
+  },
+};
+if (__ENV.ADMIN_REFRESH_TOKEN) {
+  scenarios.memory_probe = {
+    executor: 'constant-arrival-rate',
+    rate: 1,
+    timeUnit: '30s',
+    duration: DURATION,
+    preAllocatedVUs: 1,
+    maxVUs: 1, // Một VU giữ phiên admin, refresh token không bị hai VU cùng đổi
+    exec: 'memoryProbe',
+  };
+}
+
+export const options = {
+  summaryTrendStats: SUMMARY_TREND_STATS,
+  setupTimeout: '5m', // Đăng ký + đăng nhập từng user (bcrypt) khá chậm
+  scenarios,
+  thresholds: {
+    http_req_failed: ['rate<0.01'],
+    'http_req_duration{name:books}': ['p(95)<500', 'p(99)<1000'],
+    'http_req_duration{name:search}': ['p(95)<800'],
+    'http_req_duration{name:borrow}': ['p(95)<800'],
+    'http_req_duration{name:history}': ['p(95)<800'],
+  },
+};
+
+export function setup() {
+  const sessions = createUsers('soak', VUS);
+  const res = http.get(`${API}/books?page=1&limit=50`, { headers: authHeaders(sessions[0].token) });
+  return { sessions, ids: bookIds(res) };
+}
+
+export function mixedWorkload(data) {
+  const headers = authHeaders(tokenForVu(data.sessions));
+  const roll = Math.random();
+  if (roll < 0.6) {
+    const page = 1 + Math.floor(Math.random() * 5);
+    const res = http.get(`${API}/books?page=${page}&limit=20`, { headers, tags: { name: 'books' } });
+    check(res, { 'books 200': (r) => r.status === 200 });
+  } else if (roll < 0.75) {
+    const title = encodeURIComponent(randomItem(['a', 'e', 'the', 'mùa']));
+    const res = http.get(`${API}/books?title=${title}&${cacheBuster()}`, {
+      headers,
+      tags: { name: 'search' },
+    });
+    check(res, { 'search 200': (r) => r.status === 200 });
+  } else if (roll < 0.9) {
+    const res = http.get(`${API}/borrow-records`, { headers, tags: { name: 'history' } });
+    check(res, { 'history 200': (r) => r.status === 200 });
+  } else {
+    const borrow = http.post(`${API}/borrow-records`, JSON.stringify({ book_id: randomItem(data.ids) }), {
+      headers,
+      tags: { name: 'borrow' },
+    });
+    if (borrow.status === 201) {
+      http.put(`${API}/borrow-records/${borrow.json('record.id')}`, null, { headers, tags: { name: 'return' } });
+    }
+  }
+  sleep(0.5 + Math.random());
+}
+
+// Phiên admin của VU chạy memoryProbe (scenario chỉ có một VU nên refresh token không bị dùng hai lần)
+let adminSession = null;
+
+function adminToken() {
+  if (adminSession === null || adminSession.expires_at - Date.now() < 30000) {
+    const refreshToken = adminSession ? adminSession.refresh_token : __ENV.ADMIN_REFRESH_TOKEN;
+    adminSession = refreshSession(refreshToken, ADMIN_AUTH_API) || adminSession;
+  }
+  return adminSession ? adminSession.token : null;
+}
+
+export function memoryProbe() {
+  const token = adminToken();
+  if (!token) {
+    return;
+  }
+  const res = http.get(`${ADMIN_API}/memory/caches`, {
+    headers: authHeaders(token),
+    tags: { name: 'memory_probe' },
+  });
+  if (check(res, { 'memory probe 200': (r) => r.status === 200 })) {
+    const flaskCache = res.json('caches.flask_cache') || {};
+    cacheBytes.add(flaskCache.resident_bytes || 0);
+    cacheEntries.add(flaskCache.entries || 0);
+  }
+}
+
+export const handleSummary = makeHandleSummary('soak');
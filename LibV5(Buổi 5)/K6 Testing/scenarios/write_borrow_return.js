@@ -0,0 +1,60 @@
+// Ghi nhiều: mỗi VU là một user riêng, mượn một quyển ngẫu nhiên rồi trả lại.
+//   k6 run -e API_VERSION=v2 -e VUS=50 scenarios/write_borrow_return.js
+// 404 khi mượn (sách đã hết) là kết quả hợp lệ, không tính là lỗi.
+import http from 'k6/http';
+import { check } from 'k6';
+import { Counter } from 'k6/metrics';
+import {
+  API, authHeaders, createUsers, tokenForVu, bookIds, randomItem, makeHandleSummary, SUMMARY_TREND_STATS,
+} from '../lib/common.js';
+
+const VUS = parseInt(__ENV.VUS || '30', 10);
+const outOfStock = new Counter('borrow_out_of_stock');
+
+http.setResponseCallback(http.expectedStatuses({ min: 200, max: 299 }, 404));
+
+export const options = {
+  summaryTrendStats: SUMMARY_TREND_STATS,
+  setupTimeout: '5m', // Đăng ký + đăng nhập từng user (bcrypt) khá chậm
+  scenarios: {
+    borrow_return: {
+      executor: 'constant-vus',
+      vus: VUS,
+      duration: __ENV.DURATION || '1m',
+    },
+  },
+  thresholds: {
+    http_req_failed: ['rate<0.01'],
+    'http_req_duration{name:borrow}': ['p(95)<800', 'p(99)<1500'],
+    'http_req_duration{name:return}': ['p(95)<800', 'p(99)<1500'],
+    checks: ['rate>0.99'],
+  },
+};
+
+export function setup() {
+  const sessions = createUsers('write', VUS);
+  // Tập sách để mượn: vài trang đầu của danh sách
+  let ids = [];
+  for (let page = 1; page <= 5; page++) {
+    const res = http.get(`${API}/books?page=${page}&limit=20`, { headers: authHeaders(sessions[0].token) });
+    ids = ids.concat(bookIds(res));
+  }
+  return { sessions, ids };
+}
+
+export default function (data) {
+  const headers = authHeaders(tokenForVu(data.sessions));
+  const borrow = http.post(`${API}/borrow-records`, JSON.stringify({ book_id: randomItem(data.ids) }), {
+    headers,
+    tags: { name: 'borrow' },
+  });
+  check(borrow, { 'borrow 201/404': (r) => r.status === 201 || r.status === 404 });
+  if (borrow.status !== 201) {
+    outOfStock.add(1);
+    return;
+  }
+  const ret = http.put(`${API}/borrow-records/${borrow.json('record.id')}`, null, { headers, tags: { name: 'return' } });
+  check(ret, { 'return 200': (r) => r.status === 200 });
+}
+
+export const handleSummary = makeHandleSummary('write_borrow_return');
@@ -0,0 +1,107 @@
+"""
+Spec Swagger dựng sẵn thành file JSON, thay cho việc flasgger đọc YAML trong docstring lúc chạy.
+
+flasgger dựng spec bằng cách parse docstring của mọi route; với DEBUG=True việc này lặp lại
+mỗi lần tải /apispec_1.json (bản blueprint có hai version của mỗi route). Bước build ghi
+spec ra openapi/<tên app>.json một lần:
+
+    python api_spec.py appV7.py "appV7 blueprint.py"
+
+Build phải import app nên cần cùng môi trường với lúc chạy app (.env, MongoDB).
+
+API_SPEC_MODE:
+    live    flasgger dựng spec từ docstring (mặc định, tiện khi đang sửa docstring)
+    static  Đọc file đã build một lần lúc khởi động. /apispec_1.json trả nguyên nội dung file
+            kèm ETag và Cache-Control (API_SPEC_MAX_AGE giây, mặc định 86400), 304 nếu
+            If-None-Match khớp. request_validation cũng lấy schema từ file này, nên app
+            không parse docstring nào. Thiếu file thì app không khởi động.
+"""
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+
+from flask import Response, request
+
+SPEC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'openapi')
+
+
+def spec_path(app_file):
+    name = os.path.splitext(os.path.basename(app_file))[0].replace(' ', '_')
+    return os.path.join(SPEC_DIR, f'{name}.json')
+
+
+def build(app):
+    """Spec của app (chỉ spec mặc định apispec_1) dạng dict; app phải có flasgger (app.swag)."""
+    with app.test_request_context():
+        return app.swag.get_apispecs()
+
+
+def dump(spec):
+    # sort_keys: build lại cùng nội dung ra cùng bytes, nên ETag không đổi giữa các lần deploy
+    return json.dumps(spec, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def init_app(app, swagger, app_file):
+    """
+    Ở chế độ static, thay view spec của flasgger (hoặc thêm route /apispec_1.json nếu app không
+    dùng flasgger, swagger=None) bằng file đã build; trả về spec (dict) hoặc None.
+    """
+    if os.getenv('API_SPEC_MODE', 'live').lower() != 'static':
+        return None
+    path = spec_path(app_file)
+    try:
+        with open(path, 'rb') as f:
+            body = f.read()
+    except FileNotFoundError:
+        raise RuntimeError(f'API_SPEC_MODE=static nhưng chưa có {path}; chạy: python api_spec.py "{app_file}"')
+    etag = hashlib.sha256(body).hexdigest()[:32]
+    max_age = int(os.getenv('API_SPEC_MAX_AGE', 86400))
+
+    def static_spec():
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        return response.make_conditional(request)
+
+    if swagger is None:
+        app.add_url_rule('/apispec_1.json', 'apispec_1', static_spec)
+    else:
+        for endpoint in swagger.endpoints:
+            app.view_functions[f"{swagger.config.get('endpoint', 'flasgger')}.{endpoint}"] = static_spec
+    return json.loads(body)
+
+
+def _load_app(path):
+    name = os.path.splitext(os.path.basename(path))[0].replace(' ', '_')
+    module_spec = importlib.util.spec_from_file_location(f'{name}_spec_build', path)
+    module = importlib.util.module_from_spec(module_spec)
+    module_spec.loader.exec_module(module)
+    return module
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build spec Swagger của app ra openapi/*.json.')
+    parser.add_argument('apps', nargs='+', help='File app, ví dụ appV7.py "appV7 blueprint.py"')
+    args = parser.parse_args(argv)
+
+    os.environ['API_SPEC_MODE'] = 'live'  # Build luôn dựng spec từ docstring
+    os.environ['API_DOCS'] = 'on'
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.makedirs(SPEC_DIR, exist_ok=True)
+    for app_file in args.apps:
+        module = _load_app(app_file)
+        app = module.create_app() if hasattr(module, 'create_app') else module.app
+        body = dump(build(app))
+        path = spec_path(app_file)
+        with open(path, 'wb') as f:
+            f.write(body)
+        print(f'{app_file} -> {path} ({len(body)} bytes)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,29 +1,52 @@
-from flask import Flask, jsonify, request, render_template, Blueprint
-from datetime import datetime, timedelta, timezone
+from flask import Flask, jsonify, request, render_template, g, Blueprint
+from datetime import datetime
 import jwt
+import logging
 from functools import wraps
 from flasgger import Swagger
-from flask_bcrypt import Bcrypt
 from flask_caching import Cache
+import io
 import os
 from dotenv import load_dotenv
 import mongoengine as db
 from mongoengine import connect
 from mongoengine.errors import DoesNotExist, ValidationError
 
+import book_import
+import borrow_history
+import api_spec
+import auth_tokens
+import log_setup
+import memdiag
+import metrics
+import mongo_pool
+import password_hashing
+import profiling
+import query_plans
+import request_timing
+import request_validation
+import stock_shards
+import token_revocation
+import tracing
+import write_behind
+
 # ======================================================================
 # --- SECTION 2: APP INITIALIZATION & CONFIG (Khởi tạo) ---
 # ======================================================================
 load_dotenv()
+# Log JSON qua queue, ghi bởi thread nền (xem log_setup.py)
+log_setup.configure()
+log = logging.getLogger('library')
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
 
-# Khởi tạo Bcrypt
-bcrypt = Bcrypt(app)
-
 # Kết nối MongoDB
 mongo_uri = os.getenv('MONGO_URI', 'mongodb://localhost:27017/library_db')
-connect(db='library_db', host=mongo_uri)
+# Cấu hình pool: xem mongo_pool.py; các listener đo thời gian DB cho Server-Timing, /metrics và trace
+connect(db='library_db', host=mongo_uri,
+        **mongo_pool.connect_kwargs(listeners=[request_timing.command_timer, metrics.command_listener,
+                                               tracing.mongo_listener]))
 
 # Cấu hình Cache
 config = {
@@ -34,6 +57,19 @@ config = {
 app.config.from_mapping(config)
 cache = Cache(app)
 
+# Request ID cho log (header X-Request-ID)
+log_setup.init_app(app)
+# Profile một request khi có header X-Profile: 1 (xem profiling.py)
+profiling.init_app(app)
+# Header Server-Timing cho mọi response (auth, cache, db, serialize)
+request_timing.init_app(app)
+# Metrics dạng Prometheus tại /metrics
+metrics.init_app(app)
+# Trace từng request khi TRACING_ENABLED=1 (xem tracing.py)
+tracing.init_app(app)
+# 503 khi pool bcrypt quá tải (xem password_hashing.py)
+password_hashing.init_app(app)
+
 # Cấu hình Swagger (Cập nhật cho V1 & V2)
 swagger_template = {
     "swagger": "2.0",
@@ -65,13 +101,25 @@ class User(db.Document):
     username = db.StringField(required=True, unique=True)
     password = db.StringField(required=True)
     roles = db.ListField(db.StringField(), default=['user'])
-    meta = {'collection': 'users'}
+    meta = {
+        'collection': 'users',
+        'auto_create_index': False,  # Index được tạo một lần lúc khởi động (query_plans.ensure_indexes)
+        # Index unique trên username được tạo từ unique=True
+    }
 
+    # Hàm băm mật khẩu (chạy trên pool bcrypt, xem password_hashing.py)
     def hash_password(self):
-        self.password = bcrypt.generate_password_hash(self.password).decode('utf-8')
+        self.password = password_hashing.hasher.hash(self.password)
 
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.password, password)
+        if not password_hashing.hasher.check(self.password, password):
+            return False
+        # Hash cũ với cost khác BCRYPT_LOG_ROUNDS: băm lại trong nền, không làm chậm lần đăng nhập này
+        old_hash = self.password
+        password_hashing.hasher.rehash_in_background(
+            old_hash, password,
+            lambda new_hash: User.objects(id=self.id, password=old_hash).update(set__password=new_hash))
+        return True
 
     def to_dict(self):
         return {'id': str(self.id), 'username': self.username, 'roles': self.roles}
@@ -81,10 +129,33 @@ class Book(db.Document):
     title = db.StringField(required=True)
     author = db.StringField(required=True)
     quantity = db.IntField(default=0)
-    meta = {'collection': 'books'}
+    stock_shards = db.IntField(default=0)  # > 0: sách nóng, tồn kho nằm ở StockShard (xem stock_shards.py)
+    seed_hash = db.StringField()  # Hash dòng fixture đã seed sách này (seed.py), None với sách thêm qua API
+    meta = {
+        'collection': 'books',
+        'auto_create_index': False,
+        # Sắp xếp cố định để phân trang skip/limit ổn định, đi theo index bên dưới
+        'ordering': ['title', 'author'],
+        'indexes': [
+            ('title', 'author'),  # Sắp xếp danh sách + khóa tự nhiên khi import/upsert
+        ]
+    }
 
     def to_dict(self):
-        return {'id': str(self.id), 'title': self.title, 'author': self.author, 'quantity': self.quantity}
+        return {'id': str(self.id), 'title': self.title, 'author': self.author, 'quantity': stock.total(self)}
+
+
+class StockShard(db.Document):
+    id = db.StringField(primary_key=True)  # '<book_id>:<số thứ tự shard>'
+    book_id = db.StringField(required=True)
+    count = db.IntField(default=0)
+    meta = {
+        'collection': 'book_stock_shards',
+        'auto_create_index': False,
+        'indexes': [
+            'book_id',  # Cộng các shard của một quyển
+        ]
+    }
 
 
 class BorrowRecord(db.Document):
@@ -95,7 +166,15 @@ class BorrowRecord(db.Document):
     borrow_date = db.DateTimeField(default=datetime.utcnow)
     returned = db.BooleanField(default=False)
     return_date = db.DateTimeField(null=True)
-    meta = {'collection': 'borrow_records'}
+    meta = {
+        'collection': 'borrow_records',
+        'auto_create_index': False,
+        'indexes': [
+            ('user_id', '-borrow_date', '-id'),  # Lịch sử mượn của một user, phân trang bằng cursor
+            ('user_id', 'returned', '-borrow_date', '-id'),  # Lịch sử lọc theo đã trả/chưa trả
+            ('book_id', 'returned'),  # Các phiếu đang mượn của một quyển sách
+        ]
+    }
 
     def to_dict(self):
         return {
@@ -110,6 +189,68 @@ class BorrowRecord(db.Document):
         }
 
 
+class RefreshToken(db.Document):
+    # _id là SHA-256 của refresh token, không lưu token gốc (xem auth_tokens.py)
+    id = db.StringField(primary_key=True)
+    user_id = db.StringField(required=True)
+    family = db.StringField(required=True)  # Các token xoay vòng từ cùng một lần đăng nhập
+    expires_at = db.DateTimeField(required=True)
+    used = db.BooleanField(default=False)
+    meta = {
+        'collection': 'refresh_tokens',
+        'auto_create_index': False,
+        'indexes': [
+            {'fields': ['expires_at'], 'expireAfterSeconds': 0},  # TTL: MongoDB tự xóa token hết hạn
+            'family',  # Thu hồi cả phiên khi phát hiện token bị dùng lại
+        ]
+    }
+
+
+class RevokedToken(db.Document):
+    id = db.StringField(primary_key=True)  # jti của access token
+    expires_at = db.DateTimeField(required=True)
+    revoked_at = db.DateTimeField(required=True)
+    meta = {
+        'collection': 'revoked_tokens',
+        'auto_create_index': False,
+        'indexes': [
+            {'fields': ['expires_at'], 'expireAfterSeconds': 0},  # TTL: bản ghi hết tác dụng cùng lúc với token
+            'revoked_at',  # Các process khác đọc bản ghi mới theo chu kỳ (token_revocation.py)
+        ]
+    }
+
+
+# --- INDEX & KIỂM TRA QUERY PLAN LÚC KHỞI ĐỘNG ---
+# Các truy vấn nóng mà route sử dụng; MONGO_INDEX_CHECK=strict sẽ dừng app nếu có COLLSCAN
+_PROBE_ID = '000000000000000000000000'
+HOT_QUERIES = {
+    'books.list_page': lambda: Book.objects().skip(0).limit(5),
+    'users.by_username': lambda: User.objects(username='_probe_'),
+    'borrow_records.by_user': lambda: BorrowRecord.objects(
+        user_id=_PROBE_ID).order_by('-borrow_date', '-id').limit(21),
+    'borrow_records.active_by_user': lambda: BorrowRecord.objects(
+        user_id=_PROBE_ID, returned=False).order_by('-borrow_date', '-id').limit(21),
+    'borrow_records.active_by_book': lambda: BorrowRecord.objects(book_id=_PROBE_ID, returned=False),
+    'refresh_tokens.by_family': lambda: RefreshToken.objects(family='_probe_'),
+    'revoked_tokens.since': lambda: RevokedToken.objects(revoked_at__gte=datetime.utcnow()),
+    'book_stock_shards.by_book': lambda: StockShard.objects(book_id=_PROBE_ID),
+}
+query_plans.ensure_indexes(User, Book, StockShard, BorrowRecord, RefreshToken, RevokedToken)
+query_plans.verify_hot_queries(HOT_QUERIES)
+
+# jti bị thu hồi: Bloom filter trong bộ nhớ trước collection revoked_tokens
+revocations = token_revocation.RevocationList(RevokedToken)
+revocations.start()
+
+# Mượn/trả bằng giảm/tăng có điều kiện, sách nóng chia tồn kho thành nhiều shard (đặt qua appV7.py,
+# PUT /api/admin/books/<book_id>/stock-shards; hai app dùng chung collection)
+stock = stock_shards.ShardedStock(Book, StockShard)
+
+# BORROW_WRITE_BEHIND=on: phiếu mượn ghi vào journal cục bộ, insert_many theo batch (xem write_behind.py)
+borrow_writer = write_behind.WriteBehindWriter(BorrowRecord, 'borrow_records')
+borrow_writer.start()
+
+
 # ======================================================================
 # --- SECTION 4: DECORATORS (Hàm hỗ trợ) ---
 # (Giữ nguyên từ V7)
@@ -119,12 +260,17 @@ def token_required(f):
     def decorated(*args, **kwargs):
         token = request.headers.get('x-access-token')
         if not token: return jsonify({'message': 'Token is missing!'}), 401
-        try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS26"])
-            current_user = User.objects(id=data['user_id']).first()
-            if not current_user: return jsonify({'message': 'User not found!'}), 401
-        except Exception as e:
-            return jsonify({'message': 'Token is invalid!', 'error': str(e)}), 401
+        with request_timing.phase('auth'):  # Thời gian giải mã token + tìm user
+            try:
+                data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
+                # Token chưa bị thu hồi (đa số) chỉ tốn một lần tra Bloom filter, không I/O
+                if revocations.is_revoked(data.get('jti')):
+                    return jsonify({'message': 'Token has been revoked!'}), 401
+                g.token_claims = data
+                current_user = User.objects(id=data['user_id']).first()
+                if not current_user: return jsonify({'message': 'User not found!'}), 401
+            except Exception as e:
+                return jsonify({'message': 'Token is invalid!', 'error': str(e)}), 401
         return f(current_user, *args, **kwargs)
 
     return decorated
@@ -159,9 +305,7 @@ def register_v1():
       201: {description: Đăng ký thành công.}
       400: {description: Tên đăng nhập đã tồn tại.}
     """
-    data = request.json
-    if not data or not data.get('username') or not data.get('password'):
-        return jsonify({'message': 'Missing username or password'}), 400
+    data = request.json  # Đã kiểm tra theo schema Register (request_validation.py)
     if User.objects(username=data.get('username')).first():
         return jsonify({'message': 'Username already exists'}), 400
     new_user = User(username=data.get('username'), password=data.get('password'))
@@ -189,18 +333,14 @@ def login_v1():
     user = User.objects(username=data.get('username')).first()
     if not user or not user.check_password(data.get('password')):
         return jsonify({'message': 'Could not verify, invalid credentials'}), 401
-    token = jwt.encode({
-        'user_id': str(user.id),
-        'username': user.username,
-        'roles': user.roles,
-        'exp': datetime.now(timezone.utc) + timedelta(minutes=60)
-    }, app.config['SECRET_KEY'], algorithm="HS26")
+    # Vẫn sống 60 phút và không có refresh token như cũ; có jti để /api/v2/logout thu hồi được
+    token = auth_tokens.encode_access_token(user, app.config['SECRET_KEY'], minutes=60)
     return jsonify({'token': token})
 
 
 @v1_bp.route('/books', methods=['GET'])
 @token_required
-@cache.cached(timeout=60, query_string=True)
+@request_timing.timed_cached(cache, timeout=60, query_string=True)
 def get_all_books_v1(current_user):
     """
     Lấy danh sách sách (V1 - DEPRECATED)
@@ -229,7 +369,7 @@ def get_all_books_v1(current_user):
     responses:
       200: {description: Danh sách sách (Cấu trúc V1).}
     """
-    print("LOG: V1 - Fetching books from data source (not cache)...")
+    log.info('V1 - Fetching books from data source (not cache)', extra={'event': 'cache_miss', 'api_version': 'v1'})
     try:
         title_query = request.args.get('title', type=str)
         author_query = request.args.get('author', type=str)
@@ -245,19 +385,22 @@ def get_all_books_v1(current_user):
         if page < 1: page = 1
         skip_count = (page - 1) * limit
         books_list = query.skip(skip_count).limit(limit)
-        paginated_data = [book.to_dict() for book in books_list]
 
         # --- Cấu trúc Response V1 (Cũ) ---
-        return jsonify({
-            'message': 'Books retrieved successfully',
-            'data': paginated_data,
-            'pagination': {
-                'currentPage': page,
-                'limit': limit,
-                'totalItems': total_items,
-                'totalPages': total_pages
-            }
-        })
+        with request_timing.phase('serialize'):  # to_dict + jsonify
+            with tracing.span('to_dict'):
+                paginated_data = [book.to_dict() for book in books_list]
+            with tracing.span('jsonify'):
+                return jsonify({
+                    'message': 'Books retrieved successfully',
+                    'data': paginated_data,
+                    'pagination': {
+                        'currentPage': page,
+                        'limit': limit,
+                        'totalItems': total_items,
+                        'totalPages': total_pages
+                    }
+                })
 
     except Exception as e:
         return jsonify({'message': 'An internal error occurred', 'error': str(e)}), 500
@@ -267,17 +410,53 @@ def get_all_books_v1(current_user):
 @token_required
 def get_my_borrow_records_v1(current_user):
     """
-    Lấy lịch sử mượn (V1)
+    Lấy lịch sử mượn (V1, phân trang)
     ---
     tags: [Borrowing V1]
     security:
       - APIKeyHeader: []
+    parameters:
+      - name: status
+        in: query
+        type: string
+        enum: [all, active, returned]
+        default: all
+        description: active = chưa trả, returned = đã trả.
+      - name: from
+        in: query
+        type: string
+        format: date-time
+        description: Mượn từ thời điểm này (ISO 8601, UTC).
+      - name: to
+        in: query
+        type: string
+        format: date-time
+        description: Mượn trước thời điểm này (không bao gồm).
+      - name: limit
+        in: query
+        type: integer
+        default: 20
+        description: Số phiếu mỗi trang (tối đa 100).
+      - name: cursor
+        in: query
+        type: string
+        description: pagination.next_cursor của trang trước.
     responses:
-      200: {description: Danh sách phiếu mượn.}
+      200: {description: "Danh sách phiếu mượn và pagination {limit, next_cursor, total}."}
+      400: {description: Tham số lọc/phân trang không hợp lệ.}
     """
-    records = BorrowRecord.objects(user_id=str(current_user.id))
-    my_records_data = [r.to_dict() for r in records]
-    return jsonify({'records': my_records_data})
+    try:
+        options = borrow_history.parse_args(request.args)
+    except borrow_history.InvalidQuery as e:
+        return jsonify({'message': str(e)}), 400
+    user_id = str(current_user.id)
+    # Cursor trên index (user_id, borrow_date, _id), gộp cả phiếu chưa flush (xem borrow_history.py)
+    result = borrow_history.page(BorrowRecord, user_id, options, borrow_writer.pending(user_id=user_id))
+    with request_timing.phase('serialize'):
+        with tracing.span('to_dict'):
+            my_records_data = [r.to_dict() for r in result['records']]
+        with tracing.span('jsonify'):
+            return jsonify({'records': my_records_data, 'pagination': result['pagination']})
 
 
 @v1_bp.route('/borrow-records', methods=['POST'])
@@ -304,14 +483,14 @@ def borrow_book_v1(current_user):
         book = Book.objects(id=book_id).first()
     except (DoesNotExist, ValidationError):
         return jsonify({'error': 'Book ID không hợp lệ'}), 400
-    if not book or book.quantity <= 0:
+    if not book or not stock.claim(book):
         return jsonify({'error': 'Sách không tồn tại hoặc đã hết'}), 404
-    book.update(dec__quantity=1)
     cache.clear()
-    print("LOG: V1 Cache cleared.")
+    log.info('V1 Cache cleared', extra={'event': 'cache_clear', 'api_version': 'v1'})
     new_record = BorrowRecord(user_id=str(current_user.id), username=current_user.username, book_id=str(book.id),
                               book_title=book.title)
-    new_record.save()
+    borrow_writer.save(new_record)
+    metrics.borrows.inc()
     return jsonify({'message': f"Mượn sách '{book.title}' thành công", 'record': new_record.to_dict()}), 201
 
 
@@ -335,16 +514,16 @@ def return_book_v1(current_user, record_id):
       404: {description: Không tìm thấy phiếu.}
     """
     try:
-        record = BorrowRecord.objects(id=record_id).first()
+        borrow_writer.ensure_flushed(record_id)
+        record, returned_now = stock.return_record(BorrowRecord, record_id, current_user.id)
     except (DoesNotExist, ValidationError):
         return jsonify({'error': 'Phiếu mượn không hợp lệ'}), 400
     if not record: return jsonify({'error': 'Không tìm thấy phiếu mượn'}), 404
     if record.user_id != str(current_user.id): return jsonify({'error': 'Không có quyền trả phiếu này'}), 403
-    if record.returned: return jsonify({'message': 'Sách này đã được trả từ trước'}), 200
+    if not returned_now: return jsonify({'message': 'Sách này đã được trả từ trước'}), 200
     cache.clear()
-    print("LOG: V1 Cache cleared.")
-    Book.objects(id=record.book_id).update(inc__quantity=1)
-    record.update(returned=True, return_date=datetime.utcnow())
+    log.info('V1 Cache cleared', extra={'event': 'cache_clear', 'api_version': 'v1'})
+    metrics.returns.inc()
     return jsonify({'message': f"Trả sách '{record.book_title}' thành công"}), 200
 
 
@@ -370,16 +549,14 @@ def register_v2():
           id: Register  # Tái sử dụng schema từ Swagger
           required: [username, password]
           properties:
-            username: {type: string}
-            password: {type: string}
+            username: {type: string, minLength: 1}
+            password: {type: string, minLength: 1}
     responses:
       201: {description: Đăng ký thành công.}
       400: {description: Tên đăng nhập đã tồn tại.}
     """
     # Logic không đổi so với V1
-    data = request.json
-    if not data or not data.get('username') or not data.get('password'):
-        return jsonify({'message': 'Missing username or password'}), 400
+    data = request.json  # Đã kiểm tra theo schema Register (request_validation.py)
     if User.objects(username=data.get('username')).first():
         return jsonify({'message': 'Username already exists'}), 400
     new_user = User(username=data.get('username'), password=data.get('password'))
@@ -402,29 +579,85 @@ def login_v2():
           id: Login # Tái sử dụng schema
           required: [username, password]
           properties:
-            username: {type: string}
-            password: {type: string}
+            username: {type: string, minLength: 1}
+            password: {type: string, minLength: 1}
     responses:
-      200: {description: Đăng nhập thành công.}
+      200: {description: Đăng nhập thành công, trả về access token (ngắn hạn) và refresh token.}
       401: {description: Sai thông tin.}
     """
-    # Logic không đổi so với V1
+    # V2: access token ngắn hạn + refresh token (V1 giữ token 60 phút như cũ)
     data = request.json
     user = User.objects(username=data.get('username')).first()
     if not user or not user.check_password(data.get('password')):
         return jsonify({'message': 'Could not verify, invalid credentials'}), 401
-    token = jwt.encode({
-        'user_id': str(user.id),
-        'username': user.username,
-        'roles': user.roles,
-        'exp': datetime.now(timezone.utc) + timedelta(minutes=60)
-    }, app.config['SECRET_KEY'], algorithm="HS26")
-    return jsonify({'token': token})
+    refresh_token = auth_tokens.issue_refresh_token(RefreshToken, user.id)
+    return jsonify(auth_tokens.token_pair(user, app.config['SECRET_KEY'], refresh_token))
+
+
+@v2_bp.route('/token/refresh', methods=['POST'])
+def refresh_access_token_v2():
+    """
+    Đổi refresh token lấy access token mới (V2)
+    Không cần mật khẩu. Mỗi refresh token chỉ dùng được một lần, response có refresh token mới.
+    ---
+    tags: [Authentication V2]
+    parameters:
+      - name: body
+        in: body
+        required: true
+        schema:
+          id: Refresh
+          required: [refresh_token]
+          properties:
+            refresh_token: {type: string, minLength: 1}
+    responses:
+      200: {description: Cặp access token + refresh token mới.}
+      401: {description: Refresh token không hợp lệ, hết hạn hoặc đã bị dùng.}
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        user_id, refresh_token = auth_tokens.rotate_refresh_token(RefreshToken, data.get('refresh_token'))
+    except auth_tokens.InvalidRefreshToken as e:
+        return jsonify({'message': str(e)}), 401
+    user = User.objects(id=user_id).first()
+    if not user: return jsonify({'message': 'User not found!'}), 401
+    return jsonify(auth_tokens.token_pair(user, app.config['SECRET_KEY'], refresh_token))
+
+
+@v2_bp.route('/logout', methods=['POST'])
+@token_required
+def logout_v2(current_user):
+    """
+    Đăng xuất (V2)
+    Thu hồi access token đang dùng (tới khi nó hết hạn) và phiên của refresh token nếu gửi kèm.
+    ---
+    tags: [Authentication V2]
+    security:
+      - APIKeyHeader: []
+    parameters:
+      - name: body
+        in: body
+        required: false
+        schema:
+          properties:
+            refresh_token: {type: string, description: Refresh token của phiên cần thu hồi}
+    responses:
+      200: {description: Đăng xuất thành công.}
+      400: {description: Token cấp trước khi có jti, không thu hồi được.}
+      401: {description: Token không hợp lệ hoặc bị thiếu.}
+    """
+    claims = g.token_claims
+    if not claims.get('jti'):
+        return jsonify({'message': 'Token cannot be revoked (no jti), please log in again'}), 400
+    revocations.revoke(claims.get('jti'), datetime.utcfromtimestamp(claims['exp']))
+    data = request.get_json(silent=True) or {}
+    auth_tokens.revoke_refresh_token(RefreshToken, data.get('refresh_token'), current_user.id)
+    return jsonify({'message': 'Logged out successfully'})
 
 
 @v2_bp.route('/books', methods=['GET'])
 @token_required
-@cache.cached(timeout=60, query_string=True)
+@request_timing.timed_cached(cache, timeout=60, query_string=True)
 def get_all_books_v2(current_user):
     """
     Lấy danh sách sách (V2 - Hiện hành)
@@ -453,7 +686,7 @@ def get_all_books_v2(current_user):
     responses:
       200: {description: Danh sách sách (Cấu trúc V2).}
     """
-    print("LOG: V2 - Fetching books from data source (not cache)...")
+    log.info('V2 - Fetching books from data source (not cache)', extra={'event': 'cache_miss', 'api_version': 'v2'})
     try:
         # Logic lấy data y hệt V1
         title_query = request.args.get('title', type=str)
@@ -470,22 +703,25 @@ def get_all_books_v2(current_user):
         if page < 1: page = 1
         skip_count = (page - 1) * limit
         books_list = query.skip(skip_count).limit(limit)
-        paginated_data = [book.to_dict() for book in books_list]
 
         # --- *** BREAKING CHANGE *** ---
         # Cấu trúc Response V2 (Mới)
-        return jsonify({
-            'data': paginated_data,
-            'meta': {
-                'message': 'Books retrieved successfully',
-                'pagination': {
-                    'currentPage': page,
-                    'limit': limit,
-                    'totalItems': total_items,
-                    'totalPages': total_pages
-                }
-            }
-        })
+        with request_timing.phase('serialize'):  # to_dict + jsonify
+            with tracing.span('to_dict'):
+                paginated_data = [book.to_dict() for book in books_list]
+            with tracing.span('jsonify'):
+                return jsonify({
+                    'data': paginated_data,
+                    'meta': {
+                        'message': 'Books retrieved successfully',
+                        'pagination': {
+                            'currentPage': page,
+                            'limit': limit,
+                            'totalItems': total_items,
+                            'totalPages': total_pages
+                        }
+                    }
+                })
         # ---------------------------------
 
     except Exception as e:
@@ -496,18 +732,53 @@ def get_all_books_v2(current_user):
 @token_required
 def get_my_borrow_records_v2(current_user):
     """
-    Lấy lịch sử mượn (V2)
+    Lấy lịch sử mượn (V2, phân trang)
     ---
     tags: [Borrowing V2]
     security:
       - APIKeyHeader: []
+    parameters:
+      - name: status
+        in: query
+        type: string
+        enum: [all, active, returned]
+        default: all
+        description: active = chưa trả, returned = đã trả.
+      - name: from
+        in: query
+        type: string
+        format: date-time
+        description: Mượn từ thời điểm này (ISO 8601, UTC).
+      - name: to
+        in: query
+        type: string
+        format: date-time
+        description: Mượn trước thời điểm này (không bao gồm).
+      - name: limit
+        in: query
+        type: integer
+        default: 20
+        description: Số phiếu mỗi trang (tối đa 100).
+      - name: cursor
+        in: query
+        type: string
+        description: pagination.next_cursor của trang trước.
     responses:
-      200: {description: Danh sách phiếu mượn.}
+      200: {description: "Danh sách phiếu mượn và pagination {limit, next_cursor, total}."}
+      400: {description: Tham số lọc/phân trang không hợp lệ.}
     """
-    # Logic không đổi so với V1
-    records = BorrowRecord.objects(user_id=str(current_user.id))
-    my_records_data = [r.to_dict() for r in records]
-    return jsonify({'records': my_records_data})
+    try:
+        options = borrow_history.parse_args(request.args)
+    except borrow_history.InvalidQuery as e:
+        return jsonify({'message': str(e)}), 400
+    user_id = str(current_user.id)
+    # Cursor trên index (user_id, borrow_date, _id), gộp cả phiếu chưa flush (xem borrow_history.py)
+    result = borrow_history.page(BorrowRecord, user_id, options, borrow_writer.pending(user_id=user_id))
+    with request_timing.phase('serialize'):
+        with tracing.span('to_dict'):
+            my_records_data = [r.to_dict() for r in result['records']]
+        with tracing.span('jsonify'):
+            return jsonify({'records': my_records_data, 'pagination': result['pagination']})
 
 
 @v2_bp.route('/borrow-records', methods=['POST'])
@@ -527,7 +798,7 @@ def borrow_book_v2(current_user):
           id: Borrow # Tái sử dụng schema
           required: [book_id]
           properties:
-            book_id: {type: string}
+            book_id: {type: string, pattern: '^[0-9a-fA-F]{24}$'}
     responses:
       201: {description: Mượn thành công.}
       404: {description: Sách không tồn tại/đã hết.}
@@ -539,14 +810,14 @@ def borrow_book_v2(current_user):
         book = Book.objects(id=book_id).first()
     except (DoesNotExist, ValidationError):
         return jsonify({'error': 'Book ID không hợp lệ'}), 400
-    if not book or book.quantity <= 0:
+    if not book or not stock.claim(book):
         return jsonify({'error': 'Sách không tồn tại hoặc đã hết'}), 404
-    book.update(dec__quantity=1)
     cache.clear()
-    print("LOG: V2 Cache cleared.")
+    log.info('V2 Cache cleared', extra={'event': 'cache_clear', 'api_version': 'v2'})
     new_record = BorrowRecord(user_id=str(current_user.id), username=current_user.username, book_id=str(book.id),
                               book_title=book.title)
-    new_record.save()
+    borrow_writer.save(new_record)
+    metrics.borrows.inc()
     return jsonify({'message': f"Mượn sách '{book.title}' thành công", 'record': new_record.to_dict()}), 201
 
 
@@ -571,19 +842,130 @@ def return_book_v2(current_user, record_id):
     """
     # Logic không đổi so với V1
     try:
-        record = BorrowRecord.objects(id=record_id).first()
+        borrow_writer.ensure_flushed(record_id)
+        record, returned_now = stock.return_record(BorrowRecord, record_id, current_user.id)
     except (DoesNotExist, ValidationError):
         return jsonify({'error': 'Phiếu mượn không hợp lệ'}), 400
     if not record: return jsonify({'error': 'Không tìm thấy phiếu mượn'}), 404
     if record.user_id != str(current_user.id): return jsonify({'error': 'Không có quyền trả phiếu này'}), 403
-    if record.returned: return jsonify({'message': 'Sách này đã được trả từ trước'}), 200
+    if not returned_now: return jsonify({'message': 'Sách này đã được trả từ trước'}), 200
     cache.clear()
-    print("LOG: V2 Cache cleared.")
-    Book.objects(id=record.book_id).update(inc__quantity=1)
-    record.update(returned=True, return_date=datetime.utcnow())
+    log.info('V2 Cache cleared', extra={'event': 'cache_clear', 'api_version': 'v2'})
+    metrics.returns.inc()
     return jsonify({'message': f"Trả sách '{record.book_title}' thành công"}), 200
 
 
+@v2_bp.route('/books/import', methods=['POST'])
+@token_required
+def import_books_v2(current_user):
+    """
+    Nhập sách hàng loạt từ CSV hoặc NDJSON (V2, chỉ admin)
+    File được đọc theo stream và ghi theo batch (upsert theo title + author).
+    Gửi file trong body (Content-Type text/csv hoặc application/x-ndjson) hoặc multipart field 'file'.
+    ---
+    tags: [Books V2]
+    security:
+      - APIKeyHeader: []
+    consumes: [text/csv, application/x-ndjson, multipart/form-data]
+    parameters:
+      - name: format
+        in: query
+        type: string
+        enum: [csv, ndjson]
+        description: Định dạng file, mặc định đoán theo Content-Type.
+      - name: batch_size
+        in: query
+        type: integer
+        default: 500
+        description: Số dòng mỗi lần ghi xuống DB.
+      - name: mode
+        in: query
+        type: string
+        enum: [upsert, insert]
+        default: upsert
+    responses:
+      200: {description: Report gồm số dòng, rows_per_second và lỗi từng dòng.}
+      400: {description: Định dạng/mode không hỗ trợ, hoặc file không đọc được (kèm report).}
+      403: {description: Không phải admin.}
+    """
+    if 'admin' not in current_user.roles:
+        return jsonify({'error': 'Chỉ admin được nhập sách'}), 403
+
+    upload = request.files.get('file')
+    if upload:
+        raw_stream, filename, content_type = upload.stream, upload.filename, upload.mimetype
+    else:
+        raw_stream, filename, content_type = request.stream, None, request.mimetype
+
+    fmt = request.args.get('format') or book_import.detect_format(filename, content_type)
+    if fmt not in book_import.SUPPORTED_FORMATS:
+        return jsonify({'error': f"Định dạng không hỗ trợ: {fmt}"}), 400
+    batch_size = request.args.get('batch_size', book_import.DEFAULT_BATCH_SIZE, type=int)
+    mode = request.args.get('mode', 'upsert')
+    if mode not in ('upsert', 'insert'):
+        return jsonify({'error': f"mode không hỗ trợ: {mode} (upsert hoặc insert)"}), 400
+
+    stream = io.TextIOWrapper(raw_stream, encoding='utf-8-sig', newline='')
+    report = book_import.import_books(stream, Book._get_collection(), fmt, batch_size, upsert=mode == 'upsert')
+
+    if report['inserted'] or report['updated']:
+        cache.clear()
+    log.info('V2 Imported %s rows (%s rows/s), %s failed', report['rows'], report['rows_per_second'], report['failed'],
+             extra={'event': 'books_import', 'api_version': 'v2'})
+    if report['aborted']:
+        return jsonify({'data': report, 'meta': {'message': report['aborted']}}), 400
+    return jsonify({'data': report, 'meta': {'message': 'Import finished'}}), 200
+
+
+@v2_bp.route('/admin/db-pool', methods=['GET'])
+@token_required
+def get_db_pool_stats_v2(current_user):
+    """
+    Số liệu connection pool MongoDB của process hiện tại (V2, chỉ admin)
+    ---
+    tags: [Admin V2]
+    security:
+      - APIKeyHeader: []
+    responses:
+      200: {description: Số liệu pool.}
+      403: {description: Không phải admin.}
+    """
+    if 'admin' not in current_user.roles:
+        return jsonify({'error': 'Chỉ admin được xem số liệu pool'}), 403
+    return jsonify({'data': mongo_pool.pool_stats.snapshot(), 'meta': {'settings': mongo_pool.pool_settings()}})
+
+
+@v2_bp.route('/admin/traces', methods=['GET'])
+@token_required
+def get_traces_v2(current_user):
+    """
+    Xem các span gần nhất trong bộ nhớ (V2, chỉ admin, cần TRACING_ENABLED=1)
+    ---
+    tags: [Admin V2]
+    security:
+      - APIKeyHeader: []
+    parameters:
+      - name: trace_id
+        in: query
+        type: string
+      - name: limit
+        in: query
+        type: integer
+        default: 200
+    responses:
+      200: {description: Danh sách span.}
+      403: {description: Không phải admin.}
+    """
+    if 'admin' not in current_user.roles:
+        return jsonify({'error': 'Chỉ admin được xem trace'}), 403
+    sink = tracing.exporter.sink
+    if not isinstance(sink, tracing.MemorySink):
+        return jsonify({'error': 'Trace đang được ghi ra file, không lưu trong bộ nhớ'}), 400
+    tracing.exporter.flush()
+    limit = request.args.get('limit', 200, type=int)
+    return jsonify({'data': sink.spans(request.args.get('trace_id'), limit), 'meta': {}})
+
+
 # ======================================================================
 # --- SECTION 7: REGISTER BLUEPRINTS & RUN APP (Chạy ứng dụng) ---
 # ======================================================================
@@ -597,41 +979,22 @@ def index():
 # --- ĐĂNG KÝ CÁC BLUEPRINT VỚI FLASK APP ---
 app.register_blueprint(v1_bp)  # Đăng ký V1
 app.register_blueprint(v2_bp)  # Đăng ký V2
+app.register_blueprint(memdiag.create_blueprint('memdiag_v2', '/api/v2/admin/memory', token_required, {
+    'flask_cache': lambda: memdiag.simple_cache_stats(cache),
+    'trace_spans': lambda: memdiag.container_stats(tracing.buffered_spans()),
+    'metrics_series': lambda: memdiag.container_stats(metrics.registry.series()),
+    'token_revocation': revocations.stats,
+    'stock_shards': stock.stats,
+    'borrow_journal': borrow_writer.stats,
+}))  # Chẩn đoán bộ nhớ (chỉ admin)
+
+# API_SPEC_MODE=static: spec và schema lấy từ file build sẵn, không parse docstring (xem api_spec.py)
+api_spec_data = api_spec.init_app(app, swagger, __file__)
+# Kiểm tra body theo schema Swagger của từng route (biên dịch một lần, sau khi mọi blueprint đã đăng ký)
+request_validation.init_app(app, api_spec_data)
 
 # ---------------------------------------------
 
 if __name__ == '__main__':
-    # --- KHỐI THÊM DỮ LIỆU MẪU (SEEDING) ---
-    # Chỉ chạy khi chạy file trực tiếp
-    if Book.objects.count() == 0:
-        print("Database rỗng. Thêm 20 sách mẫu...")
-        sample_books_data = [
-            {'title': 'Lão Hạc', 'author': 'Nam Cao', 'quantity': 5},
-            {'title': 'Số Đỏ', 'author': 'Vũ Trọng Phụng', 'quantity': 3},
-            {'title': 'Dế Mèn Phiêu Lưu Ký', 'author': 'Tô Hoài', 'quantity': 10},
-            {'title': 'Nhà Giả Kim', 'author': 'Paulo Coelho', 'quantity': 8},
-            {'title': 'Đắc Nhân Tâm', 'author': 'Dale Carnegie', 'quantity': 15},
-            {'title': 'Harry Potter và Hòn Đá Phù Thủy', 'author': 'J.K. Rowling', 'quantity': 7},
-            {'title': 'Tắt Đèn', 'author': 'Ngô Tất Tố', 'quantity': 2},
-            {'title': 'Chiến Tranh và Hòa Bình', 'author': 'Leo Tolstoy', 'quantity': 4},
-            {'title': 'Bố Già', 'author': 'Mario Puzo', 'quantity': 5},
-            {'title': 'Những Người Khốn Khổ', 'author': 'Victor Hugo', 'quantity': 3},
-            {'title': 'Tôi Thấy Hoa Vàng Trên Cỏ Xanh', 'author': 'Nguyễn Nhật Ánh', 'quantity': 12},
-            {'title': 'Hai Số Phận', 'author': 'Jeffrey Archer', 'quantity': 6},
-            {'title': 'Mắt Biếc', 'author': 'Nguyễn Nhật Ánh', 'quantity': 9},
-            {'title': 'Giết Con Chim Nhại', 'author': 'Harper Lee', 'quantity': 4},
-            {'title': 'Rừng Na Uy', 'author': 'Haruki Murakami', 'quantity': 7},
-            {'title': '1984', 'author': 'George Orwell', 'quantity': 5},
-            {'title': 'Ông Già và Biển Cả', 'author': 'Ernest Hemingway', 'quantity': 3},
-            {'title': 'Hoàng Tử Bé', 'author': 'Antoine de Saint-Exupéry', 'quantity': 10},
-            {'title': 'Trăm Năm Cô Đơn', 'author': 'Gabriel Garcia Marquez', 'quantity': 2},
-            {'title': 'Chí Phèo', 'author': 'Nam Cao', 'quantity': 5}
-        ]
-        books_to_insert = [Book(**data) for data in sample_books_data]
-        Book.objects.insert(books_to_insert)
-        print(f"Đã thêm thành công {len(books_to_insert)} sách.")
-    else:
-        print("Database đã có dữ liệu sách. Bỏ qua seeding.")
-    # ----------------------------------------
-
-    app.run(debug=True)
\ No newline at end of file
+    # Dữ liệu mẫu không seed lúc khởi động nữa, chạy riêng một lần: python seed.py
+    app.run(debug=True)
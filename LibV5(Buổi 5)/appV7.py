@@ -1,9 +1,8 @@
-from flask import Flask, jsonify, request, render_template
-from datetime import datetime, timedelta, timezone
+from flask import Flask, Blueprint, current_app, jsonify, request, render_template, g
+from datetime import datetime
 import jwt
+import logging
 from functools import wraps
-from flasgger import Swagger
-from flask_bcrypt import Bcrypt
 from flask_caching import Cache # Import Cache
 import os
 from dotenv import load_dotenv
@@ -11,14 +10,28 @@ import mongoengine as db
 from mongoengine import connect
 from mongoengine.errors import DoesNotExist, ValidationError
 
-load_dotenv()
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
-
-bcrypt = Bcrypt(app)
-# GỌI KẾT NỐI TRỰC TIẾP
-mongo_uri = os.getenv('MONGO_URI', 'mongodb://localhost:27017/library_db')
-connect(db='library_db', host=mongo_uri)
+import api_spec
+import auth_tokens
+import borrow_history
+import log_setup
+import memdiag
+import metrics
+import mongo_pool
+import password_hashing
+import profiling
+import query_plans
+import request_timing
+import request_validation
+import stock_shards
+import token_revocation
+import tracing
+import write_behind
+
+log = logging.getLogger('library')
+
+# Route khai báo trên blueprint, app được tạo trong create_app(): import module này không kết nối
+# MongoDB, không nạp flasgger, không chạy thread nền (worker khởi động và test nhanh hơn)
+api_bp = Blueprint('api', __name__)
 
 # --- CẤU HÌNH CACHE ---
 # Cấu hình để sử dụng cache đơn giản, lưu trong bộ nhớ.
@@ -27,8 +40,7 @@ config = {
     "CACHE_TYPE": "SimpleCache",
     "CACHE_DEFAULT_TIMEOUT": 300  # Cache mặc định 5 phút
 }
-app.config.from_mapping(config)
-cache = Cache(app) # Khởi tạo đối tượng cache
+cache = Cache() # Gắn vào app trong create_app()
 
 
 # --- CẤU HÌNH SWAGGER ---
@@ -51,22 +63,32 @@ swagger_template = {
         }
     }
 }
-swagger = Swagger(app, template=swagger_template)
 
 
 class User(db.Document):
     username = db.StringField(required=True, unique=True)
     password = db.StringField(required=True)
     roles = db.ListField(db.StringField(), default=['user'])
-    meta = {'collection': 'users'}
+    meta = {
+        'collection': 'users',
+        'auto_create_index': False,  # Index được tạo một lần lúc khởi động (query_plans.ensure_indexes)
+        # Index unique trên username được tạo từ unique=True
+    }
 
-    # Hàm băm mật khẩu
+    # Hàm băm mật khẩu (chạy trên pool bcrypt, xem password_hashing.py)
     def hash_password(self):
-        self.password = bcrypt.generate_password_hash(self.password).decode('utf-8')
+        self.password = password_hashing.hasher.hash(self.password)
 
     # Hàm kiểm tra mật khẩu
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.password, password)
+        if not password_hashing.hasher.check(self.password, password):
+            return False
+        # Hash cũ với cost khác BCRYPT_LOG_ROUNDS: băm lại trong nền, không làm chậm lần đăng nhập này
+        old_hash = self.password
+        password_hashing.hasher.rehash_in_background(
+            old_hash, password,
+            lambda new_hash: User.objects(id=self.id, password=old_hash).update(set__password=new_hash))
+        return True
 
     def to_dict(self):
         return {
@@ -79,16 +101,38 @@ class Book(db.Document):
     title = db.StringField(required=True)
     author = db.StringField(required=True)
     quantity = db.IntField(default=0)
-    meta = {'collection': 'books'}
+    stock_shards = db.IntField(default=0)  # > 0: sách nóng, tồn kho nằm ở StockShard (xem stock_shards.py)
+    seed_hash = db.StringField()  # Hash dòng fixture đã seed sách này (seed.py), None với sách thêm qua API
+    meta = {
+        'collection': 'books',
+        'auto_create_index': False,
+        # Sắp xếp cố định để phân trang skip/limit ổn định, đi theo index bên dưới
+        'ordering': ['title', 'author'],
+        'indexes': [
+            ('title', 'author'),  # Sắp xếp danh sách + khóa tự nhiên khi import/upsert
+        ]
+    }
 
     def to_dict(self):
         return {
             'id': str(self.id),
             'title': self.title,
             'author': self.author,
-            'quantity': self.quantity
+            'quantity': stock.total(self)
         }
 
+class StockShard(db.Document):
+    id = db.StringField(primary_key=True)  # '<book_id>:<số thứ tự shard>'
+    book_id = db.StringField(required=True)
+    count = db.IntField(default=0)
+    meta = {
+        'collection': 'book_stock_shards',
+        'auto_create_index': False,
+        'indexes': [
+            'book_id',  # Cộng các shard của một quyển
+        ]
+    }
+
 class BorrowRecord(db.Document):
     user_id = db.StringField(required=True)
     username = db.StringField(required=True)
@@ -97,7 +141,15 @@ class BorrowRecord(db.Document):
     borrow_date = db.DateTimeField(default=datetime.utcnow)
     returned = db.BooleanField(default=False)
     return_date = db.DateTimeField(null=True)
-    meta = {'collection': 'borrow_records'}
+    meta = {
+        'collection': 'borrow_records',
+        'auto_create_index': False,
+        'indexes': [
+            ('user_id', '-borrow_date', '-id'),  # Lịch sử mượn của một user, phân trang bằng cursor
+            ('user_id', 'returned', '-borrow_date', '-id'),  # Lịch sử lọc theo đã trả/chưa trả
+            ('book_id', 'returned'),  # Các phiếu đang mượn của một quyển sách
+        ]
+    }
 
     def to_dict(self):
         return {
@@ -111,23 +163,82 @@ class BorrowRecord(db.Document):
             'return_date': self.return_date.isoformat() + 'Z' if self.return_date else None
         }
 
+class RefreshToken(db.Document):
+    # _id là SHA-256 của refresh token, không lưu token gốc (xem auth_tokens.py)
+    id = db.StringField(primary_key=True)
+    user_id = db.StringField(required=True)
+    family = db.StringField(required=True)  # Các token xoay vòng từ cùng một lần đăng nhập
+    expires_at = db.DateTimeField(required=True)
+    used = db.BooleanField(default=False)
+    meta = {
+        'collection': 'refresh_tokens',
+        'auto_create_index': False,
+        'indexes': [
+            {'fields': ['expires_at'], 'expireAfterSeconds': 0},  # TTL: MongoDB tự xóa token hết hạn
+            'family',  # Thu hồi cả phiên khi phát hiện token bị dùng lại
+        ]
+    }
+
+class RevokedToken(db.Document):
+    id = db.StringField(primary_key=True)  # jti của access token
+    expires_at = db.DateTimeField(required=True)
+    revoked_at = db.DateTimeField(required=True)
+    meta = {
+        'collection': 'revoked_tokens',
+        'auto_create_index': False,
+        'indexes': [
+            {'fields': ['expires_at'], 'expireAfterSeconds': 0},  # TTL: bản ghi hết tác dụng cùng lúc với token
+            'revoked_at',  # Các process khác đọc bản ghi mới theo chu kỳ (token_revocation.py)
+        ]
+    }
+
+# --- INDEX & KIỂM TRA QUERY PLAN LÚC KHỞI ĐỘNG ---
+# Các truy vấn nóng mà route sử dụng; MONGO_INDEX_CHECK=strict sẽ dừng app nếu có COLLSCAN
+_PROBE_ID = '000000000000000000000000'
+HOT_QUERIES = {
+    'books.list_page': lambda: Book.objects().skip(0).limit(5),
+    'users.by_username': lambda: User.objects(username='_probe_'),
+    'borrow_records.by_user': lambda: BorrowRecord.objects(
+        user_id=_PROBE_ID).order_by('-borrow_date', '-id').limit(21),
+    'borrow_records.active_by_user': lambda: BorrowRecord.objects(
+        user_id=_PROBE_ID, returned=False).order_by('-borrow_date', '-id').limit(21),
+    'borrow_records.active_by_book': lambda: BorrowRecord.objects(book_id=_PROBE_ID, returned=False),
+    'refresh_tokens.by_family': lambda: RefreshToken.objects(family='_probe_'),
+    'revoked_tokens.since': lambda: RevokedToken.objects(revoked_at__gte=datetime.utcnow()),
+    'book_stock_shards.by_book': lambda: StockShard.objects(book_id=_PROBE_ID),
+}
+
+# Mượn/trả bằng giảm/tăng có điều kiện, sách nóng chia tồn kho thành nhiều shard
+stock = stock_shards.ShardedStock(Book, StockShard)
+
+# BORROW_WRITE_BEHIND=on: phiếu mượn ghi vào journal cục bộ, insert_many theo batch (xem write_behind.py)
+borrow_writer = write_behind.WriteBehindWriter(BorrowRecord, 'borrow_records')
+
+# jti bị thu hồi: Bloom filter trong bộ nhớ trước collection revoked_tokens (nạp trong create_app)
+revocations = token_revocation.RevocationList(RevokedToken)
+
 # Decorator
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
         token = request.headers.get('x-access-token')
         if not token: return jsonify({'message': 'Token is missing!'}), 401
-        try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-            current_user = User.objects(id = data['user_id']).first()
-            if not current_user: return jsonify({'message': 'User not found!'}), 401
-        except Exception as e:
-            return jsonify({'message': 'Token is invalid!', 'error': str(e)}), 401
+        with request_timing.phase('auth'):  # Thời gian giải mã token + tìm user
+            try:
+                data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
+                # Token chưa bị thu hồi (đa số) chỉ tốn một lần tra Bloom filter, không I/O
+                if revocations.is_revoked(data.get('jti')):
+                    return jsonify({'message': 'Token has been revoked!'}), 401
+                g.token_claims = data
+                current_user = User.objects(id = data['user_id']).first()
+                if not current_user: return jsonify({'message': 'User not found!'}), 401
+            except Exception as e:
+                return jsonify({'message': 'Token is invalid!', 'error': str(e)}), 401
         return f(current_user, *args, **kwargs)
     return decorated
 
 # ---ENDPOINT ĐĂNG KÝ ---
-@app.route('/api/register', methods=['POST'])
+@api_bp.route('/api/register', methods=['POST'])
 def register():
     """
     Đăng ký một người dùng mới
@@ -142,15 +253,13 @@ def register():
           id: Register
           required: [username, password]
           properties:
-            username: {type: string, description: Tên đăng nhập mong muốn}
-            password: {type: string, description: Mật khẩu}
+            username: {type: string, minLength: 1, description: Tên đăng nhập mong muốn}
+            password: {type: string, minLength: 1, description: Mật khẩu}
     responses:
       201: {description: Đăng ký thành công.}
       400: {description: Tên đăng nhập đã tồn tại.}
     """
-    data = request.json
-    if not data or not data.get('username') or not data.get('password'):
-        return jsonify({'message': 'Missing username or password'}), 400
+    data = request.json  # Đã kiểm tra theo schema Register (request_validation.py)
 
     if User.objects(username=data.get('username')).first():
         return jsonify({'message': 'Username already exists'}), 400
@@ -166,7 +275,7 @@ def register():
 
 # === API Routes với tài liệu Swagger ===
 
-@app.route('/api/login', methods=['POST'])
+@api_bp.route('/api/login', methods=['POST'])
 def login():
     """
     Đăng nhập và nhận JWT Token
@@ -181,30 +290,84 @@ def login():
           id: Login
           required: [username, password]
           properties:
-            username: {type: string, description: Tên đăng nhập, default: "user_one"}
-            password: {type: string, description: Mật khẩu, default: "password1"}
+            username: {type: string, minLength: 1, description: Tên đăng nhập, default: "user_one"}
+            password: {type: string, minLength: 1, description: Mật khẩu, default: "password1"}
     responses:
-      200: {description: Đăng nhập thành công, trả về token.}
+      200: {description: Đăng nhập thành công, trả về access token (ngắn hạn) và refresh token.}
       401: {description: Sai thông tin đăng nhập.}
     """
     data = request.json
     user = User.objects(username=data.get('username')).first() # Tìm user trong DB
     if not user or not user.check_password(data.get('password')):
         return jsonify({'message': 'Could not verify, invalid credentials'}), 401
-    token = jwt.encode({
-        'user_id': str(user.id), # Chuyển ObjectId thành string
-        'username': user.username,
-        'roles': user.roles, # Thêm roles vào token
-        'exp': datetime.now(timezone.utc) + timedelta(minutes=60)
-    }, app.config['SECRET_KEY'], algorithm="HS256")
-    return jsonify({'token': token})
+    refresh_token = auth_tokens.issue_refresh_token(RefreshToken, user.id)
+    return jsonify(auth_tokens.token_pair(user, current_app.config['SECRET_KEY'], refresh_token))
+
+@api_bp.route('/api/token/refresh', methods=['POST'])
+def refresh_access_token():
+    """
+    Đổi refresh token lấy access token mới
+    Không cần mật khẩu. Mỗi refresh token chỉ dùng được một lần, response có refresh token mới.
+    ---
+    tags: [Authentication]
+    parameters:
+      - name: body
+        in: body
+        required: true
+        schema:
+          id: Refresh
+          required: [refresh_token]
+          properties:
+            refresh_token: {type: string, minLength: 1, description: Refresh token nhận từ /login hoặc lần refresh trước}
+    responses:
+      200: {description: Cặp access token + refresh token mới.}
+      401: {description: Refresh token không hợp lệ, hết hạn hoặc đã bị dùng.}
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        user_id, refresh_token = auth_tokens.rotate_refresh_token(RefreshToken, data.get('refresh_token'))
+    except auth_tokens.InvalidRefreshToken as e:
+        return jsonify({'message': str(e)}), 401
+    user = User.objects(id=user_id).first()
+    if not user: return jsonify({'message': 'User not found!'}), 401
+    return jsonify(auth_tokens.token_pair(user, current_app.config['SECRET_KEY'], refresh_token))
+
+@api_bp.route('/api/logout', methods=['POST'])
+@token_required
+def logout(current_user):
+    """
+    Đăng xuất
+    Thu hồi access token đang dùng (tới khi nó hết hạn) và phiên của refresh token nếu gửi kèm.
+    ---
+    tags: [Authentication]
+    security:
+      - APIKeyHeader: []
+    parameters:
+      - name: body
+        in: body
+        required: false
+        schema:
+          properties:
+            refresh_token: {type: string, description: Refresh token của phiên cần thu hồi}
+    responses:
+      200: {description: Đăng xuất thành công.}
+      400: {description: Token cấp trước khi có jti, không thu hồi được.}
+      401: {description: Token không hợp lệ hoặc bị thiếu.}
+    """
+    claims = g.token_claims
+    if not claims.get('jti'):
+        return jsonify({'message': 'Token cannot be revoked (no jti), please log in again'}), 400
+    revocations.revoke(claims.get('jti'), datetime.utcfromtimestamp(claims['exp']))
+    data = request.get_json(silent=True) or {}
+    auth_tokens.revoke_refresh_token(RefreshToken, data.get('refresh_token'), current_user.id)
+    return jsonify({'message': 'Logged out successfully'})
 
 
-@app.route('/api/books', methods=['GET'])
+@api_bp.route('/api/books', methods=['GET'])
 @token_required
 # Cache sẽ tự động hoạt động với các tham số query khác nhau
 # Tức là /api/books?page=1 và /api/books?page=2 sẽ được cache riêng biệt
-@cache.cached(timeout=60, query_string=True)
+@request_timing.timed_cached(cache, timeout=60, query_string=True)
 def get_all_books(current_user):
     """
     Lấy danh sách sách, hỗ trợ tìm kiếm và phân trang (ĐÃ ĐƯỢC CACHE)
@@ -245,7 +408,7 @@ def get_all_books(current_user):
       401:
         description: Token không hợp lệ hoặc bị thiếu.
     """
-    print("LOG: Fetching books from data source (not cache)...")
+    log.info('Fetching books from data source (not cache)', extra={'event': 'cache_miss'})
 
     # --- Lấy các tham số từ query string ---
     try:
@@ -274,45 +437,84 @@ def get_all_books(current_user):
 
         # 4. Lấy dữ liệu của trang đó
         books_list = query.skip(skip_count).limit(limit)
-        paginated_data = [book.to_dict() for book in books_list]
         # -----------------------------------------------
 
         # Đảm bảo hàm LUÔN LUÔN trả về response này
-        return jsonify({
-            'message': 'Books retrieved successfully',
-            'data': paginated_data,
-            'pagination': {
-                'currentPage': page,
-                'limit': limit,
-                'totalItems': total_items,
-                'totalPages': total_pages
-            }
-        })
+        with request_timing.phase('serialize'):  # to_dict + jsonify
+            with tracing.span('to_dict'):
+                paginated_data = [book.to_dict() for book in books_list]
+            with tracing.span('jsonify'):
+                return jsonify({
+                    'message': 'Books retrieved successfully',
+                    'data': paginated_data,
+                    'pagination': {
+                        'currentPage': page,
+                        'limit': limit,
+                        'totalItems': total_items,
+                        'totalPages': total_pages
+                    }
+                })
 
     except Exception as e:
         # Bắt các lỗi khác nếu có
-        print(f"Error in get_all_books: {e}")
+        log.exception('Error in get_all_books')
         return jsonify({'message': 'An internal error occurred', 'error': str(e)}), 500
 
-@app.route('/api/borrow-records', methods=['GET'])
+@api_bp.route('/api/borrow-records', methods=['GET'])
 @token_required
 def get_my_borrow_records(current_user):
     """
-    Lấy lịch sử mượn sách của người dùng đã đăng nhập
+    Lấy lịch sử mượn sách của người dùng đã đăng nhập (phân trang)
+    Mới nhất trước. Trang sau: gửi lại cùng filter kèm cursor = pagination.next_cursor.
     ---
     tags: [Borrowing]
     security:
       - APIKeyHeader: []
+    parameters:
+      - name: status
+        in: query
+        type: string
+        enum: [all, active, returned]
+        default: all
+        description: active = chưa trả, returned = đã trả.
+      - name: from
+        in: query
+        type: string
+        format: date-time
+        description: Mượn từ thời điểm này (ISO 8601, UTC).
+      - name: to
+        in: query
+        type: string
+        format: date-time
+        description: Mượn trước thời điểm này (không bao gồm).
+      - name: limit
+        in: query
+        type: integer
+        default: 20
+        description: Số phiếu mỗi trang (tối đa 100).
+      - name: cursor
+        in: query
+        type: string
+        description: pagination.next_cursor của trang trước.
     responses:
-      200: {description: Danh sách các phiếu mượn của bạn.}
+      200: {description: "Phiếu mượn của bạn và pagination {limit, next_cursor, total}; total chỉ có ở trang đầu."}
+      400: {description: Tham số lọc/phân trang không hợp lệ.}
       401: {description: Token không hợp lệ hoặc bị thiếu.}
     """
-    # Tìm các phiếu mượn của user (dùng ID từ token) trong DB
-    records = BorrowRecord.objects(user_id=str(current_user.id))
-    my_records_data = [r.to_dict() for r in records]
-    return jsonify({'records': my_records_data})
-
-@app.route('/api/borrow-records', methods=['POST'])
+    try:
+        options = borrow_history.parse_args(request.args)
+    except borrow_history.InvalidQuery as e:
+        return jsonify({'message': str(e)}), 400
+    user_id = str(current_user.id)
+    # Cursor trên index (user_id, borrow_date, _id), gộp cả phiếu chưa flush (xem borrow_history.py)
+    result = borrow_history.page(BorrowRecord, user_id, options, borrow_writer.pending(user_id=user_id))
+    with request_timing.phase('serialize'):
+        with tracing.span('to_dict'):
+            my_records_data = [r.to_dict() for r in result['records']]
+        with tracing.span('jsonify'):
+            return jsonify({'records': my_records_data, 'pagination': result['pagination']})
+
+@api_bp.route('/api/borrow-records', methods=['POST'])
 @token_required
 def borrow_book(current_user):
     """
@@ -330,7 +532,7 @@ def borrow_book(current_user):
           id: Borrow
           required: [book_id]
           properties:
-            book_id: {type: string, description: ID của sách muốn mượn.}
+            book_id: {type: string, pattern: '^[0-9a-fA-F]{24}$', description: ID của sách muốn mượn.}
     responses:
       201: {description: Mượn sách thành công.}
       404: {description: Sách không tồn tại hoặc đã hết.}
@@ -343,15 +545,13 @@ def borrow_book(current_user):
     except (DoesNotExist, ValidationError):
         return jsonify({'error': 'Book ID không hợp lệ'}), 400
 
-    if not book or book.quantity <= 0:
+    # Giảm số lượng sách (atomic, chỉ khi còn sách)
+    if not book or not stock.claim(book):
         return jsonify({'error': 'Sách không tồn tại hoặc đã hết'}), 404
 
-    # Giảm số lượng sách (atomic)
-    book.update(dec__quantity=1)
-
     # XÓA CACHE (Giữ nguyên)
     cache.clear()
-    print("LOG: Book list cache cleared due to borrowing.")
+    log.info('Book list cache cleared due to borrowing', extra={'event': 'cache_clear', 'book_id': str(book.id)})
 
     # Tạo phiếu mượn mới trong DB
     new_record = BorrowRecord(
@@ -360,7 +560,8 @@ def borrow_book(current_user):
         book_id=str(book.id),
         book_title=book.title
     )
-    new_record.save()
+    borrow_writer.save(new_record)
+    metrics.borrows.inc()
 
     return jsonify({
         'message': f"User '{current_user.username}' mượn sách '{book.title}' thành công",
@@ -368,7 +569,7 @@ def borrow_book(current_user):
     }), 201
 
 
-@app.route('/api/borrow-records/<string:record_id>', methods=['PUT'])
+@api_bp.route('/api/borrow-records/<string:record_id>', methods=['PUT'])
 @token_required
 def return_book(current_user, record_id):
     """
@@ -390,7 +591,9 @@ def return_book(current_user, record_id):
       404: {description: Không tìm thấy phiếu mượn.}
     """
     try:
-        record = BorrowRecord.objects(id=record_id).first()
+        borrow_writer.ensure_flushed(record_id)
+        # Đánh dấu đã trả (có điều kiện) rồi mới tăng lại số lượng sách, xem stock_shards.return_record
+        record, returned_now = stock.return_record(BorrowRecord, record_id, current_user.id)
     except (DoesNotExist, ValidationError):
         return jsonify({'error': 'Phiếu mượn không hợp lệ'}), 400
 
@@ -401,63 +604,187 @@ def return_book(current_user, record_id):
     if record.user_id != str(current_user.id):
         return jsonify({'error': 'Bạn không có quyền trả phiếu mượn này'}), 403
 
-    if record.returned:
+    if not returned_now:
         return jsonify({'message': 'Sách này đã được trả từ trước'}), 200
 
         # XÓA CACHE
     cache.clear()
-    print("LOG: Book list cache cleared due to returning.")
+    log.info('Book list cache cleared due to returning', extra={'event': 'cache_clear', 'book_id': record.book_id})
+    metrics.returns.inc()
 
-    # Tăng lại số lượng sách (atomic)
-    Book.objects(id=record.book_id).update(inc__quantity=1)
+    return jsonify({'message': f"Trả sách '{record.book_title}' thành công"}), 200
 
-    # Cập nhật phiếu mượn là đã trả
-    record.update(returned=True, return_date=datetime.utcnow())
+@api_bp.route('/api/admin/db-pool', methods=['GET'])
+@token_required
+def get_db_pool_stats(current_user):
+    """
+    Số liệu connection pool MongoDB của process hiện tại (chỉ admin)
+    Gồm thời gian lấy kết nối, số lần pool cạn, số kết nối tạo/đóng.
+    ---
+    tags: [Admin]
+    security:
+      - APIKeyHeader: []
+    responses:
+      200: {description: Số liệu pool.}
+      403: {description: Không phải admin.}
+    """
+    if 'admin' not in current_user.roles:
+        return jsonify({'error': 'Chỉ admin được xem số liệu pool'}), 403
+    return jsonify({'pool': mongo_pool.pool_stats.snapshot(), 'settings': mongo_pool.pool_settings()})
 
-    return jsonify({'message': f"Trả sách '{record.book_title}' thành công"}), 200
+@api_bp.route('/api/admin/books/<string:book_id>/stock-shards', methods=['PUT'])
+@token_required
+def set_book_stock_shards(current_user, book_id):
+    """
+    Chia tồn kho của một quyển sách nóng thành nhiều shard (chỉ admin)
+    Mượn/trả quyển này ghi vào các shard khác nhau thay vì cùng một document. shards = 0 để tắt.
+    ---
+    tags: [Admin]
+    security:
+      - APIKeyHeader: []
+    parameters:
+      - name: book_id
+        in: path
+        type: string
+        required: true
+      - name: body
+        in: body
+        required: true
+        schema:
+          id: StockShards
+          required: [shards]
+          properties:
+            shards: {type: integer, description: Số shard (0 - 64).}
+    responses:
+      200: {description: Đã chia lại tồn kho.}
+      400: {description: Số shard không hợp lệ.}
+      403: {description: Không phải admin.}
+      404: {description: Không tìm thấy sách.}
+      409: {description: Quyển này đang được reshard bởi request khác.}
+    """
+    if 'admin' not in current_user.roles:
+        return jsonify({'error': 'Chỉ admin được đổi shard tồn kho'}), 403
+    shards = request.json['shards']
+    if not 0 <= shards <= 64:
+        return jsonify({'error': 'shards phải trong khoảng 0 - 64'}), 400
+    try:
+        if not Book.objects(id=book_id).only('id').first():
+            return jsonify({'error': 'Không tìm thấy sách'}), 404
+    except ValidationError:
+        return jsonify({'error': 'Book ID không hợp lệ'}), 400
+    try:
+        quantity = stock.reshard(book_id, shards)
+    except stock_shards.ReshardInProgress as e:
+        return jsonify({'error': str(e)}), 409
+    cache.clear()
+    log.info('Book stock resharded', extra={'event': 'stock_reshard', 'book_id': book_id, 'shards': shards})
+    return jsonify({'book_id': book_id, 'stock_shards': shards, 'quantity': quantity})
 
-@app.route('/')
+@api_bp.route('/api/admin/traces', methods=['GET'])
+@token_required
+def get_traces(current_user):
+    """
+    Xem các span gần nhất trong bộ nhớ (chỉ admin, cần TRACING_ENABLED=1)
+    ---
+    tags: [Admin]
+    security:
+      - APIKeyHeader: []
+    parameters:
+      - name: trace_id
+        in: query
+        type: string
+        required: false
+        description: Lấy header traceparent của response, phần thứ 2.
+      - name: limit
+        in: query
+        type: integer
+        default: 200
+    responses:
+      200: {description: Danh sách span.}
+      403: {description: Không phải admin.}
+    """
+    if 'admin' not in current_user.roles:
+        return jsonify({'error': 'Chỉ admin được xem trace'}), 403
+    sink = tracing.exporter.sink
+    if not isinstance(sink, tracing.MemorySink):
+        return jsonify({'error': 'Trace đang được ghi ra file, không lưu trong bộ nhớ'}), 400
+    tracing.exporter.flush()
+    limit = request.args.get('limit', 200, type=int)
+    return jsonify({'spans': sink.spans(request.args.get('trace_id'), limit)})
+
+@api_bp.route('/')
 def index():
     return render_template('index2.html')
 
-if __name__ == '__main__':
-    # --- KHỐI THÊM DỮ LIỆU MẪU (SEEDING) ---
-    print("Clearing old book data...")
-    Book.objects.delete()  # Xóa sạch tất cả sách cũ để tránh trùng lặp
-
-    print("Adding 20 sample books to database...")
-
-    # Dữ liệu 20 cuốn sách
-    sample_books_data = [
-        {'title': 'Lão Hạc', 'author': 'Nam Cao', 'quantity': 5},
-        {'title': 'Số Đỏ', 'author': 'Vũ Trọng Phụng', 'quantity': 3},
-        {'title': 'Dế Mèn Phiêu Lưu Ký', 'author': 'Tô Hoài', 'quantity': 10},
-        {'title': 'Nhà Giả Kim', 'author': 'Paulo Coelho', 'quantity': 8},
-        {'title': 'Đắc Nhân Tâm', 'author': 'Dale Carnegie', 'quantity': 15},
-        {'title': 'Harry Potter và Hòn Đá Phù Thủy', 'author': 'J.K. Rowling', 'quantity': 7},
-        {'title': 'Tắt Đèn', 'author': 'Ngô Tất Tố', 'quantity': 2},
-        {'title': 'Chiến Tranh và Hòa Bình', 'author': 'Leo Tolstoy', 'quantity': 4},
-        {'title': 'Bố Già', 'author': 'Mario Puzo', 'quantity': 5},
-        {'title': 'Những Người Khốn Khổ', 'author': 'Victor Hugo', 'quantity': 3},
-        {'title': 'Tôi Thấy Hoa Vàng Trên Cỏ Xanh', 'author': 'Nguyễn Nhật Ánh', 'quantity': 12},
-        {'title': 'Hai Số Phận', 'author': 'Jeffrey Archer', 'quantity': 6},
-        {'title': 'Mắt Biếc', 'author': 'Nguyễn Nhật Ánh', 'quantity': 9},
-        {'title': 'Giết Con Chim Nhại', 'author': 'Harper Lee', 'quantity': 4},
-        {'title': 'Rừng Na Uy', 'author': 'Haruki Murakami', 'quantity': 7},
-        {'title': '1984', 'author': 'George Orwell', 'quantity': 5},
-        {'title': 'Ông Già và Biển Cả', 'author': 'Ernest Hemingway', 'quantity': 3},
-        {'title': 'Hoàng Tử Bé', 'author': 'Antoine de Saint-Exupéry', 'quantity': 10},
-        {'title': 'Trăm Năm Cô Đơn', 'author': 'Gabriel Garcia Marquez', 'quantity': 2},
-        {'title': 'Chí Phèo', 'author': 'Nam Cao', 'quantity': 5}
-    ]
-
-    # Tạo các đối tượng Book từ data
-    books_to_insert = [Book(**data) for data in sample_books_data]
-
-    # Thêm hàng loạt vào DB (nhanh hơn là save() 20 lần)
-    Book.objects.insert(books_to_insert)
-
-    print(f"Successfully added {len(books_to_insert)} books.")
-    # ----------------------------------------
 
+# --- APP FACTORY ---
+def create_app():
+    """
+    Tạo app: kết nối MongoDB, gắn các hook, tạo index, đăng ký route.
+
+        flask --app appV7 run
+        gunicorn "appV7:create_app()"
+
+    API_DOCS=off bỏ hẳn flasgger (import ~0.1s); dùng kèm API_SPEC_MODE=static để vẫn có /apispec_1.json.
+    """
+    load_dotenv()
+    # Log JSON qua queue, ghi bởi thread nền (xem log_setup.py)
+    log_setup.configure()
+
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
+    app.config.from_mapping(config)
+
+    # GỌI KẾT NỐI TRỰC TIẾP
+    mongo_uri = os.getenv('MONGO_URI', 'mongodb://localhost:27017/library_db')
+    # Cấu hình pool: xem mongo_pool.py; các listener đo thời gian DB cho Server-Timing, /metrics và trace
+    connect(db='library_db', host=mongo_uri,
+            **mongo_pool.connect_kwargs(listeners=[request_timing.command_timer, metrics.command_listener,
+                                                   tracing.mongo_listener]))
+    cache.init_app(app)
+
+    # Request ID cho log (header X-Request-ID)
+    log_setup.init_app(app)
+    # Profile một request khi có header X-Profile: 1 (xem profiling.py)
+    profiling.init_app(app)
+    # Header Server-Timing cho mọi response (auth, cache, db, serialize)
+    request_timing.init_app(app)
+    # Metrics dạng Prometheus tại /metrics
+    metrics.init_app(app)
+    # Trace từng request khi TRACING_ENABLED=1 (xem tracing.py)
+    tracing.init_app(app)
+    # 503 khi pool bcrypt quá tải (xem password_hashing.py)
+    password_hashing.init_app(app)
+
+    swagger = None
+    if os.getenv('API_DOCS', 'on').lower() != 'off':
+        from flasgger import Swagger  # Chỉ nạp khi bật tài liệu API
+        swagger = Swagger(app, template=swagger_template)
+
+    # Tạo index + kiểm tra query plan của HOT_QUERIES
+    query_plans.ensure_indexes(User, Book, StockShard, BorrowRecord, RefreshToken, RevokedToken)
+    query_plans.verify_hot_queries(HOT_QUERIES)
+    revocations.start()
+    borrow_writer.start()
+
+    app.register_blueprint(api_bp)
+    # --- CHẨN ĐOÁN BỘ NHỚ (chỉ admin) ---
+    app.register_blueprint(memdiag.create_blueprint('memdiag', '/api/admin/memory', token_required, {
+        'flask_cache': lambda: memdiag.simple_cache_stats(cache),
+        'trace_spans': lambda: memdiag.container_stats(tracing.buffered_spans()),
+        'metrics_series': lambda: memdiag.container_stats(metrics.registry.series()),
+        'token_revocation': revocations.stats,
+        'stock_shards': stock.stats,
+        'borrow_journal': borrow_writer.stats,
+    }))
+
+    # API_SPEC_MODE=static: spec và schema lấy từ file build sẵn, không parse docstring (xem api_spec.py)
+    api_spec_data = api_spec.init_app(app, swagger, __file__)
+    # Kiểm tra body theo schema Swagger của từng route (biên dịch một lần, sau khi mọi route đã đăng ký)
+    request_validation.init_app(app, api_spec_data)
+    return app
+
+if __name__ == '__main__':
+    app = create_app()
+    # Dữ liệu mẫu không seed lúc khởi động nữa, chạy riêng một lần: python seed.py
     app.run(debug=True)
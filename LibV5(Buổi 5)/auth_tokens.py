@@ -0,0 +1,98 @@
+"""
+Access token ngắn hạn + refresh token xoay vòng (rotation).
+
+Đăng nhập (phải chạy bcrypt) trả về một access token JWT sống ACCESS_TOKEN_MINUTES phút
+và một refresh token ngẫu nhiên. Khi access token sắp hết hạn, client gửi refresh token
+tới /token/refresh để nhận cặp token mới; bước này chỉ tốn một lần băm SHA-256 và vài
+lệnh MongoDB theo _id, không băm mật khẩu lại.
+
+    - DB chỉ lưu SHA-256 của refresh token, dùng luôn làm _id (không cần index riêng).
+      Lộ DB không lộ token dùng được.
+    - Mỗi refresh token chỉ dùng được một lần, token mới cùng "family" (một phiên đăng nhập).
+      Token đã dùng mà bị gửi lại (bị đánh cắp, hoặc hai request refresh chạy đua) thì
+      cả family bị thu hồi, người dùng phải đăng nhập lại.
+    - Token hết hạn được MongoDB tự xóa nhờ TTL index trên expires_at.
+
+Biến môi trường:
+    ACCESS_TOKEN_MINUTES   Thời hạn access token, mặc định 15
+    REFRESH_TOKEN_DAYS     Thời hạn mỗi refresh token (tính từ lần cấp/xoay gần nhất), mặc định 30
+"""
+import hashlib
+import logging
+import os
+import secrets
+from datetime import datetime, timedelta, timezone
+
+import jwt
+
+log = logging.getLogger('auth_tokens')
+
+ACCESS_TOKEN_MINUTES = int(os.getenv('ACCESS_TOKEN_MINUTES', 15))
+REFRESH_TOKEN_DAYS = int(os.getenv('REFRESH_TOKEN_DAYS', 30))
+
+
+class InvalidRefreshToken(Exception):
+    """Refresh token không tồn tại, đã hết hạn hoặc đã bị dùng."""
+
+
+def encode_access_token(user, secret_key, minutes=None):
+    return jwt.encode({
+        'user_id': str(user.id),
+        'username': user.username,
+        'roles': user.roles,
+        'jti': secrets.token_urlsafe(12),  # Định danh token để thu hồi khi logout (token_revocation.py)
+        'exp': datetime.now(timezone.utc) + timedelta(minutes=minutes or ACCESS_TOKEN_MINUTES)
+    }, secret_key, algorithm="HS256")
+
+
+def _digest(raw):
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def issue_refresh_token(model, user_id, family=None):
+    """Tạo refresh token mới (family mới nếu không truyền vào); trả về token gốc cho client."""
+    raw = secrets.token_urlsafe(32)
+    model(
+        id=_digest(raw),
+        user_id=str(user_id),
+        family=family or secrets.token_hex(12),
+        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_DAYS)
+    ).save(force_insert=True)
+    return raw
+
+
+def rotate_refresh_token(model, raw):
+    """Đánh dấu refresh token đã dùng và cấp token mới cùng family. Trả về (user_id, token mới)."""
+    if not raw or not isinstance(raw, str):
+        raise InvalidRefreshToken('Refresh token is missing!')
+    token_id = _digest(raw)
+    # find_one_and_update: hai request cùng token chạy đồng thời thì chỉ một request thắng
+    current = model.objects(id=token_id, used=False, expires_at__gt=datetime.utcnow()).modify(set__used=True)
+    if current is None:
+        reused = model.objects(id=token_id, used=True).only('family', 'user_id').first()
+        if reused is not None:
+            model.objects(family=reused.family).delete()
+            log.warning('Refresh token reused for user %s, session revoked', reused.user_id)
+            raise InvalidRefreshToken('Refresh token was already used, please log in again')
+        raise InvalidRefreshToken('Refresh token is invalid or expired')
+    return current.user_id, issue_refresh_token(model, current.user_id, current.family)
+
+
+def revoke_refresh_token(model, raw, user_id):
+    """Thu hồi cả phiên (family) của refresh token nếu nó thuộc user_id; trả về True nếu có thu hồi."""
+    if not raw or not isinstance(raw, str):
+        return False
+    current = model.objects(id=_digest(raw), user_id=str(user_id)).only('family').first()
+    if current is None:
+        return False
+    model.objects(family=current.family).delete()
+    return True
+
+
+def token_pair(user, secret_key, refresh_token):
+    """Body JSON trả về cho /login và /token/refresh."""
+    return {
+        'token': encode_access_token(user, secret_key),
+        'refresh_token': refresh_token,
+        'expires_in': ACCESS_TOKEN_MINUTES * 60
+    }
@@ -0,0 +1,131 @@
+"""
+Benchmark các route chính của appV7.py và appV7 blueprint.py (V1, V2).
+Dữ liệu và cách đo: xem conftest.py.
+"""
+import pytest
+
+from conftest import BOOKS, PASSWORD
+
+TARGETS = [
+    pytest.param(('appV7', '/api'), id='appV7'),
+    pytest.param(('blueprint', '/api/v1'), id='v1'),
+    pytest.param(('blueprint', '/api/v2'), id='v2'),
+]
+
+PAGE_SIZE = 5
+DEEP_PAGE = BOOKS // PAGE_SIZE - 1  # Trang gần cuối: skip gần hết collection
+
+
+@pytest.fixture(params=TARGETS)
+def target(request, apps):
+    app_name, prefix = request.param
+    module = apps[app_name]
+    client = module.app.test_client()
+
+    def login(username):
+        response = client.post(f'{prefix}/login', json={'username': username, 'password': PASSWORD})
+        assert response.status_code == 200, response.get_json()
+        return {'x-access-token': response.get_json()['token']}
+
+    return module, client, prefix, login
+
+
+def _ok(response, status=200):
+    assert response.status_code == status, response.get_data(as_text=True)[:200]
+    return response
+
+
+def _clear_cache(module):
+    """setup cho các benchmark không dùng cache: xóa cache trước mỗi vòng."""
+    def setup():
+        module.cache.clear()
+        return ()
+    return setup
+
+
+def test_login(bench, target):
+    module, client, prefix, _ = target
+    body = {'username': 'bench_reader', 'password': PASSWORD}
+    bench(lambda: _ok(client.post(f'{prefix}/login', json=body)), rounds=10, warmup=1)
+
+
+def test_token_refresh(bench, target):
+    """So với test_login: đổi refresh token không chạy bcrypt."""
+    module, client, prefix, _ = target
+    if prefix == '/api/v1':
+        pytest.skip('V1 không có refresh token')
+    body = {'username': 'bench_reader', 'password': PASSWORD}
+    session = _ok(client.post(f'{prefix}/login', json=body)).get_json()
+
+    def refresh():
+        response = _ok(client.post(f'{prefix}/token/refresh', json={'refresh_token': session['refresh_token']}))
+        session.update(response.get_json())  # Token cũ đã dùng, vòng sau dùng token mới
+
+    bench(refresh)
+
+
+def test_books_cached(bench, target):
+    module, client, prefix, login = target
+    headers = login('bench_reader')
+    url = f'{prefix}/books?page=1&limit={PAGE_SIZE}'
+    _ok(client.get(url, headers=headers))  # Làm nóng cache
+    bench(lambda: _ok(client.get(url, headers=headers)))
+
+
+def test_books_uncached(bench, target):
+    module, client, prefix, login = target
+    headers = login('bench_reader')
+    url = f'{prefix}/books?page=1&limit={PAGE_SIZE}'
+    bench(lambda: _ok(client.get(url, headers=headers)), setup=_clear_cache(module))
+
+
+def test_books_search(bench, target):
+    module, client, prefix, login = target
+    headers = login('bench_reader')
+    url = f'{prefix}/books?title=mắt&author=nguyễn&limit={PAGE_SIZE}'
+    bench(lambda: _ok(client.get(url, headers=headers)), setup=_clear_cache(module))
+
+
+def test_books_deep_page(bench, target):
+    module, client, prefix, login = target
+    headers = login('bench_reader')
+    url = f'{prefix}/books?page={DEEP_PAGE}&limit={PAGE_SIZE}'
+    bench(lambda: _ok(client.get(url, headers=headers)), setup=_clear_cache(module))
+
+
+def test_borrow(bench, target):
+    module, client, prefix, login = target
+    headers = login('bench_borrower')
+    book_id = str(module.Book.objects.first().id)
+    bench(lambda: _ok(client.post(f'{prefix}/borrow-records', json={'book_id': book_id}, headers=headers), 201))
+
+
+def test_return(bench, target):
+    module, client, prefix, login = target
+    headers = login('bench_borrower')
+    user = module.User.objects(username='bench_borrower').first()
+    book = module.Book.objects.first()
+
+    def open_record():
+        record = module.BorrowRecord(user_id=str(user.id), username=user.username, book_id=str(book.id),
+                                     book_title=book.title)
+        record.save()
+        return (str(record.id),)
+
+    bench(lambda record_id: _ok(client.put(f'{prefix}/borrow-records/{record_id}', headers=headers)),
+          setup=open_record)
+
+
+def test_history(bench, target):
+    module, client, prefix, login = target
+    headers = login('bench_reader')
+    bench(lambda: _ok(client.get(f'{prefix}/borrow-records', headers=headers)))
+
+
+def test_history_next_page(bench, target):
+    module, client, prefix, login = target
+    headers = login('bench_reader')
+    first = _ok(client.get(f'{prefix}/borrow-records', headers=headers)).get_json()
+    cursor = first['pagination']['next_cursor']
+    assert cursor, 'Cần hơn một trang lịch sử (HISTORY_RECORDS trong conftest.py)'
+    bench(lambda: _ok(client.get(f'{prefix}/borrow-records', query_string={'cursor': cursor}, headers=headers)))
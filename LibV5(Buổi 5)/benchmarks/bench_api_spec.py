@@ -0,0 +1,38 @@
+"""
+Tải /apispec_1.json: flasgger dựng spec từ docstring (live, DEBUG=True nên dựng lại mỗi lần)
+so với file đã build sẵn (API_SPEC_MODE=static, xem api_spec.py).
+"""
+import pytest
+from flasgger import Swagger
+from flask import Flask
+
+APPS = [pytest.param('appV7', id='appV7'), pytest.param('blueprint', id='blueprint')]
+
+
+def _ok(response, status=200):
+    assert response.status_code == status, response.get_data(as_text=True)[:200]
+    return response
+
+
+@pytest.mark.parametrize('app_name', APPS)
+def test_apispec_live(bench, apps, app_name):
+    client = apps[app_name].app.test_client()
+    bench(lambda: _ok(client.get('/apispec_1.json')), rounds=10, warmup=1)
+
+
+@pytest.mark.parametrize('app_name', APPS)
+def test_apispec_static(bench, apps, app_name, tmp_path, monkeypatch):
+    import api_spec
+    module = apps[app_name]
+    monkeypatch.setattr(api_spec, 'SPEC_DIR', str(tmp_path))
+    monkeypatch.setenv('API_SPEC_MODE', 'static')
+    with open(api_spec.spec_path(module.__file__), 'wb') as f:
+        f.write(api_spec.dump(api_spec.build(module.app)))
+
+    # App riêng chỉ có view spec, để không thay view của app dùng chung trong phiên benchmark
+    app = Flask('apispec_static')
+    api_spec.init_app(app, Swagger(app, template=module.swagger_template), module.__file__)
+    client = app.test_client()
+    etag = _ok(client.get('/apispec_1.json')).headers['ETag']
+    bench(lambda: _ok(client.get('/apispec_1.json')))
+    _ok(client.get('/apispec_1.json', headers={'If-None-Match': etag}), status=304)
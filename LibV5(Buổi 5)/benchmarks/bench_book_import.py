@@ -0,0 +1,62 @@
+"""
+Nhập sách hàng loạt (book_import.py): đọc stream NDJSON, kiểm tra từng dòng, ghi theo batch.
+
+    - test_import_ndjson: ROWS dòng hợp lệ, upsert vào collection riêng (không đụng books
+      mà các benchmark khác đọc).
+    - test_import_bad_rows: dòng có title/author không phải chuỗi bị báo lỗi theo dòng thay vì
+      làm hỏng cả lần import; các dòng hợp lệ cùng batch vẫn được ghi.
+"""
+import io
+import json
+
+import pytest
+
+ROWS = 500  # mongomock upsert chậm, đủ để thấy chi phí mỗi batch
+BATCH_SIZE = 100
+
+
+@pytest.fixture
+def collection(apps):
+    """Collection riêng trên DB giả, làm trống trước mỗi vòng đo."""
+    db = apps['appV7'].Book._get_db()
+    return db['books_import_bench']
+
+
+def _stream(rows):
+    return io.StringIO(''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows))
+
+
+def test_import_ndjson(bench, collection):
+    import book_import
+    rows = [{'title': f'Sách {i}', 'author': f'Tác giả {i % 50}', 'quantity': i % 7} for i in range(ROWS)]
+
+    def setup():
+        collection.drop()
+        return (_stream(rows),)
+
+    report = bench(lambda stream: book_import.import_books(stream, collection, 'ndjson', BATCH_SIZE),
+                   setup=setup, rounds=5, warmup=1)
+    assert report['inserted'] == ROWS and report['failed'] == 0
+
+
+def test_import_bad_rows(bench, collection):
+    import book_import
+    rows = [
+        {'title': 'Lão Hạc', 'author': 'Nam Cao', 'quantity': 2},
+        {'title': 123, 'author': 'Nam Cao'},
+        {'title': 'Số Đỏ', 'author': ['Vũ Trọng Phụng']},
+        {'title': 'Mắt Biếc', 'author': 'Nguyễn Nhật Ánh', 'quantity': 'ba'},
+        {'title': 'Dế Mèn Phiêu Lưu Ký', 'author': 'Tô Hoài', 'quantity': 1},
+    ]
+
+    def setup():
+        collection.drop()
+        return (_stream(rows),)
+
+    report = bench(lambda stream: book_import.import_books(stream, collection, 'ndjson', BATCH_SIZE),
+                   setup=setup, rounds=10, warmup=1)
+    assert report['inserted'] == 2 and report['failed'] == 3 and report['aborted'] is None
+    errors = {e['line']: e['error'] for e in report['errors']}
+    assert errors[2] == "'title' không phải chuỗi: 123"
+    assert errors[3].startswith("'author' không phải chuỗi")
+    assert collection.count_documents({}) == 2
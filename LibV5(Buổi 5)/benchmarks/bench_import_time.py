@@ -0,0 +1,45 @@
+"""
+Ngân sách thời gian import của appV7.py, đo bằng `python -X importtime` trong process mới.
+
+Import module chỉ khai báo model và route; kết nối MongoDB, flasgger, tạo index và các thread
+nền nằm trong create_app(). Flask được import trước nên không tính vào số đo (phần đó app không
+bớt được); các thư viện chỉ dùng khi cần (flasgger, jsonschema, yaml) không được import sớm.
+
+    # Ngân sách mặc định 250ms; máy CI chậm có thể nới ra
+    IMPORT_BUDGET_MS=400 pytest benchmarks -k import
+"""
+import os
+import subprocess
+import sys
+
+from conftest import APP_DIR
+
+IMPORT_BUDGET_MS = float(os.getenv('IMPORT_BUDGET_MS', 250))
+DEFERRED = ('flasgger', 'jsonschema', 'yaml')
+RUNS = 3  # Lấy lần nhanh nhất để bớt nhiễu
+
+
+def import_profile(module, preload='flask'):
+    """{module: thời gian import cumulative (ms)} của mọi module được import khi `import module`."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {preload}; import {module}'],
+        cwd=APP_DIR, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr[-2000:]
+    profile = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        profile[name.strip()] = int(cumulative) / 1000
+    return profile
+
+
+def test_appV7_import_budget():
+    best = min(import_profile('appV7')['appV7'] for _ in range(RUNS))
+    assert best <= IMPORT_BUDGET_MS, f'import appV7 mất {best:.1f}ms, vượt ngân sách {IMPORT_BUDGET_MS:.0f}ms'
+
+
+def test_appV7_defers_optional_imports():
+    profile = import_profile('appV7')
+    loaded = [name for name in DEFERRED if name in profile]
+    assert not loaded, f'import appV7 nạp sớm: {", ".join(loaded)}'
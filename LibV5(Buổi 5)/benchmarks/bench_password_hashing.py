@@ -0,0 +1,38 @@
+"""
+Đánh đổi giữa cost bcrypt và độ trễ đăng nhập khi nhiều người đăng nhập cùng lúc.
+
+Mỗi vòng gửi BURST phép kiểm tra mật khẩu đồng thời qua một PasswordHasher (như BURST
+request /login cùng đến), đo thời gian tới khi phép cuối cùng xong. Cost tăng 1 thì
+thời gian gấp đôi; dùng kết quả này để chọn BCRYPT_LOG_ROUNDS và BCRYPT_WORKERS.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from conftest import PASSWORD
+
+BURST = 8
+
+
+@pytest.fixture(scope='module')
+def password_hashing(apps):
+    import password_hashing
+    return password_hashing
+
+
+@pytest.mark.parametrize('rounds', [4, 8, 10, 12])
+def test_login_burst(bench, password_hashing, rounds):
+    hasher = password_hashing.PasswordHasher(rounds=rounds, workers=os.cpu_count() or 1,
+                                             max_pending=BURST)
+    hashed = hasher.hash(PASSWORD)
+    clients = ThreadPoolExecutor(max_workers=BURST)
+
+    def burst():
+        results = list(clients.map(lambda _: hasher.check(hashed, PASSWORD), range(BURST)))
+        assert all(results)
+
+    try:
+        bench(burst, rounds=3 if rounds >= 12 else 5, warmup=1)
+    finally:
+        clients.shutdown()
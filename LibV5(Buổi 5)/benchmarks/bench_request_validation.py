@@ -0,0 +1,79 @@
+"""
+Chi phí kiểm tra body theo schema Swagger (request_validation.py).
+
+    - test_check_*: một lần gọi validator đã biên dịch so với jsonschema (validator tạo sẵn,
+      và jsonschema.validate tạo validator mỗi lần như khi kiểm tra trong từng view).
+      Mỗi vòng gọi CALLS lần, median chia cho CALLS là chi phí mỗi request.
+    - test_rejected_borrow: request mượn sách có body sai bị trả 400 trước khi decode token/truy vấn DB.
+"""
+import jsonschema
+import pytest
+
+CALLS = 1000
+BODIES = {
+    'login_valid': ('api.login', {'username': 'bench_reader', 'password': 'bench-password'}),
+    'login_invalid': ('api.login', {'username': ''}),
+    'borrow_valid': ('api.borrow_book', {'book_id': '0123456789abcdef01234567'}),
+    'borrow_invalid': ('api.borrow_book', {'book_id': 42}),
+}
+
+
+@pytest.fixture(scope='module')
+def schemas(apps):
+    """Validator đã biên dịch và schema gốc (đã giải $ref) của appV7.py."""
+    import request_validation
+    app = apps['appV7'].app
+    compiled = app.extensions['request_validation']
+    raw = {}
+    for endpoint in ('api.login', 'api.borrow_book'):
+        schema = request_validation._body_parameter(app.view_functions[endpoint])['schema']
+        raw[endpoint] = {k: v for k, v in schema.items() if k != 'id'}
+    return compiled, raw
+
+
+@pytest.mark.parametrize('case', sorted(BODIES))
+def test_check_compiled(bench, schemas, case):
+    compiled, _ = schemas
+    endpoint, body = BODIES[case]
+    check = compiled[endpoint][0]
+    expect_valid = case.endswith('_valid')
+
+    def run():
+        for _ in range(CALLS):
+            errors = check(body)
+        assert (not errors) == expect_valid
+
+    bench(run, rounds=10, warmup=1)
+
+
+@pytest.mark.parametrize('case', sorted(BODIES))
+def test_check_jsonschema_prebuilt(bench, schemas, case):
+    _, raw = schemas
+    endpoint, body = BODIES[case]
+    validator = jsonschema.Draft4Validator(raw[endpoint])
+
+    def run():
+        for _ in range(CALLS):
+            errors = list(validator.iter_errors(body))
+        assert (not errors) == case.endswith('_valid')
+
+    bench(run, rounds=10, warmup=1)
+
+
+@pytest.mark.parametrize('case', ['login_valid', 'borrow_valid'])
+def test_check_jsonschema_per_call(bench, schemas, case):
+    _, raw = schemas
+    endpoint, body = BODIES[case]
+    schema = raw[endpoint]
+    bench(lambda: [jsonschema.validate(body, schema, cls=jsonschema.Draft4Validator) for _ in range(CALLS)],
+          rounds=5, warmup=1)
+
+
+def test_rejected_borrow(bench, apps):
+    client = apps['appV7'].app.test_client()
+
+    def run():
+        response = client.post('/api/borrow-records', json={'book_id': 'not-an-id'})
+        assert response.status_code == 400
+
+    bench(run)
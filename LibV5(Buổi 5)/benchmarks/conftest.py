@@ -0,0 +1,214 @@
+"""
+Benchmark cho API thư viện, chạy trong process qua Flask test client, không cần server hay MongoDB thật.
+
+MongoDB được thay bằng mongomock (cài thêm: pip install -r benchmarks/requirements.txt).
+Cả appV7.py và appV7 blueprint.py dùng chung một DB giả, dữ liệu được seed một lần mỗi phiên.
+
+    # Chạy và so với baseline (lần đầu chưa có baseline thì tự ghi)
+    pytest benchmarks
+
+    # Ghi đè baseline sau một thay đổi có chủ đích
+    pytest benchmarks --bench-save
+
+    # Cho phép chậm hơn baseline tối đa 50%
+    pytest benchmarks --bench-tolerance 0.5
+
+Kết quả lần chạy gần nhất: benchmarks/results/last_run.json. Baseline phụ thuộc máy chạy,
+chỉ so sánh các lần chạy trên cùng một máy.
+"""
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baselines', 'default.json')
+RESULTS_FILE = os.path.join(BENCH_DIR, 'results', 'last_run.json')
+DEFAULT_TOLERANCE = 0.25  # Median được phép chậm hơn baseline tối đa 25%
+
+# Dataset
+BOOKS = 3000
+HISTORY_RECORDS = 50
+PASSWORD = 'bench-password'
+
+_results = {}
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('bench')
+    group.addoption('--bench-baseline', default=DEFAULT_BASELINE, help='File JSON baseline.')
+    group.addoption('--bench-save', action='store_true', help='Ghi kết quả lần chạy này làm baseline.')
+    group.addoption('--bench-tolerance', type=float, default=DEFAULT_TOLERANCE,
+                    help='Tỉ lệ chậm hơn baseline cho phép (0.25 = 25%%).')
+    group.addoption('--bench-rounds', type=int, default=None, help='Ghi đè số vòng đo của mọi benchmark.')
+
+
+# --- MONGO GIẢ & NẠP APP ---
+def _install_mongo_stand_in():
+    import mongoengine
+    import mongomock
+
+    real_connect = mongoengine.connect
+
+    def connect(*args, **kwargs):
+        # Bỏ qua URI/pool/listener của app, mọi app dùng chung một client mongomock
+        return real_connect('library_bench', host='mongodb://localhost', mongo_client_class=mongomock.MongoClient)
+
+    mongoengine.connect = connect
+
+
+def _load_app(module_name, filename):
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(APP_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def _seed(module):
+    Book, User, BorrowRecord = module.Book, module.User, module.BorrowRecord
+    titles = ['Lão Hạc', 'Số Đỏ', 'Mắt Biếc', 'Dế Mèn Phiêu Lưu Ký', 'War and Peace', '1984', 'The Old Man and the Sea']
+    authors = ['Nam Cao', 'Vũ Trọng Phụng', 'Nguyễn Nhật Ánh', 'Tô Hoài', 'Leo Tolstoy', 'George Orwell']
+    Book._get_collection().insert_many([
+        {'title': f'{titles[i % len(titles)]} {i}', 'author': authors[i % len(authors)], 'quantity': 1_000_000}
+        for i in range(BOOKS)
+    ])
+    for username in ('bench_reader', 'bench_borrower'):
+        user = User(username=username, password=PASSWORD)
+        user.hash_password()
+        user.save()
+    reader = User.objects(username='bench_reader').first()
+    book = Book.objects.first()
+    BorrowRecord._get_collection().insert_many([
+        {'user_id': str(reader.id), 'username': reader.username, 'book_id': str(book.id),
+         'book_title': book.title, 'borrow_date': datetime.utcnow(), 'returned': i % 2 == 0}
+        for i in range(HISTORY_RECORDS)
+    ])
+
+
+@pytest.fixture(scope='session')
+def apps():
+    """{'appV7': module, 'blueprint': module} đã trỏ vào DB giả có dữ liệu."""
+    os.environ.setdefault('SECRET_KEY', 'bench-secret-key-that-is-long-enough-for-hs256')
+    os.environ['MONGO_INDEX_CHECK'] = 'off'  # mongomock không hỗ trợ explain
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+    _install_mongo_stand_in()
+    loaded = {
+        'appV7': _load_app('bench_appV7', 'appV7.py'),
+        'blueprint': _load_app('bench_appV7_blueprint', 'appV7 blueprint.py'),
+    }
+    loaded['appV7'].app = loaded['appV7'].create_app()  # appV7.py dùng app factory
+    _seed(loaded['appV7'])
+    return loaded
+
+
+# --- ĐO ---
+class Bench:
+    def __init__(self, name, rounds_override=None, baseline=None, tolerance=DEFAULT_TOLERANCE):
+        self.name = name
+        self.rounds_override = rounds_override
+        self.baseline = baseline
+        self.tolerance = tolerance
+        self.stats = None
+
+    def __call__(self, func, setup=None, rounds=30, warmup=3):
+        """
+        Gọi func (và setup trước mỗi lần gọi, không tính giờ) warmup + rounds lần.
+        setup trả về tuple tham số cho func. Trả về kết quả của lần gọi cuối.
+        """
+        rounds = self.rounds_override or rounds
+        timings = []
+        result = None
+        for i in range(warmup + rounds):
+            args = setup() if setup else ()
+            started = time.perf_counter()
+            result = func(*args)
+            elapsed = time.perf_counter() - started
+            if i >= warmup:
+                timings.append(elapsed)
+        timings.sort()
+        self.stats = {
+            'rounds': rounds,
+            'min_ms': round(timings[0] * 1000, 4),
+            'median_ms': round(statistics.median(timings) * 1000, 4),
+            'mean_ms': round(statistics.fmean(timings) * 1000, 4),
+            'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000, 4),
+            'stdev_ms': round(statistics.pstdev(timings) * 1000, 4),
+        }
+        _results[self.name] = self.stats
+        self._check()
+        return result
+
+    def _check(self):
+        if self.baseline is None:
+            return
+        limit = self.baseline['median_ms'] * (1 + self.tolerance)
+        if self.stats['median_ms'] > limit:
+            pytest.fail(f"{self.name}: median {self.stats['median_ms']:.3f}ms vượt baseline "
+                        f"{self.baseline['median_ms']:.3f}ms quá {self.tolerance:.0%}", pytrace=False)
+
+
+def _load_baseline(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f).get('benchmarks', {})
+    except FileNotFoundError:
+        return None
+
+
+@pytest.fixture
+def bench(request):
+    config = request.config
+    baseline = None
+    if not config.getoption('--bench-save') and config._bench_baseline:
+        baseline = config._bench_baseline.get(request.node.name)
+    return Bench(request.node.name, config.getoption('--bench-rounds'), baseline,
+                 config.getoption('--bench-tolerance'))
+
+
+def pytest_configure(config):
+    config._bench_baseline = _load_baseline(config.getoption('--bench-baseline'))
+
+
+def _write_json(path, benchmarks):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'machine': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'processor': platform.processor() or platform.machine()},
+            'benchmarks': dict(sorted(benchmarks.items())),
+        }, f, ensure_ascii=False, indent=2)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if not _results:
+        return
+    config = session.config
+    _write_json(RESULTS_FILE, _results)
+    baseline_path = config.getoption('--bench-baseline')
+    if config.getoption('--bench-save') or config._bench_baseline is None:
+        # Giữ các benchmark không chạy lần này (ví dụ khi chạy với -k)
+        _write_json(baseline_path, {**(config._bench_baseline or {}), **_results})
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _results:
+        return
+    baseline = terminalreporter.config._bench_baseline or {}
+    terminalreporter.section('benchmarks (median ms)')
+    width = max(len(name) for name in _results)
+    for name, stats in sorted(_results.items()):
+        previous = baseline.get(name)
+        change = f"{(stats['median_ms'] / previous['median_ms'] - 1):+.1%}" if previous else 'mới'
+        terminalreporter.write_line(
+            f"{name:<{width}}  {stats['median_ms']:>9.3f}  p95 {stats['p95_ms']:>9.3f}  {change}")
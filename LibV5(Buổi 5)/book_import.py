@@ -0,0 +1,201 @@
+"""
+Nhập sách hàng loạt từ file CSV hoặc NDJSON.
+
+Dùng chung cho endpoint POST /api/v2/books/import và cho dòng lệnh:
+
+    python book_import.py books.csv --batch-size 1000
+    python book_import.py books.ndjson --format ndjson --insert-only
+
+File được đọc theo kiểu stream (từng dòng), mỗi lần chỉ giữ một batch
+trong bộ nhớ rồi ghi xuống MongoDB bằng bulk_write / insert_many.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+
+import stock_shards
+
+DEFAULT_BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 100  # Giới hạn số lỗi trả về để report không phình to
+SUPPORTED_FORMATS = ('csv', 'ndjson')
+SHARDED_STOCK_ERROR = ("Sách đang chia shard tồn kho, không ghi đè quantity được; "
+                       "đưa stock_shards về 0 (PUT /api/admin/books/<id>/stock-shards) rồi import lại")
+
+
+# --- ĐỌC FILE THEO STREAM ---
+def iter_rows(stream, fmt):
+    """Sinh ra từng (line_no, row, error) từ một text stream, không đọc cả file."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row, None
+    elif fmt == 'ndjson':
+        for line_no, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_no, None, f'JSON không hợp lệ: {e}'
+                continue
+            if not isinstance(row, dict):
+                yield line_no, None, 'Mỗi dòng phải là một object JSON'
+                continue
+            yield line_no, row, None
+    else:
+        raise ValueError(f"Định dạng không hỗ trợ: {fmt}")
+
+
+def validate_row(row):
+    """Kiểm tra một dòng, trả về (document, error)."""
+    for field in ('title', 'author'):
+        value = row.get(field)
+        if value is not None and not isinstance(value, str):  # NDJSON: giá trị có thể là số, list...
+            return None, f"'{field}' không phải chuỗi: {value!r}"
+    title = (row.get('title') or '').strip()
+    author = (row.get('author') or '').strip()
+    if not title:
+        return None, "Thiếu 'title'"
+    if not author:
+        return None, "Thiếu 'author'"
+
+    quantity = row.get('quantity', 0)
+    if quantity in (None, ''):
+        quantity = 0
+    try:
+        quantity = int(quantity)
+    except (TypeError, ValueError):
+        return None, f"'quantity' không phải số nguyên: {quantity!r}"
+    if quantity < 0:
+        return None, "'quantity' không được âm"
+
+    return {'title': title, 'author': author, 'quantity': quantity}, None
+
+
+# --- GHI THEO BATCH ---
+def _flush(collection, batch, upsert, report):
+    if not batch:
+        return
+    if upsert:
+        # Sách đang chia shard: tồn kho nằm ở book_stock_shards, $set quantity sẽ nhân đôi tồn kho
+        sharded = stock_shards.sharded_books(collection, [d for _, d in batch])
+        for line_no, d in batch:
+            if (d['title'], d['author']) in sharded:
+                _add_error(report, line_no, SHARDED_STOCK_ERROR)
+        batch = [(line_no, d) for line_no, d in batch if (d['title'], d['author']) not in sharded]
+        if not batch:
+            report['batches'] += 1
+            return
+    try:
+        if upsert:
+            # Khóa tự nhiên của sách là (title, author)
+            ops = [UpdateOne({'title': d['title'], 'author': d['author']},
+                             {'$set': {'quantity': d['quantity']}},
+                             upsert=True)
+                   for _, d in batch]
+            result = collection.bulk_write(ops, ordered=False)
+            report['inserted'] += result.upserted_count
+            report['updated'] += result.modified_count
+        else:
+            result = collection.insert_many([d for _, d in batch], ordered=False)
+            report['inserted'] += len(result.inserted_ids)
+    except BulkWriteError as e:
+        details = e.details or {}
+        report['inserted'] += details.get('nInserted', 0) + details.get('nUpserted', 0)
+        report['updated'] += details.get('nModified', 0)
+        for err in details.get('writeErrors', []):
+            line_no = batch[err['index']][0]
+            _add_error(report, line_no, err.get('errmsg', 'Lỗi ghi'))
+    report['batches'] += 1
+
+
+def _add_error(report, line_no, message):
+    report['failed'] += 1
+    if len(report['errors']) < MAX_REPORTED_ERRORS:
+        report['errors'].append({'line': line_no, 'error': message})
+
+
+def import_books(stream, collection, fmt='csv', batch_size=DEFAULT_BATCH_SIZE, upsert=True):
+    """
+    Đọc stream, kiểm tra từng dòng và ghi vào collection theo batch.
+    Trả về report gồm số dòng, số dòng/giây và lỗi của từng dòng.
+    """
+    if fmt not in SUPPORTED_FORMATS:
+        raise ValueError(f"Định dạng không hỗ trợ: {fmt}")
+    batch_size = max(1, int(batch_size))
+
+    report = {'format': fmt, 'batch_size': batch_size, 'mode': 'upsert' if upsert else 'insert',
+              'rows': 0, 'inserted': 0, 'updated': 0, 'failed': 0, 'batches': 0, 'errors': [], 'aborted': None}
+    started = time.perf_counter()
+
+    batch = []
+    try:
+        for line_no, row, error in iter_rows(stream, fmt):
+            report['rows'] += 1
+            if error is None:
+                doc, error = validate_row(row)
+            if error is not None:
+                _add_error(report, line_no, error)
+                continue
+            batch.append((line_no, doc))
+            if len(batch) >= batch_size:
+                _flush(collection, batch, upsert, report)
+                batch = []
+    except (UnicodeDecodeError, csv.Error) as e:
+        # File không phải UTF-8 hoặc CSV hỏng: dừng đọc, các dòng hợp lệ trước đó vẫn được ghi
+        report['aborted'] = f'Không đọc được file sau dòng {report["rows"]}: {e}'
+    _flush(collection, batch, upsert, report)
+
+    elapsed = time.perf_counter() - started
+    report['elapsed_seconds'] = round(elapsed, 3)
+    report['rows_per_second'] = round(report['rows'] / elapsed, 1) if elapsed > 0 else None
+    report['errors_truncated'] = report['failed'] > len(report['errors'])
+    return report
+
+
+def detect_format(filename=None, content_type=None):
+    """Đoán định dạng từ Content-Type hoặc đuôi file, mặc định là CSV."""
+    content_type = (content_type or '').lower()
+    if 'ndjson' in content_type or 'jsonlines' in content_type:
+        return 'ndjson'
+    if filename and filename.lower().endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    return 'csv'
+
+
+# --- DÒNG LỆNH ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Nhập sách hàng loạt từ CSV/NDJSON vào MongoDB.')
+    parser.add_argument('file', help="Đường dẫn file, dùng '-' để đọc từ stdin")
+    parser.add_argument('--format', choices=SUPPORTED_FORMATS, help='Mặc định đoán theo đuôi file')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--insert-only', action='store_true',
+                        help='Dùng insert_many thay vì upsert theo (title, author)')
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017/library_db'))
+    args = parser.parse_args(argv)
+
+    fmt = args.format or detect_format(filename=args.file)
+    client = MongoClient(args.mongo_uri)
+    collection = client['library_db']['books']
+
+    if args.file == '-':
+        stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+        report = import_books(stream, collection, fmt, args.batch_size, upsert=not args.insert_only)
+    else:
+        with open(args.file, encoding='utf-8-sig', newline='') as stream:
+            report = import_books(stream, collection, fmt, args.batch_size, upsert=not args.insert_only)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 1 if report['failed'] or report['aborted'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+Lịch sử mượn của một user: lọc theo trạng thái/khoảng ngày và phân trang bằng cursor.
+
+Query string của GET /borrow-records (mọi version):
+    status   all (mặc định) | active (chưa trả) | returned
+    from     Mượn từ thời điểm này (ISO 8601 UTC, ví dụ 2024-01-31 hoặc 2024-01-31T08:00:00Z)
+    to       Mượn trước thời điểm này (không bao gồm)
+    limit    Số phiếu mỗi trang, mặc định 20, tối đa 100
+    cursor   next_cursor của trang trước
+
+Phiếu mới nhất trước, sắp theo (borrow_date, _id) giảm dần. Cursor là cặp đó của phiếu cuối
+trang; trang sau lọc "(borrow_date, _id) < cursor" rồi lấy limit + 1 phiếu (phiếu thừa cho
+biết còn trang sau), nên không dùng skip: trang thứ 100 cũng chỉ đọc limit + 1 key của index
+(user_id, borrow_date, _id) hoặc (user_id, returned, borrow_date, _id) khi lọc theo trạng thái.
+
+total chỉ được đếm ở trang đầu (không có cursor), với cùng filter; mọi điều kiện đều nằm trong
+index nên MongoDB đếm bằng COUNT_SCAN, không đọc document. Trang sau trả về total = null.
+"""
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+STATUSES = {'all': None, 'active': False, 'returned': True}
+_EPOCH = datetime(1970, 1, 1)
+
+
+class InvalidQuery(ValueError):
+    """Tham số query string không hợp lệ (trả 400)."""
+
+
+def _parse_date(value, name):
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise InvalidQuery(f"'{name}' phải là ngày giờ ISO 8601, ví dụ 2024-01-31T08:00:00Z")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)  # DB lưu UTC không kèm múi giờ
+    return parsed
+
+
+def _millis(moment):
+    # MongoDB lưu datetime tới mili giây; phiếu chưa flush (write_behind.py) còn micro giây
+    return (moment - _EPOCH) // timedelta(milliseconds=1)
+
+
+def encode_cursor(record):
+    return f'{_millis(record.borrow_date)}_{record.id}'
+
+
+def decode_cursor(value):
+    try:
+        millis, record_id = value.split('_', 1)
+        return _EPOCH + timedelta(milliseconds=int(millis)), ObjectId(record_id)
+    except (ValueError, OverflowError, InvalidId):  # OverflowError: số mili giây quá lớn cho datetime
+        raise InvalidQuery("'cursor' không hợp lệ")
+
+
+def parse_args(args):
+    """Đọc tham số từ request.args; raise InvalidQuery nếu sai."""
+    status = args.get('status', 'all')
+    if status not in STATUSES:
+        raise InvalidQuery(f"'status' phải là một trong {', '.join(STATUSES)}")
+    limit = args.get('limit', DEFAULT_LIMIT, type=int)
+    if not 1 <= limit <= MAX_LIMIT:
+        raise InvalidQuery(f"'limit' phải trong khoảng 1 - {MAX_LIMIT}")
+    since = _parse_date(args['from'], 'from') if args.get('from') else None
+    until = _parse_date(args['to'], 'to') if args.get('to') else None
+    cursor = decode_cursor(args['cursor']) if args.get('cursor') else None
+    return {'status': status, 'since': since, 'until': until, 'limit': limit, 'cursor': cursor}
+
+
+def build_query(user_id, options, with_cursor=True):
+    """Filter MongoDB (raw) cho các tham số đã parse."""
+    query = {'user_id': user_id}
+    returned = STATUSES[options['status']]
+    if returned is not None:
+        query['returned'] = returned
+    borrow_date = {}
+    if options['since']:
+        borrow_date['$gte'] = options['since']
+    if options['until']:
+        borrow_date['$lt'] = options['until']
+    if with_cursor and options['cursor']:
+        moment, record_id = options['cursor']
+        borrow_date['$lte'] = moment  # Thu hẹp khoảng quét index, $or bên dưới loại phần trùng mốc
+        query['$or'] = [{'borrow_date': {'$lt': moment}}, {'_id': {'$lt': record_id}}]
+    if borrow_date:
+        query['borrow_date'] = borrow_date
+    return query
+
+
+def _sort_key(record):
+    return _millis(record.borrow_date), record.id
+
+
+def _matches(record, options):
+    """Cùng điều kiện với build_query, cho phiếu chưa flush (chỉ có trong bộ nhớ)."""
+    returned = STATUSES[options['status']]
+    if returned is not None and record.returned != returned:
+        return False
+    moment = _EPOCH + timedelta(milliseconds=_millis(record.borrow_date))
+    if options['since'] and moment < options['since']:
+        return False
+    if options['until'] and moment >= options['until']:
+        return False
+    return not options['cursor'] or _sort_key(record) < (_millis(options['cursor'][0]), options['cursor'][1])
+
+
+def page(model, user_id, options, pending=()):
+    """
+    Một trang lịch sử: {'records': [document], 'pagination': {...}}.
+    pending: phiếu chưa flush của user (write_behind.py), được gộp vào đúng vị trí theo thứ tự.
+    """
+    limit = options['limit']
+    queryset = model.objects(__raw__=build_query(user_id, options)).order_by('-borrow_date', '-id')
+    records = list(queryset.limit(limit + 1))
+    seen = {r.id for r in records}
+    extra = [r for r in pending if r.id not in seen and _matches(r, options)]
+    if extra:
+        records = sorted(records + extra, key=_sort_key, reverse=True)
+
+    total = None
+    if options['cursor'] is None:
+        total = model.objects(__raw__=build_query(user_id, options, with_cursor=False)).count() + len(extra)
+
+    has_more = len(records) > limit
+    records = records[:limit]
+    return {
+        'records': records,
+        'pagination': {
+            'limit': limit,
+            'next_cursor': encode_cursor(records[-1]) if has_more else None,
+            'total': total,
+        },
+    }
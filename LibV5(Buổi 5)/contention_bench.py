@@ -0,0 +1,313 @@
+"""
+Benchmark tranh chấp mượn/trả sách trên server đang chạy, kiểm tra tính đúng của tồn kho sau khi chạy.
+
+    # Server chạy ở 127.0.0.1:5000, MongoDB cùng DB với server
+    python contention_bench.py --concurrency 32 --duration 30
+
+    # Chỉ kịch bản một quyển sách "nóng", API V2 của bản blueprint
+    python contention_bench.py --scenario hot --api-prefix /api/v2
+
+    # Quyển nóng chia tồn kho thành 8 shard (stock_shards.py), so với chạy không có --shards
+    python contention_bench.py --scenario hot --shards 8
+
+Kịch bản:
+    hot   mọi worker mượn/trả cùng một quyển (giống k6 khi mọi VU mượn books.data[0])
+    zipf  chọn sách theo phân phối Zipf trên --books quyển (vài quyển rất nóng, còn lại nguội)
+
+Mỗi worker là một user riêng: mượn, giữ tối đa --hold phiếu rồi trả. Với tỉ lệ
+--double-return, worker gửi đồng thời hai request trả cùng một phiếu để thử race.
+
+Sau mỗi kịch bản, đọc thẳng MongoDB để kiểm tra:
+    - tồn kho không âm
+    - tồn kho + số phiếu chưa trả == số lượng ban đầu (theo từng quyển)
+    - không phiếu nào được API báo "trả thành công" hai lần
+Exit code 1 nếu có vi phạm. Sách/phiếu/user tạo ra được xóa khi xong (trừ khi --keep).
+
+Bất biến đọc phiếu từ MongoDB nên server phải chạy với BORROW_WRITE_BEHIND=off: phiếu còn nằm
+trong journal (write_behind.py) không thấy được từ DB. Trước khi chạy, bench mượn thử một quyển
+và tìm phiếu đó trong DB ngay sau khi nhận 201; không thấy thì dừng với exit code 2.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from bson import ObjectId
+from pymongo import MongoClient
+
+from gen_dataset import ZipfSampler
+from load_replay import percentile
+import stock_shards
+
+TITLE_PREFIX = '__contention__'
+PASSWORD = 'contention-password'
+
+
+class ApiClient:
+    """Một kết nối keep-alive tới server."""
+
+    def __init__(self, base_url, prefix, timeout=10.0):
+        url = urlsplit(base_url)
+        cls = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        self._connection = cls(url.netloc, timeout=timeout)
+        self.prefix = prefix
+        self.token = None
+
+    def call(self, method, path, body=None):
+        """Trả về (giây, status, JSON hoặc None); status None nếu lỗi kết nối."""
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers['x-access-token'] = self.token
+        payload = json.dumps(body).encode('utf-8') if body is not None else None
+        started = time.perf_counter()
+        try:
+            self._connection.request(method, self.prefix + path, body=payload, headers=headers)
+            response = self._connection.getresponse()
+            raw = response.read()
+        except (OSError, http.client.HTTPException):
+            self._connection.close()
+            return time.perf_counter() - started, None, None
+        elapsed = time.perf_counter() - started
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            data = None
+        return elapsed, response.status, data
+
+    def close(self):
+        self._connection.close()
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)  # thao tác -> [giây]
+        self.statuses = defaultdict(Counter)  # thao tác -> {status: số lần}
+        self.return_successes = Counter()  # record_id -> số lần API báo trả thành công
+        self._lock = threading.Lock()
+
+    def record(self, operation, elapsed, status):
+        with self._lock:
+            self.latencies[operation].append(elapsed)
+            self.statuses[operation][status] += 1
+
+    def returned(self, record_id):
+        with self._lock:
+            self.return_successes[record_id] += 1
+
+
+# --- CHUẨN BỊ ---
+def create_books(db, run_id, count, quantity, shards=0):
+    """Tạo sách riêng cho lần chạy này (shards > 0: tồn kho chia shard); trả về danh sách id (str)."""
+    docs = [{'title': f'{TITLE_PREFIX}{run_id}_{i:05d}', 'author': 'Contention Bench',
+             'quantity': 0 if shards else quantity, 'stock_shards': shards}
+            for i in range(count)]
+    book_ids = [str(_id) for _id in db.books.insert_many(docs).inserted_ids]
+    if shards:
+        db.book_stock_shards.insert_many([
+            {'_id': stock_shards.shard_id(book_id, i), 'book_id': book_id, 'count': part}
+            for book_id in book_ids for i, part in enumerate(stock_shards.split(quantity, shards))])
+    return book_ids
+
+
+def create_users(base_url, prefix, run_id, count):
+    """Đăng ký + đăng nhập song song; trả về danh sách ApiClient đã có token."""
+    def make(i):
+        client = ApiClient(base_url, prefix)
+        credentials = {'username': f'{TITLE_PREFIX}{run_id}_u{i}', 'password': PASSWORD}
+        _, status, data = client.call('POST', '/register', credentials)
+        if status != 201:
+            raise RuntimeError(f'Đăng ký thất bại ({status}): {data}')
+        _, status, data = client.call('POST', '/login', credentials)
+        if status != 200:
+            raise RuntimeError(f'Đăng nhập thất bại ({status}): {data}')
+        client.token = data['token']
+        return client
+
+    with ThreadPoolExecutor(max_workers=min(count, 16)) as pool:
+        return list(pool.map(make, range(count)))
+
+
+# --- CHẠY ---
+def _return(client, record_id, stats):
+    elapsed, status, data = client.call('PUT', f'/borrow-records/{record_id}')
+    stats.record('return', elapsed, status)
+    if status == 200 and data and 'thành công' in data.get('message', ''):
+        stats.returned(record_id)
+
+
+def _double_return(client, spare, record_id, stats):
+    """Hai request trả cùng một phiếu gửi gần như cùng lúc (hai kết nối)."""
+    barrier = threading.Barrier(2)
+
+    def fire(c):
+        barrier.wait()
+        _return(c, record_id, stats)
+
+    other = threading.Thread(target=fire, args=(spare,))
+    other.start()
+    fire(client)
+    other.join()
+
+
+def run_scenario(clients, spares, pick_book, duration, hold, double_return_ratio, seed):
+    stats = Stats()
+    deadline = time.monotonic() + duration
+
+    def worker(index):
+        client, spare = clients[index], spares[index]
+        rng = random.Random(seed * 1000 + index)
+        held = []
+        while time.monotonic() < deadline:
+            if len(held) < hold and (not held or rng.random() < 0.5):
+                elapsed, status, data = client.call('POST', '/borrow-records', {'book_id': pick_book(rng)})
+                stats.record('borrow', elapsed, status)
+                if status == 201:
+                    held.append(data['record']['id'])
+                continue
+            record_id = held.pop(rng.randrange(len(held)))
+            if rng.random() < double_return_ratio:
+                _double_return(client, spare, record_id, stats)
+            else:
+                _return(client, record_id, stats)
+        for record_id in held:  # Trả hết trước khi kiểm tra để số liệu dễ đọc
+            _return(client, record_id, stats)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(clients)) as pool:
+        for future in [pool.submit(worker, i) for i in range(len(clients))]:
+            future.result()
+    return stats, time.perf_counter() - started
+
+
+def write_behind_enabled(db, client, run_id):
+    """Mượn thử một quyển; True nếu phiếu chưa có trong DB khi request đã trả 201 (server ghi write-behind)."""
+    book_id = create_books(db, f'{run_id}_probe', 1, 1)[0]
+    _, status, data = client.call('POST', '/borrow-records', {'book_id': book_id})
+    if status != 201:
+        raise RuntimeError(f'Mượn thử thất bại ({status}): {data}')
+    record_id = data['record']['id']
+    enabled = db.borrow_records.count_documents({'_id': ObjectId(record_id)}) == 0
+    client.call('PUT', f'/borrow-records/{record_id}')  # Trả lại; với write-behind, server flush trước khi tìm
+    return enabled
+
+
+def check_invariants(db, book_ids, initial_quantity, stats):
+    """Danh sách vi phạm (rỗng nếu mọi thứ đúng)."""
+    violations = []
+    active = Counter()
+    for record in db.borrow_records.find({'book_id': {'$in': book_ids}, 'returned': False}, {'book_id': 1}):
+        active[record['book_id']] += 1
+    books = {str(b['_id']): b['quantity'] for b in db.books.find(
+        {'_id': {'$in': [ObjectId(i) for i in book_ids]}}, {'quantity': 1})}
+    for shard in db.book_stock_shards.find({'book_id': {'$in': book_ids}}, {'book_id': 1, 'count': 1}):
+        if shard['book_id'] in books:  # Sách chia shard: tồn kho = quantity (0) + tổng các shard
+            books[shard['book_id']] += shard['count']
+    for book_id in book_ids:
+        quantity = books.get(book_id)
+        if quantity is None:
+            violations.append(f'{book_id}: sách bị mất')
+            continue
+        if quantity < 0:
+            violations.append(f'{book_id}: tồn kho âm ({quantity})')
+        if quantity + active[book_id] != initial_quantity:
+            violations.append(f'{book_id}: tồn kho {quantity} + đang mượn {active[book_id]} != {initial_quantity}')
+    for record_id, count in stats.return_successes.items():
+        if count > 1:
+            violations.append(f'phiếu {record_id}: được báo trả thành công {count} lần')
+    return violations
+
+
+def print_report(name, stats, wall, violations):
+    total = sum(len(v) for v in stats.latencies.values())
+    print(f'\n== {name}: {total} request trong {wall:.1f}s, {total / wall:.1f} req/s')
+    print(f"{'thao tác':<8} {'count':>7} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}  status")
+    for operation, values in sorted(stats.latencies.items()):
+        timings = sorted(v * 1000 for v in values)
+        statuses = ', '.join(f'{status}: {count}' for status, count in stats.statuses[operation].most_common())
+        print(f'{operation:<8} {len(timings):>7} {len(timings) / wall:>8.1f} {percentile(timings, 50):>8.1f} '
+              f'{percentile(timings, 95):>8.1f} {percentile(timings, 99):>8.1f} {timings[-1]:>8.1f}  {statuses}')
+    if violations:
+        print(f'VI PHẠM ({len(violations)}):')
+        for violation in violations[:20]:
+            print(f'  - {violation}')
+    else:
+        print('Bất biến: OK')
+
+
+def cleanup(db, run_id):
+    pattern = {'$regex': f'^{TITLE_PREFIX}{run_id}_'}
+    book_ids = [str(b['_id']) for b in db.books.find({'title': pattern}, {'_id': 1})]
+    db.borrow_records.delete_many({'book_id': {'$in': book_ids}})
+    db.book_stock_shards.delete_many({'book_id': {'$in': book_ids}})
+    db.books.delete_many({'title': pattern})
+    db.users.delete_many({'username': pattern})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark tranh chấp mượn/trả sách.')
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--api-prefix', default='/api', help='/api (appV7.py), /api/v1 hoặc /api/v2 (blueprint)')
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017/library_db'))
+    parser.add_argument('--scenario', choices=('hot', 'zipf', 'both'), default='both')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20.0, help='Số giây mỗi kịch bản')
+    parser.add_argument('--quantity', type=int, default=20, help='Số lượng ban đầu của mỗi quyển')
+    parser.add_argument('--shards', type=int, default=0, help='Chia tồn kho quyển nóng thành N shard')
+    parser.add_argument('--books', type=int, default=200, help='Số sách cho kịch bản zipf')
+    parser.add_argument('--skew', type=float, default=1.2, help='Tham số Zipf')
+    parser.add_argument('--hold', type=int, default=3, help='Số phiếu tối đa mỗi worker giữ')
+    parser.add_argument('--double-return', type=float, default=0.05,
+                        help='Tỉ lệ lần trả gửi hai request đồng thời cho cùng một phiếu')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--keep', action='store_true', help='Giữ lại dữ liệu đã tạo để điều tra')
+    args = parser.parse_args(argv)
+
+    db = MongoClient(args.mongo_uri).get_default_database('library_db')
+    run_id = uuid.uuid4().hex[:8]
+    clients = create_users(args.base_url, args.api_prefix, run_id, args.concurrency)
+    spares = []
+    for client in clients:
+        spare = ApiClient(args.base_url, args.api_prefix)
+        spare.token = client.token
+        spares.append(spare)
+
+    failed = False
+    try:
+        if write_behind_enabled(db, clients[0], run_id):
+            print('Server đang bật BORROW_WRITE_BEHIND: phiếu trong journal chưa có trong MongoDB nên '
+                  'không kiểm tra được bất biến. Chạy lại server với BORROW_WRITE_BEHIND=off.', file=sys.stderr)
+            return 2
+        scenarios = ['hot', 'zipf'] if args.scenario == 'both' else [args.scenario]
+        for name in scenarios:
+            if name == 'hot':
+                book_ids = create_books(db, f'{run_id}_hot', 1, args.quantity, args.shards)
+                pick_book = lambda rng: book_ids[0]  # noqa: E731
+            else:
+                book_ids = create_books(db, f'{run_id}_zipf', args.books, args.quantity)
+                sampler = ZipfSampler(len(book_ids), args.skew, args.seed)
+                pick_book = lambda rng: book_ids[sampler.sample(rng, 1)[0]]  # noqa: E731
+            stats, wall = run_scenario(clients, spares, pick_book, args.duration, args.hold,
+                                       args.double_return, args.seed)
+            violations = check_invariants(db, book_ids, args.quantity, stats)
+            print_report(name, stats, wall, violations)
+            failed = failed or bool(violations)
+    finally:
+        for client in clients + spares:
+            client.close()
+        if args.keep:
+            print(f'\nDữ liệu được giữ lại với tiền tố {TITLE_PREFIX}{run_id}_')
+        else:
+            cleanup(db, run_id)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
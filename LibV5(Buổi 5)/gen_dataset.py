@@ -0,0 +1,256 @@
+"""
+Sinh dữ liệu giả quy mô lớn (sách, user, phiếu mượn) để load test ở quy mô production.
+
+    # 1 triệu sách, 1 triệu user, 20 triệu phiếu mượn, 8 process
+    python gen_dataset.py --books 1000000 --users 1000000 --records 20000000 --workers 8 --drop
+
+    # Bộ nhỏ để thử nhanh
+    python gen_dataset.py --books 10000 --users 2000 --records 100000 --drop
+
+- Kết quả chỉ phụ thuộc --seed: cùng seed cho ra cùng dữ liệu, không phụ thuộc số worker
+  (mỗi chunk có RNG riêng, _id được dựng từ số thứ tự nên phiếu mượn tham chiếu được
+  sách/user mà không cần đọc lại DB).
+- Tiêu đề/tác giả trộn tiếng Việt và tiếng Anh. Độ phổ biến lệch theo phân phối Zipf:
+  một số ít sách và user chiếm phần lớn lượt mượn.
+- Ghi bằng insert_many(ordered=False) theo batch, mỗi worker một MongoClient.
+- Mọi user có cùng mật khẩu (--password) vì băm bcrypt cho từng user quá chậm;
+  đăng nhập bằng user_00000000 / password123 để chạy k6, load_replay.py với dữ liệu này.
+
+Collection được ghi khi chưa có index (nhanh hơn); index được tạo khi app khởi động
+(query_plans.ensure_indexes) hoặc khi chạy query_audit.py.
+"""
+import argparse
+import bisect
+import itertools
+import math
+import os
+import random
+import struct
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from multiprocessing import Pool
+
+import bcrypt
+from bson import ObjectId
+from pymongo import MongoClient
+
+DEFAULT_BATCH_SIZE = 5000
+CHUNK_SIZE = 50000  # Số document mỗi task giao cho worker
+
+_ID_EPOCH = int(datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp())
+_KIND = {'users': 1, 'books': 2, 'borrow_records': 3}
+_MASK64 = (1 << 64) - 1
+
+# --- TỪ VỰNG ---
+VI_TITLE_HEADS = ['Chuyện', 'Nỗi buồn', 'Mùa', 'Những ngày', 'Tiếng', 'Bến', 'Dòng sông', 'Ánh trăng', 'Con đường',
+                  'Giấc mơ', 'Ngọn đèn', 'Cánh đồng', 'Bóng', 'Hạt', 'Lời hứa', 'Mắt', 'Người', 'Ngôi nhà']
+VI_TITLE_TAILS = ['chiến tranh', 'thơ ấu', 'lá rụng', 'phố cũ', 'Hà Nội', 'Sài Gòn', 'quê hương', 'biển xanh',
+                  'không tên', 'cuối cùng', 'mùa hạ', 'trên đồi', 'xa xứ', 'bên sông', 'tuổi trẻ', 'biếc']
+EN_TITLE_HEADS = ['The Silent', 'A Tale of', 'The Last', 'Shadows of', 'The Hidden', 'Letters from', 'The Old',
+                  'Beyond the', 'Songs of', 'The Lost', 'Children of', 'The Quiet', 'Echoes of', 'The Broken']
+EN_TITLE_TAILS = ['River', 'Empire', 'Garden', 'Winter', 'Sea', 'Kingdom', 'Night', 'Mountain', 'City', 'Storm',
+                  'Harbor', 'Orchard', 'Lighthouse', 'Desert', 'Machine', 'Voyage']
+VI_FAMILY = ['Nguyễn', 'Trần', 'Lê', 'Phạm', 'Hoàng', 'Huỳnh', 'Phan', 'Vũ', 'Võ', 'Đặng', 'Bùi', 'Đỗ', 'Hồ', 'Ngô']
+VI_MIDDLE = ['Văn', 'Thị', 'Hữu', 'Minh', 'Ngọc', 'Thanh', 'Đức', 'Xuân', 'Nhật', 'Quang', 'Thu', 'Kim']
+VI_GIVEN = ['An', 'Bình', 'Chi', 'Dũng', 'Hà', 'Hải', 'Hoa', 'Khánh', 'Lan', 'Long', 'Mai', 'Nam', 'Phong', 'Quỳnh',
+            'Sơn', 'Tâm', 'Thảo', 'Trang', 'Tuấn', 'Vy', 'Ánh', 'Hùng', 'Linh', 'Yến']
+EN_FIRST = ['James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda', 'William', 'Elizabeth',
+            'David', 'Susan', 'Richard', 'Margaret', 'Thomas', 'Emily', 'George', 'Virginia', 'Ernest', 'Jane']
+EN_LAST = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Miller', 'Davis', 'Wilson', 'Taylor', 'Clark',
+           'Hall', 'Young', 'King', 'Wright', 'Hill', 'Scott', 'Green', 'Baker', 'Turner', 'Austen', 'Orwell']
+
+
+def object_id(kind, index):
+    """_id tất định: 4 byte thời gian cố định + 1 byte loại + 7 byte số thứ tự."""
+    return ObjectId(struct.pack('>IB', _ID_EPOCH, _KIND[kind]) + index.to_bytes(7, 'big'))
+
+
+def _mix(x):
+    """splitmix64: băm số nguyên nhanh, dùng để chọn từ cho tiêu đề/tác giả theo số thứ tự."""
+    x = (x + 0x9E3779B97F4A7C15) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+
+def _pick(words, h, shift):
+    return words[(h >> shift) % len(words)]
+
+
+def book_title(seed, index):
+    h = _mix(seed * 1_000_003 + index)
+    if h & 1:
+        title = f'{_pick(VI_TITLE_HEADS, h, 8)} {_pick(VI_TITLE_TAILS, h, 16)}'
+        volume = f' - Tập {(h >> 40) % 5 + 1}'
+    else:
+        title = f'{_pick(EN_TITLE_HEADS, h, 8)} {_pick(EN_TITLE_TAILS, h, 16)}'
+        volume = f', Vol. {(h >> 40) % 5 + 1}'
+    # Thêm số để phần lớn (title, author) khác nhau như dữ liệu thật
+    return f'{title} {(h >> 24) % 1000}' + (volume if (h >> 48) % 4 == 0 else '')
+
+
+def book_author(seed, index):
+    h = _mix(seed * 1_000_033 + index)
+    if h & 1:
+        return f'{_pick(VI_FAMILY, h, 8)} {_pick(VI_MIDDLE, h, 16)} {_pick(VI_GIVEN, h, 24)}'
+    return f'{_pick(EN_FIRST, h, 8)} {_pick(EN_LAST, h, 16)}'
+
+
+def username(index):
+    return f'user_{index:08d}'
+
+
+# --- PHÂN PHỐI ZIPF ---
+class ZipfSampler:
+    """Chọn phần tử theo Zipf(s); hạng được hoán vị để sách phổ biến không nằm liền nhau."""
+
+    def __init__(self, n, s, seed):
+        self.n = n
+        self.cum_weights = list(itertools.accumulate(1.0 / (rank ** s) for rank in range(1, n + 1)))
+        self.multiplier = self._coprime(n, 2654435761 + seed)
+        self.offset = seed % n
+
+    @staticmethod
+    def _coprime(n, start):
+        candidate = start
+        while math.gcd(candidate, n) != 1:
+            candidate += 1
+        return candidate
+
+    def sample(self, rng, k):
+        total = self.cum_weights[-1]
+        ranks = [bisect.bisect_left(self.cum_weights, rng.random() * total) for _ in range(k)]
+        return [(rank * self.multiplier + self.offset) % self.n for rank in ranks]
+
+
+# --- WORKER ---
+_worker = {}
+
+
+def _init_worker(mongo_uri, settings):
+    client = MongoClient(mongo_uri)
+    _worker['db'] = client.get_default_database('library_db')
+    _worker['settings'] = settings
+    if settings['records']:
+        _worker['book_sampler'] = ZipfSampler(settings['books'], settings['book_skew'], settings['seed'])
+        _worker['user_sampler'] = ZipfSampler(settings['users'], settings['user_skew'], settings['seed'] + 1)
+
+
+def _insert(collection, docs_iter, batch_size):
+    inserted = 0
+    while True:
+        batch = list(itertools.islice(docs_iter, batch_size))
+        if not batch:
+            return inserted
+        _worker['db'][collection].insert_many(batch, ordered=False)
+        inserted += len(batch)
+
+
+def _book_docs(start, end, seed):
+    rng = random.Random(f'{seed}:books:{start}')
+    for i in range(start, end):
+        yield {'_id': object_id('books', i), 'title': book_title(seed, i), 'author': book_author(seed, i),
+               'quantity': min(int(rng.expovariate(0.25)), 50)}
+
+
+def _user_docs(start, end, password_hash):
+    for i in range(start, end):
+        yield {'_id': object_id('users', i), 'username': username(i), 'password': password_hash, 'roles': ['user']}
+
+
+def _record_docs(start, end, settings):
+    seed = settings['seed']
+    rng = random.Random(f'{seed}:records:{start}')
+    count = end - start
+    book_indexes = _worker['book_sampler'].sample(rng, count)
+    user_indexes = _worker['user_sampler'].sample(rng, count)
+    now = datetime(2025, 11, 1)
+    span_minutes = settings['days'] * 24 * 60
+    for offset, i in enumerate(range(start, end)):
+        book_index, user_index = book_indexes[offset], user_indexes[offset]
+        borrow_date = now - timedelta(minutes=rng.randrange(span_minutes))
+        returned = rng.random() < settings['returned_ratio']
+        yield {
+            '_id': object_id('borrow_records', i),
+            'user_id': str(object_id('users', user_index)),
+            'username': username(user_index),
+            'book_id': str(object_id('books', book_index)),
+            'book_title': book_title(seed, book_index),
+            'borrow_date': borrow_date,
+            'returned': returned,
+            'return_date': borrow_date + timedelta(days=rng.randint(1, 30)) if returned else None,
+        }
+
+
+def _run_task(task):
+    kind, start, end = task
+    settings = _worker['settings']
+    if kind == 'books':
+        docs = _book_docs(start, end, settings['seed'])
+    elif kind == 'users':
+        docs = _user_docs(start, end, settings['password_hash'])
+    else:
+        docs = _record_docs(start, end, settings)
+    return kind, _insert(kind, docs, settings['batch_size'])
+
+
+def _tasks(kind, total):
+    return [(kind, start, min(start + CHUNK_SIZE, total)) for start in range(0, total, CHUNK_SIZE)]
+
+
+def generate(mongo_uri, books, users, records, seed=42, workers=None, batch_size=DEFAULT_BATCH_SIZE,
+             password='password123', book_skew=1.1, user_skew=0.8, days=730, returned_ratio=0.85):
+    """Sinh toàn bộ dataset; trả về {collection: (số document, số giây)}."""
+    if records and (not books or not users):
+        raise ValueError('Cần có sách và user để sinh phiếu mượn')
+    settings = {
+        'seed': seed, 'books': books, 'users': users, 'records': records, 'batch_size': batch_size,
+        'password_hash': bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8'),
+        'book_skew': book_skew, 'user_skew': user_skew, 'days': days, 'returned_ratio': returned_ratio,
+    }
+    report = {}
+    with Pool(workers or os.cpu_count(), initializer=_init_worker, initargs=(mongo_uri, settings)) as pool:
+        for kind, total in (('books', books), ('users', users), ('borrow_records', records)):
+            started = time.perf_counter()
+            done = 0
+            for _, inserted in pool.imap_unordered(_run_task, _tasks(kind, total)):
+                done += inserted
+                print(f'\r{kind}: {done}/{total}', end='', flush=True)
+            elapsed = time.perf_counter() - started
+            if total:
+                print(f'\r{kind}: {done} document trong {elapsed:.1f}s ({done / elapsed:,.0f}/s)')
+            report[kind] = (done, elapsed)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sinh dữ liệu giả quy mô lớn cho load test.')
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017/library_db'))
+    parser.add_argument('--books', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--records', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, help='Số process (mặc định số CPU)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--password', default='password123', help='Mật khẩu chung của mọi user')
+    parser.add_argument('--book-skew', type=float, default=1.1, help='Tham số Zipf cho độ phổ biến của sách')
+    parser.add_argument('--user-skew', type=float, default=0.8, help='Tham số Zipf cho độ tích cực của user')
+    parser.add_argument('--drop', action='store_true', help='Xóa books/users/borrow_records trước khi sinh')
+    args = parser.parse_args(argv)
+
+    db = MongoClient(args.mongo_uri).get_default_database('library_db')
+    if args.drop:
+        for name in ('books', 'users', 'borrow_records'):
+            db.drop_collection(name)
+    elif any(db[name].estimated_document_count() for name in ('books', 'users', 'borrow_records')):
+        print('DB đã có dữ liệu, dùng --drop để sinh lại từ đầu.', file=sys.stderr)
+        return 1
+
+    generate(args.mongo_uri, args.books, args.users, args.records, args.seed, args.workers, args.batch_size,
+             args.password, args.book_skew, args.user_skew)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
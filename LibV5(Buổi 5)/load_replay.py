@@ -0,0 +1,457 @@
+"""
+Phát lại LibV7.postman_collection.json như một bài load test, đo độ trễ từng request.
+
+    # 20 người dùng ảo, mỗi người lặp lại collection trong 60 giây, tối đa 200 request/s
+    python load_replay.py --concurrency 20 --duration 60 --rate 200
+
+    # Chỉ lặp lại request đọc, server khác
+    python load_replay.py --only "3. Get All Books" --env API_URL=http://127.0.0.1:8000
+
+Mỗi người dùng ảo có bộ biến riêng (copy từ file environment). Các request "setup"
+(mặc định 2 request đầu: đăng ký + đăng nhập) chỉ chạy một lần cho mỗi người dùng ảo,
+phần còn lại của collection được lặp đến khi hết --iterations/--duration.
+
+Script test/pre-request của Postman không được chạy bằng JavaScript; tool chỉ hiểu
+các mẫu mà collection này dùng:
+    pm.response.to.have.status(201)                  -> status mong đợi
+    pm.environment.set("AUTH_TOKEN", jsonData.token) -> lấy giá trị từ JSON response
+    var firstBook = jsonData.data[0]; ...firstBook.id
+    pm.environment.set("X", "user_" + Math.floor(Math.random() * 100000))
+
+Access token (appV7.py và /api/v2, mặc định sống 15 phút) được đổi bằng refresh token nhận từ bước đăng
+nhập khi còn dưới REFRESH_MARGIN_S giây, giống tokenForVu của K6 Testing/lib/common.js, nên
+--duration dài hơn 15 phút không bị 401. Các lần refresh được ghi vào report dưới tên
+"token refresh". V1 không có refresh token, token sống 60 phút như cũ.
+
+Report (throughput, p50/p95/p99 theo từng request) được ghi vào load_reports/ và so
+với report gần nhất trong thư mục đó.
+"""
+import argparse
+import glob
+import http.client
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_COLLECTION = os.path.join(BASE_DIR, 'LibV7.postman_collection.json')
+DEFAULT_ENVIRONMENT = os.path.join(BASE_DIR, 'LibV7.postman_environment.json')
+DEFAULT_REPORT_DIR = os.path.join(BASE_DIR, 'load_reports')
+REFRESH_MARGIN_S = 30
+REFRESH_STEP = {'name': 'token refresh', 'method': 'POST'}
+
+_VARIABLE = re.compile(r'\{\{\s*([^}]+?)\s*\}\}')
+_STATUS = re.compile(r'pm\.response\.to\.have\.status\((\d{3})\)')
+_ALIAS = re.compile(r'var\s+(\w+)\s*=\s*([\w.\[\]]+)\s*;')
+_SET = re.compile(r'pm\.environment\.set\(\s*"([^"]+)"\s*,\s*(.+?)\)\s*;')
+_RANDOM = re.compile(r'^"([^"]*)"\s*\+\s*Math\.floor\(\s*Math\.random\(\)\s*\*\s*(\d+)\s*\)$')
+_PATH_PART = re.compile(r'\.?(\w+)|\[(\d+)\]')
+
+
+# --- ĐỌC COLLECTION ---
+def _parse_path(expression):
+    """'jsonData.data[0].id' -> ['data', 0, 'id'] (bỏ tên biến gốc)."""
+    parts = []
+    for name, index in _PATH_PART.findall(expression):
+        parts.append(int(index) if index else name)
+    return parts[1:]
+
+
+def _parse_script(lines):
+    """Trích status mong đợi, biến lấy từ response và biến sinh ngẫu nhiên từ script Postman."""
+    expected_status, captures, generators = None, {}, {}
+    aliases = {'jsonData': []}  # Biến JS -> đường dẫn trong JSON response
+    randoms = {}                # Biến JS -> (tiền tố, cận trên)
+    for line in lines:
+        match = _STATUS.search(line)
+        if match:
+            expected_status = int(match.group(1))
+        match = _ALIAS.search(line)
+        if match and re.match(r'\w+', match.group(2)).group(0) in aliases:
+            root = re.match(r'\w+', match.group(2)).group(0)
+            aliases[match.group(1)] = aliases[root] + _parse_path(match.group(2))
+        match = re.search(r'var\s+(\w+)\s*=\s*(.+?);', line)
+        if match and _RANDOM.match(match.group(2).strip()):
+            prefix, bound = _RANDOM.match(match.group(2).strip()).groups()
+            randoms[match.group(1)] = (prefix, int(bound))
+        for key, expression in _SET.findall(line):
+            expression = expression.strip()
+            root = re.match(r'\w+', expression)
+            if root and root.group(0) in aliases:
+                captures[key] = aliases[root.group(0)] + _parse_path(expression)
+            elif root and root.group(0) in randoms:
+                generators[key] = randoms[root.group(0)]
+            elif _RANDOM.match(expression):
+                prefix, bound = _RANDOM.match(expression).groups()
+                generators[key] = (prefix, int(bound))
+    return expected_status, captures, generators
+
+
+def load_collection(path):
+    """Danh sách request phẳng (thư mục được duỗi ra theo thứ tự)."""
+    with open(path, encoding='utf-8') as f:
+        collection = json.load(f)
+
+    steps = []
+
+    def walk(items):
+        for item in items:
+            if 'item' in item:
+                walk(item['item'])
+                continue
+            request = item['request']
+            url = request['url'] if isinstance(request['url'], str) else request['url'].get('raw', '')
+            scripts = {event['listen']: event.get('script', {}).get('exec', []) for event in item.get('event', [])}
+            expected_status, captures, _ = _parse_script(scripts.get('test', []))
+            _, _, generators = _parse_script(scripts.get('prerequest', []))
+            body = request.get('body') or {}
+            steps.append({
+                'name': item['name'],
+                'method': request['method'],
+                'url': url,
+                'headers': {h['key']: h['value'] for h in request.get('header', []) if not h.get('disabled')},
+                'body': body.get('raw') if body.get('mode') == 'raw' else None,
+                'expected_status': expected_status,
+                'captures': captures,
+                'generators': generators,
+            })
+
+    walk(collection['item'])
+    return steps
+
+
+def load_environment(path):
+    with open(path, encoding='utf-8') as f:
+        environment = json.load(f)
+    return {v['key']: v['value'] for v in environment.get('values', []) if v.get('enabled', True)}
+
+
+# --- THAY BIẾN ---
+def _dynamic(name):
+    if name == '$guid':
+        return str(uuid.uuid4())
+    if name == '$timestamp':
+        return str(int(time.time()))
+    if name == '$randomInt':
+        return str(random.randint(0, 1000))
+    return None
+
+
+def substitute(text, variables):
+    if text is None:
+        return None
+
+    def replace(match):
+        name = match.group(1)
+        value = variables.get(name)
+        if value is None:
+            value = _dynamic(name)
+        return match.group(0) if value is None else str(value)
+
+    return _VARIABLE.sub(replace, text)
+
+
+def _json(raw):
+    try:
+        return json.loads(raw)
+    except (TypeError, ValueError):
+        return None
+
+
+def _extract(data, path):
+    """Giá trị tại path, None nếu response không có (ví dụ body lỗi của 401/404)."""
+    for part in path:
+        if isinstance(part, int):
+            if not isinstance(data, list) or part >= len(data):
+                return None
+        elif not isinstance(data, dict) or part not in data:
+            return None
+        data = data[part]
+    return data
+
+
+# --- GỬI REQUEST ---
+class RateLimiter:
+    """Giới hạn tổng số request/giây của mọi worker (chia đều thời điểm gửi)."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class VirtualUser:
+    """Một người dùng ảo: bộ biến riêng và một kết nối keep-alive cho mỗi host."""
+
+    def __init__(self, variables, timeout):
+        self.variables = dict(variables)
+        self.timeout = timeout
+        self._connections = {}
+        self._session = None  # Refresh token lấy từ response đăng nhập (nếu API có)
+
+    def _connection(self, scheme, netloc):
+        key = (scheme, netloc)
+        connection = self._connections.get(key)
+        if connection is None:
+            cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            connection = self._connections[key] = cls(netloc, timeout=self.timeout)
+        return connection
+
+    def close(self):
+        for connection in self._connections.values():
+            connection.close()
+
+    def run(self, step):
+        """Gửi một request; trả về (giây, status hoặc None, lỗi hoặc None)."""
+        for key, (prefix, bound) in step['generators'].items():
+            self.variables[key] = f'{prefix}{random.randrange(bound)}'
+        url = urlsplit(substitute(step['url'], self.variables))
+        path = url.path + (f'?{url.query}' if url.query else '')
+        headers = {k: substitute(v, self.variables) for k, v in step['headers'].items()}
+        body = substitute(step['body'], self.variables)
+        payload = body.encode('utf-8') if body is not None else None
+
+        elapsed, status, raw, error = self._send(step['method'], url, path, payload, headers)
+        if status is None:
+            return elapsed, None, error
+        if step['expected_status'] and status != step['expected_status']:
+            error = f"status {status} != {step['expected_status']}"
+        if step['captures']:
+            data = _json(raw)
+            for key, json_path in step['captures'].items():
+                value = _extract(data, json_path)
+                if value is not None:
+                    self.variables[key] = value
+            if status == 200 and isinstance(data, dict) and data.get('refresh_token') and data.get('expires_in'):
+                self._remember_session(step, url, data)
+        return elapsed, status, error
+
+    def _send(self, method, url, path, payload, headers):
+        """Trả về (giây, status, body, lỗi); status None khi lỗi kết nối."""
+        connection = self._connection(url.scheme, url.netloc)
+        started = time.perf_counter()
+        try:
+            connection.request(method, path, body=payload, headers=headers)
+            response = connection.getresponse()
+            raw = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            connection.close()  # Mở lại ở lần sau
+            return time.perf_counter() - started, None, None, f'{type(e).__name__}: {e}'
+        return time.perf_counter() - started, response.status, raw, None
+
+    def _remember_session(self, step, url, data):
+        """Ghi nhớ refresh token của response đăng nhập/refresh; route refresh nằm cạnh route đăng nhập."""
+        self._session = {
+            'url': url._replace(path=url.path.rsplit('/', 1)[0] + '/token/refresh', query=''),
+            'refresh_token': data['refresh_token'],
+            'expires_at': time.monotonic() + data['expires_in'],
+            'token_keys': [key for key, json_path in step['captures'].items() if json_path == ['token']],
+        }
+
+    def refresh_due(self):
+        session = self._session
+        return session is not None and session['expires_at'] - time.monotonic() < REFRESH_MARGIN_S
+
+    def refresh(self):
+        """Đổi access token bằng refresh token; trả về (giây, lỗi) giống run()."""
+        session = self._session
+        payload = json.dumps({'refresh_token': session['refresh_token']}).encode('utf-8')
+        elapsed, status, raw, error = self._send('POST', session['url'], session['url'].path, payload,
+                                                 {'Content-Type': 'application/json'})
+        data = _json(raw)
+        if status == 200 and isinstance(data, dict) and data.get('token'):
+            for key in session['token_keys']:
+                self.variables[key] = data['token']
+            session.update(refresh_token=data['refresh_token'], expires_at=time.monotonic() + data['expires_in'])
+        elif status is not None:
+            # Refresh token không còn dùng được: thôi refresh, các request sau sẽ báo 401
+            self._session = None
+            error = f'status {status} != 200'
+        return elapsed, error
+
+
+# --- CHẠY ---
+def run_load(steps, variables, concurrency, iterations=None, duration=None, rate=None, setup_count=2,
+             timeout=10.0):
+    setup_steps, loop_steps = steps[:setup_count], steps[setup_count:]
+    limiter = RateLimiter(rate)
+    samples = defaultdict(list)  # Tên request -> danh sách (giây, lỗi)
+    lock = threading.Lock()
+
+    def record(name, elapsed, error):
+        with lock:
+            samples[name].append((elapsed, error))
+
+    def worker():
+        user = VirtualUser(variables, timeout)
+        try:
+            for step in setup_steps:
+                limiter.wait()
+                elapsed, _, error = user.run(step)
+                record(step['name'], elapsed, error)
+            # --duration tính cho phần lặp, không tính thời gian đăng ký/đăng nhập (bcrypt)
+            deadline = time.monotonic() + duration if duration else None
+            done = 0
+            while loop_steps:
+                if iterations is not None and done >= iterations:
+                    break
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                for step in loop_steps:
+                    if user.refresh_due():
+                        limiter.wait()
+                        record(REFRESH_STEP['name'], *user.refresh())
+                    limiter.wait()
+                    elapsed, _, error = user.run(step)
+                    record(step['name'], elapsed, error)
+                done += 1
+        finally:
+            user.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    wall = time.perf_counter() - started
+    return summarize(steps + [REFRESH_STEP], samples, wall, concurrency, rate)
+
+
+def percentile(sorted_values, p):
+    """Percentile kiểu nearest-rank."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(steps, samples, wall, concurrency, rate):
+    requests = {}
+    total = 0
+    for step in steps:
+        entries = samples.get(step['name'], [])
+        if not entries:
+            continue
+        timings = sorted(elapsed * 1000 for elapsed, _ in entries)
+        errors = [error for _, error in entries if error]
+        total += len(entries)
+        requests[step['name']] = {
+            'method': step['method'],
+            'count': len(entries),
+            'errors': len(errors),
+            'error_samples': sorted(set(errors))[:5],
+            'rps': round(len(entries) / wall, 2),
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'p99_ms': round(percentile(timings, 99), 2),
+            'max_ms': round(timings[-1], 2),
+        }
+    return {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'concurrency': concurrency,
+        'rate_limit': rate,
+        'duration_s': round(wall, 2),
+        'total_requests': total,
+        'throughput_rps': round(total / wall, 2) if wall else 0,
+        'requests': requests,
+    }
+
+
+# --- REPORT ---
+def latest_report(report_dir):
+    paths = sorted(glob.glob(os.path.join(report_dir, 'load_*.json')))
+    if not paths:
+        return None, None
+    with open(paths[-1], encoding='utf-8') as f:
+        return paths[-1], json.load(f)
+
+
+def _change(current, previous):
+    if not previous:
+        return ''
+    return f'{(current / previous - 1):+.0%}'
+
+
+def print_report(report, previous=None):
+    previous_requests = (previous or {}).get('requests', {})
+    print(f"\n{report['total_requests']} request trong {report['duration_s']}s, "
+          f"{report['throughput_rps']} req/s ({_change(report['throughput_rps'], (previous or {}).get('throughput_rps')) or 'chưa có report trước'})")
+    header = f"{'request':<28} {'count':>6} {'err':>5} {'rps':>8} {'p50':>9} {'p95':>9} {'p99':>9}  Δp50   Δp95   Δp99"
+    print(header)
+    print('-' * len(header))
+    for name, stats in report['requests'].items():
+        old = previous_requests.get(name, {})
+        print(f"{name[:28]:<28} {stats['count']:>6} {stats['errors']:>5} {stats['rps']:>8} "
+              f"{stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9}  "
+              f"{_change(stats['p50_ms'], old.get('p50_ms')):>5}  {_change(stats['p95_ms'], old.get('p95_ms')):>5}  "
+              f"{_change(stats['p99_ms'], old.get('p99_ms')):>5}")
+        for sample in stats['error_samples']:
+            print(f"    ! {sample}")
+
+
+def save_report(report, report_dir):
+    os.makedirs(report_dir, exist_ok=True)
+    path = os.path.join(report_dir, f"load_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Phát lại Postman collection như một bài load test.')
+    parser.add_argument('--collection', default=DEFAULT_COLLECTION)
+    parser.add_argument('--environment', default=DEFAULT_ENVIRONMENT)
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE', help='Ghi đè biến environment')
+    parser.add_argument('--concurrency', type=int, default=10, help='Số người dùng ảo chạy song song')
+    parser.add_argument('--iterations', type=int, help='Số vòng lặp mỗi người dùng ảo (mặc định 10 nếu không có --duration)')
+    parser.add_argument('--duration', type=float, help='Chạy trong bao nhiêu giây')
+    parser.add_argument('--rate', type=float, help='Tổng số request/giây tối đa (mặc định không giới hạn)')
+    parser.add_argument('--setup-count', type=int, default=2,
+                        help='Số request đầu collection chỉ chạy một lần mỗi người dùng ảo (đăng ký, đăng nhập)')
+    parser.add_argument('--only', action='append', default=[], help='Chỉ lặp lại request có tên này (lặp lại được)')
+    parser.add_argument('--timeout', type=float, default=10.0)
+    parser.add_argument('--report-dir', default=DEFAULT_REPORT_DIR)
+    parser.add_argument('--no-save', action='store_true', help='Không ghi report (vẫn so với report trước)')
+    args = parser.parse_args(argv)
+
+    steps = load_collection(args.collection)
+    if args.only:
+        setup = steps[:args.setup_count]
+        steps = setup + [s for s in steps[args.setup_count:] if s['name'] in args.only]
+    variables = load_environment(args.environment)
+    for item in args.env:
+        key, _, value = item.partition('=')
+        variables[key] = value
+
+    iterations = args.iterations if args.iterations or args.duration else 10
+    report = run_load(steps, variables, args.concurrency, iterations, args.duration, args.rate,
+                      args.setup_count, args.timeout)
+    previous_path, previous = latest_report(args.report_dir)
+    if previous_path:
+        print(f'So với {os.path.relpath(previous_path)}')
+    print_report(report, previous)
+    if not args.no_save:
+        print(f'\nĐã ghi {os.path.relpath(save_report(report, args.report_dir))}')
+    return 1 if any(stats['errors'] for stats in report['requests'].values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""
+Logging không chặn request: handler chỉ đẩy record vào queue, một thread nền
+(QueueListener) format thành JSON và ghi ra stdout/file.
+
+Biến môi trường:
+    LOG_LEVEL          Level gốc (mặc định INFO)
+    LOG_LEVELS         Level theo logger, ví dụ "slow_query=WARNING,werkzeug=ERROR"
+    LOG_SAMPLE_RATES   Tỉ lệ giữ log dưới WARNING theo route, ví dụ "/api/v2/books=0.1,/api/books=0.1"
+    LOG_QUEUE_SIZE     Số record tối đa chờ ghi, đầy thì bỏ bớt (mặc định 10000)
+    LOG_FILE           Ghi ra file thay vì stdout
+
+Mỗi record JSON có: ts, level, logger, msg, request_id, method, route và các
+field truyền qua extra={...}.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import uuid
+from datetime import datetime, timezone
+
+from flask import g, has_request_context, request
+
+# Các thuộc tính chuẩn của LogRecord, không đưa vào JSON như field "extra"
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+# Level mặc định cho các logger quá ồn trên đường đi của request (LOG_LEVELS ghi đè được)
+DEFAULT_LEVELS = {'flask_caching': 'WARNING'}
+
+_listener = None
+
+
+def _parse_pairs(value, cast):
+    result = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            key, raw = item.rsplit('=', 1)
+            result[key.strip()] = cast(raw.strip())
+    return result
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exc'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """Gắn request_id/method/route và lấy mẫu log theo route (chạy trên thread của request)."""
+
+    def __init__(self, sample_rates=None):
+        super().__init__()
+        self.sample_rates = sample_rates or {}
+
+    def filter(self, record):
+        if not has_request_context():
+            return True
+        route = request.url_rule.rule if request.url_rule else request.path
+        record.request_id = g.get('request_id')
+        record.method = request.method
+        record.route = route
+        if record.levelno < logging.WARNING:
+            rate = self.sample_rates.get(route)
+            if rate is not None and random.random() >= rate:
+                return False
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue đầy thì bỏ record (và đếm) thay vì chặn request."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Format message ngay trên thread gửi (args có thể thay đổi sau đó),
+        # phần dựng JSON để thread nền làm
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure():
+    """Cài QueueHandler cho root logger (gọi một lần khi app khởi động)."""
+    global _listener
+    if _listener is not None:
+        return
+
+    log_file = os.getenv('LOG_FILE')
+    output = logging.FileHandler(log_file, encoding='utf-8') if log_file else logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+
+    log_queue = queue.Queue(maxsize=int(os.getenv('LOG_QUEUE_SIZE', 10000)))
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(RequestContextFilter(_parse_pairs(os.getenv('LOG_SAMPLE_RATES'), float)))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    for name, level in {**DEFAULT_LEVELS, **_parse_pairs(os.getenv('LOG_LEVELS'), str)}.items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def init_app(app):
+    """Gán request_id cho mỗi request (lấy từ X-Request-ID nếu có) và trả lại trong response."""
+
+    @app.before_request
+    def _assign_request_id():
+        g.request_id = request.headers.get('X-Request-ID', '')[:64] or uuid.uuid4().hex
+
+    @app.after_request
+    def _echo_request_id(response):
+        response.headers['X-Request-ID'] = g.get('request_id', '')
+        return response
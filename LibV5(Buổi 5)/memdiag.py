@@ -0,0 +1,255 @@
+"""
+Chẩn đoán bộ nhớ cho worker chạy lâu (chỉ admin).
+
+    POST /memory/tracemalloc/start?frames=10   Bật tracemalloc (tốn thêm CPU/RAM, chỉ bật khi cần)
+    POST /memory/tracemalloc/stop
+    POST /memory/snapshots                     Chụp snapshot, trả về id
+    GET  /memory/snapshots/<id>/top            Các vị trí cấp phát nhiều nhất
+    GET  /memory/diff?from=<id>&to=<id>        So sánh hai snapshot (chỗ nào đang phình ra)
+    GET  /memory/caches                        Số phần tử và kích thước ước tính của từng cache
+
+Blueprint được tạo bằng create_blueprint(...) để mỗi app tự truyền decorator xác thực
+và danh sách cache của nó.
+"""
+import gc
+import itertools
+import os
+import sys
+import threading
+import tracemalloc
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Blueprint, jsonify, request
+
+MAX_SNAPSHOTS = 5  # Snapshot khá nặng, chỉ giữ vài cái gần nhất
+MAX_FRAMES = 65535  # Giới hạn của tracemalloc.start()
+GROUP_BY = ('lineno', 'filename', 'traceback')
+
+_snapshots = OrderedDict()
+_snapshot_ids = itertools.count(1)
+_lock = threading.Lock()
+
+
+def deep_sizeof(obj, max_objects=100000):
+    """Ước tính kích thước (bytes) của obj và mọi thứ nó chứa, mỗi object chỉ đếm một lần."""
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack and len(seen) < max_objects:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)) or type(current).__name__ == 'deque':
+            stack.extend(current)
+        elif hasattr(current, '__dict__') and not isinstance(current, type):
+            stack.append(current.__dict__)
+    return total
+
+
+def simple_cache_stats(cache):
+    """Số liệu cho flask_caching Cache dùng backend SimpleCache (giá trị đã được pickle)."""
+    backend = getattr(cache, 'cache', None)
+    store = getattr(backend, '_cache', None)
+    if store is None:
+        return {'backend': type(backend).__name__, 'supported': False}
+    items = list(store.items())  # Bản sao: request khác có thể đang thêm/xóa key
+    value_bytes = sum(len(value) for _, (_, value) in items if isinstance(value, (bytes, bytearray)))
+    return {
+        'backend': type(backend).__name__,
+        'entries': len(items),
+        'threshold': getattr(backend, '_threshold', None),
+        'value_bytes': value_bytes,
+        'resident_bytes': deep_sizeof(dict(items)),
+    }
+
+
+def container_stats(container):
+    """Số liệu cho một container Python bất kỳ (list, dict, deque...), đo trên bản sao của nó."""
+    snapshot = dict(container) if isinstance(container, dict) else list(container)
+    return {'entries': len(snapshot), 'resident_bytes': deep_sizeof(snapshot)}
+
+
+def _format_stat(stat):
+    frame = stat.traceback[0]
+    return {
+        'file': f'{frame.filename}:{frame.lineno}',
+        'size_kb': round(stat.size / 1024, 1),
+        'count': stat.count,
+        'traceback': [f'{f.filename}:{f.lineno}' for f in stat.traceback] if len(stat.traceback) > 1 else None,
+    }
+
+
+def _format_diff(stat):
+    frame = stat.traceback[0]
+    return {
+        'file': f'{frame.filename}:{frame.lineno}',
+        'size_diff_kb': round(stat.size_diff / 1024, 1),
+        'size_kb': round(stat.size / 1024, 1),
+        'count_diff': stat.count_diff,
+    }
+
+
+def _filtered(snapshot):
+    # Bỏ qua cấp phát của chính tracemalloc/import để kết quả dễ đọc hơn
+    return snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    ))
+
+
+def create_blueprint(name, url_prefix, auth_decorator, caches):
+    """
+    auth_decorator: token_required của app (truyền current_user vào view).
+    caches: {tên: hàm không tham số trả về dict số liệu}.
+    """
+    bp = Blueprint(name, __name__, url_prefix=url_prefix)
+
+    def admin_only(view):
+        @wraps(view)
+        def wrapped(current_user, *args, **kwargs):
+            if 'admin' not in current_user.roles:
+                return jsonify({'error': 'Chỉ admin được xem thông tin bộ nhớ'}), 403
+            return view(*args, **kwargs)
+        return auth_decorator(wrapped)
+
+    @bp.route('/tracemalloc/start', methods=['POST'])
+    @admin_only
+    def start_tracemalloc():
+        """
+        Bật tracemalloc
+        ---
+        tags: [Admin Memory]
+        security:
+          - APIKeyHeader: []
+        parameters:
+          - {name: frames, in: query, type: integer, default: 10}
+        responses:
+          200: {description: Đã bật.}
+          400: {description: frames không hợp lệ.}
+        """
+        frames = request.args.get('frames', 10, type=int)
+        if not 1 <= frames <= MAX_FRAMES:
+            return jsonify({'error': f"'frames' phải trong khoảng 1 - {MAX_FRAMES}"}), 400
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        return jsonify({'tracing': True, 'frames': tracemalloc.get_traceback_limit()})
+
+    @bp.route('/tracemalloc/stop', methods=['POST'])
+    @admin_only
+    def stop_tracemalloc():
+        """
+        Tắt tracemalloc và xóa các snapshot
+        ---
+        tags: [Admin Memory]
+        security:
+          - APIKeyHeader: []
+        responses:
+          200: {description: Đã tắt.}
+        """
+        tracemalloc.stop()
+        with _lock:
+            _snapshots.clear()
+        return jsonify({'tracing': False})
+
+    @bp.route('/snapshots', methods=['POST'])
+    @admin_only
+    def take_snapshot():
+        """
+        Chụp một snapshot tracemalloc
+        ---
+        tags: [Admin Memory]
+        security:
+          - APIKeyHeader: []
+        responses:
+          201: {description: Id của snapshot.}
+          409: {description: tracemalloc chưa được bật.}
+        """
+        if not tracemalloc.is_tracing():
+            return jsonify({'error': 'tracemalloc chưa được bật'}), 409
+        gc.collect()
+        snapshot = _filtered(tracemalloc.take_snapshot())
+        current, peak = tracemalloc.get_traced_memory()
+        with _lock:
+            snapshot_id = next(_snapshot_ids)
+            _snapshots[snapshot_id] = snapshot
+            while len(_snapshots) > MAX_SNAPSHOTS:
+                _snapshots.popitem(last=False)
+        return jsonify({'id': snapshot_id, 'pid': os.getpid(),
+                        'traced_kb': round(current / 1024, 1), 'peak_kb': round(peak / 1024, 1)}), 201
+
+    @bp.route('/snapshots/<int:snapshot_id>/top', methods=['GET'])
+    @admin_only
+    def snapshot_top(snapshot_id):
+        """
+        Các vị trí cấp phát nhiều nhất của một snapshot
+        ---
+        tags: [Admin Memory]
+        security:
+          - APIKeyHeader: []
+        parameters:
+          - {name: snapshot_id, in: path, type: integer, required: true}
+          - {name: limit, in: query, type: integer, default: 20}
+          - {name: group_by, in: query, type: string, enum: [lineno, filename, traceback], default: lineno}
+        responses:
+          200: {description: Top cấp phát.}
+          400: {description: group_by không hợp lệ.}
+          404: {description: Không có snapshot.}
+        """
+        group_by = request.args.get('group_by', 'lineno')
+        if group_by not in GROUP_BY:
+            return jsonify({'error': f"'group_by' phải là một trong {', '.join(GROUP_BY)}"}), 400
+        snapshot = _snapshots.get(snapshot_id)
+        if snapshot is None:
+            return jsonify({'error': 'Không tìm thấy snapshot'}), 404
+        limit = request.args.get('limit', 20, type=int)
+        stats = snapshot.statistics(group_by)
+        return jsonify({'id': snapshot_id, 'top': [_format_stat(s) for s in stats[:limit]]})
+
+    @bp.route('/diff', methods=['GET'])
+    @admin_only
+    def snapshot_diff():
+        """
+        So sánh hai snapshot
+        ---
+        tags: [Admin Memory]
+        security:
+          - APIKeyHeader: []
+        parameters:
+          - {name: from, in: query, type: integer, required: true}
+          - {name: to, in: query, type: integer, required: true}
+          - {name: limit, in: query, type: integer, default: 20}
+        responses:
+          200: {description: Các vị trí tăng/giảm nhiều nhất.}
+          404: {description: Không có snapshot.}
+        """
+        older = _snapshots.get(request.args.get('from', type=int))
+        newer = _snapshots.get(request.args.get('to', type=int))
+        if older is None or newer is None:
+            return jsonify({'error': 'Không tìm thấy snapshot'}), 404
+        limit = request.args.get('limit', 20, type=int)
+        stats = newer.compare_to(older, 'lineno')
+        return jsonify({'diff': [_format_diff(s) for s in stats[:limit]],
+                        'total_diff_kb': round(sum(s.size_diff for s in stats) / 1024, 1)})
+
+    @bp.route('/caches', methods=['GET'])
+    @admin_only
+    def cache_sizes():
+        """
+        Số phần tử và kích thước ước tính của các cache trong process
+        ---
+        tags: [Admin Memory]
+        security:
+          - APIKeyHeader: []
+        responses:
+          200: {description: Số liệu từng cache.}
+        """
+        return jsonify({'pid': os.getpid(), 'caches': {cache_name: stats() for cache_name, stats in caches.items()}})
+
+    return bp
@@ -0,0 +1,300 @@
+"""
+Metrics dạng Prometheus (text exposition format 0.0.4) cho app Flask, phục vụ tại /metrics.
+
+Được ghi nhận:
+    http_requests_total{method,route,blueprint,status}
+    http_request_duration_seconds{method,route,blueprint}      (histogram)
+    http_response_size_bytes{method,route,blueprint}           (histogram)
+    cache_requests_total{route,result="hit|miss"}
+    mongodb_command_duration_seconds{command,outcome}          (histogram)
+    library_borrows_total, library_returns_total
+    password_hash_rejected_total
+    mongodb_pool_*                                             (đọc từ mongo_pool lúc scrape)
+
+Chạy nhiều worker (gunicorn -w N): đặt METRICS_MULTIPROC_DIR tới một thư mục dùng
+chung. Mỗi worker định kỳ ghi số liệu của mình ra <dir>/<pid>.json (thread nền,
+không nằm trên đường đi của request) và /metrics cộng dồn tất cả các file.
+Xóa thư mục này mỗi lần deploy lại, nếu không số liệu của các worker cũ vẫn được cộng vào.
+Đặt METRICS_TOKEN để yêu cầu header "Authorization: Bearer <token>" khi scrape.
+"""
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+from flask import Response, g, request
+from pymongo import monitoring
+
+import mongo_pool
+import request_timing
+
+log = logging.getLogger('metrics')
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000)
+DB_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        """Bản sao {labels: giá trị}, lấy dưới lock của metric."""
+        with self._lock:
+            return {labels: list(value) if isinstance(value, list) else value
+                    for labels, value in self._values.items()}
+
+    def dump(self):
+        with self._lock:
+            values = [[list(labels), value if not isinstance(value, list) else list(value)]
+                      for labels, value in self._values.items()]
+        return {'type': self.kind, 'help': self.documentation, 'labels': list(self.labelnames),
+                'buckets': list(getattr(self, 'buckets', ())), 'values': values}
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        # Lưu dạng [đếm từng bucket (không cộng dồn)..., +Inf, sum, count]
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * (len(self.buckets) + 3)
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def dump(self):
+        return {m.name: m.dump() for m in self._metrics}
+
+    def series(self):
+        """{tên metric: {labels: giá trị}} đang giữ trong process (bản sao, an toàn khi request khác đang ghi)."""
+        return {m.name: m.snapshot() for m in self._metrics}
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    'http_requests_total', 'Số request HTTP đã xử lý.', ('method', 'route', 'blueprint', 'status'))
+http_latency = registry.histogram(
+    'http_request_duration_seconds', 'Thời gian xử lý request.', ('method', 'route', 'blueprint'))
+http_response_size = registry.histogram(
+    'http_response_size_bytes', 'Kích thước body của response.', ('method', 'route', 'blueprint'), SIZE_BUCKETS)
+cache_requests = registry.counter(
+    'cache_requests_total', 'Số lần tra cache của các route có cache.', ('route', 'result'))
+db_commands = registry.histogram(
+    'mongodb_command_duration_seconds', 'Thời gian các lệnh MongoDB.', ('command', 'outcome'), DB_BUCKETS)
+borrows = registry.counter('library_borrows_total', 'Số lượt mượn sách thành công.')
+returns = registry.counter('library_returns_total', 'Số lượt trả sách thành công.')
+password_hash_rejected = registry.counter(
+    'password_hash_rejected_total', 'Số lần đăng nhập/đăng ký bị từ chối (503) vì pool bcrypt quá tải.')
+
+
+class MetricsCommandListener(monitoring.CommandListener):
+    """Đưa thời gian mỗi lệnh MongoDB vào histogram mongodb_command_duration_seconds."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        db_commands.observe(event.duration_micros / 1e6, event.command_name, 'ok')
+
+    def failed(self, event):
+        db_commands.observe(event.duration_micros / 1e6, event.command_name, 'error')
+
+
+command_listener = MetricsCommandListener()
+
+
+# --- GỘP SỐ LIỆU NHIỀU WORKER ---
+def _merge(target, dumped):
+    for name, metric in dumped.items():
+        merged = target.setdefault(name, {**metric, 'values': {}})
+        for labels, value in metric['values']:
+            key = tuple(labels)
+            if isinstance(value, list):
+                current = merged['values'].get(key)
+                merged['values'][key] = value if current is None else [a + b for a, b in zip(current, value)]
+            else:
+                merged['values'][key] = merged['values'].get(key, 0) + value
+
+
+def _multiproc_dir():
+    return os.getenv('METRICS_MULTIPROC_DIR')
+
+
+def write_process_file():
+    """Ghi số liệu của process hiện tại ra <METRICS_MULTIPROC_DIR>/<pid>.json."""
+    directory = _multiproc_dir()
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{os.getpid()}.json')
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(registry.dump(), f)
+    os.replace(tmp_path, path)
+
+
+def _start_flusher(interval):
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                write_process_file()
+            except OSError as e:
+                log.warning('Không ghi được file metrics: %s', e)
+
+    threading.Thread(target=loop, name='metrics-flusher', daemon=True).start()
+    atexit.register(write_process_file)
+
+
+def collect():
+    """Số liệu đã gộp của mọi worker (hoặc chỉ process này nếu không chạy multiprocess)."""
+    merged = {}
+    directory = _multiproc_dir()
+    if directory:
+        write_process_file()
+        for path in glob.glob(os.path.join(directory, '*.json')):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    _merge(merged, json.load(f))
+            except (OSError, ValueError):
+                continue  # File đang được ghi dở hoặc đã bị xóa
+    else:
+        _merge(merged, registry.dump())
+    return merged
+
+
+# --- XUẤT RA TEXT FORMAT ---
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value):
+    if isinstance(value, float):
+        return repr(value) if value != int(value) else str(int(value))
+    return str(value)
+
+
+def render(merged):
+    lines = []
+    for name, metric in merged.items():
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        names = metric['labels']
+        for labels, value in sorted(metric['values'].items()):
+            if metric['type'] == 'histogram':
+                cumulative = 0
+                for bound, count in zip(metric['buckets'] + ['+Inf'], value[:-2]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(names, labels, ('le', bound))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(names, labels)} {_format_number(value[-2])}")
+                lines.append(f"{name}_count{_format_labels(names, labels)} {value[-1]}")
+            else:
+                lines.append(f"{name}{_format_labels(names, labels)} {_format_number(value)}")
+    lines.extend(_pool_lines())
+    return '\n'.join(lines) + '\n'
+
+
+def _pool_lines():
+    """Gauge của connection pool, theo từng process (label pid)."""
+    snapshot = mongo_pool.pool_stats.snapshot()
+    pid = f'{{pid="{snapshot["pid"]}"}}'
+    gauges = (
+        ('mongodb_pool_connections_in_use', 'gauge', snapshot['in_use']),
+        ('mongodb_pool_connections_open', 'gauge', snapshot['connections_open']),
+        ('mongodb_pool_exhausted_total', 'counter', snapshot['exhausted']),
+        ('mongodb_pool_checkouts_total', 'counter', snapshot['checkout']['count']),
+    )
+    lines = []
+    for name, kind, value in gauges:
+        lines.append(f'# TYPE {name} {kind}')
+        lines.append(f'{name}{pid} {value}')
+    return lines
+
+
+# --- FLASK ---
+def init_app(app):
+    """Đăng ký hook đo mọi request và route /metrics."""
+
+    @app.before_request
+    def _start_metrics_timer():
+        g._metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request_metrics(response):
+        started = g.pop('_metrics_started', None)
+        if started is None:
+            return response
+        rule = request.url_rule.rule if request.url_rule else '<unmatched>'
+        blueprint = request.blueprint or ''
+        http_requests.inc(request.method, rule, blueprint, str(response.status_code))
+        http_latency.observe(time.perf_counter() - started, request.method, rule, blueprint)
+        size = response.calculate_content_length()
+        if size is not None:
+            http_response_size.observe(size, request.method, rule, blueprint)
+        timing = request_timing.current()
+        if timing is not None and timing.cache_hit is not None:
+            cache_requests.inc(rule, 'hit' if timing.cache_hit else 'miss')
+        return response
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        token = os.getenv('METRICS_TOKEN')
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            return Response('forbidden\n', status=403, mimetype='text/plain')
+        return Response(render(collect()), content_type=CONTENT_TYPE)
+
+    if _multiproc_dir():
+        _start_flusher(float(os.getenv('METRICS_FLUSH_SECONDS', 5)))
@@ -0,0 +1,175 @@
+"""
+Cấu hình connection pool của MongoDB và theo dõi hoạt động của pool.
+
+Các tham số được đọc từ biến môi trường (có thể đặt trong .env):
+
+    MONGO_MAX_POOL_SIZE                 Số kết nối tối đa mỗi process (mặc định 50)
+    MONGO_MIN_POOL_SIZE                 Số kết nối luôn giữ sẵn (mặc định 5)
+    MONGO_MAX_IDLE_TIME_MS              Đóng kết nối rảnh quá lâu (mặc định 60000)
+    MONGO_WAIT_QUEUE_TIMEOUT_MS         Thời gian chờ lấy kết nối khi pool đầy (mặc định 2000)
+    MONGO_SERVER_SELECTION_TIMEOUT_MS   (mặc định 3000)
+    MONGO_CONNECT_TIMEOUT_MS            (mặc định 2000)
+    MONGO_SOCKET_TIMEOUT_MS             (mặc định 5000)
+    MONGO_TIMEOUT_MS                    Timeout cho mỗi thao tác, 0 = tắt (mặc định 0)
+
+Khi chọn số worker/thread, nên giữ: threads mỗi process <= MONGO_MAX_POOL_SIZE.
+"""
+import os
+import threading
+import time
+
+from pymongo import monitoring
+
+# Biên của histogram thời gian lấy kết nối (ms)
+CHECKOUT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2000)
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, '') else default
+
+
+def pool_settings():
+    """Đọc cấu hình pool từ biến môi trường."""
+    return {
+        'maxPoolSize': _env_int('MONGO_MAX_POOL_SIZE', 50),
+        'minPoolSize': _env_int('MONGO_MIN_POOL_SIZE', 5),
+        'maxIdleTimeMS': _env_int('MONGO_MAX_IDLE_TIME_MS', 60000),
+        'waitQueueTimeoutMS': _env_int('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000),
+        'serverSelectionTimeoutMS': _env_int('MONGO_SERVER_SELECTION_TIMEOUT_MS', 3000),
+        'connectTimeoutMS': _env_int('MONGO_CONNECT_TIMEOUT_MS', 2000),
+        'socketTimeoutMS': _env_int('MONGO_SOCKET_TIMEOUT_MS', 5000),
+        'timeoutMS': _env_int('MONGO_TIMEOUT_MS', 0) or None,
+    }
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Đếm sự kiện của pool: thời gian checkout, pool cạn kết nối, kết nối tạo/đóng."""
+
+    def __init__(self, max_pool_size=None):
+        self.max_pool_size = max_pool_size
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.checkout_failures = {}
+            self.checkout_time_ms_sum = 0.0
+            self.checkout_time_ms_max = 0.0
+            self.checkout_buckets = [0] * (len(CHECKOUT_BUCKETS_MS) + 1)
+            self.in_use = 0  # Tổng mọi pool (replica set: mỗi member một pool)
+            self.in_use_by_address = {}  # (host, port) -> số kết nối đang mượn của pool đó
+            self.in_use_peak = 0
+            self.exhausted = 0  # Số lần pool đã hết kết nối rảnh
+            self.connections_open = 0
+            self.connections_created = 0
+            self.connections_closed = {}
+            self.pool_cleared = 0
+
+    # --- Checkout / checkin ---
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        duration = getattr(event, 'duration', None)  # pymongo >= 4.7
+        if duration is not None:
+            elapsed_ms = duration * 1000
+        else:
+            elapsed_ms = (time.perf_counter() - getattr(self._local, 'started', time.perf_counter())) * 1000
+        bucket = len(CHECKOUT_BUCKETS_MS)
+        for i, bound in enumerate(CHECKOUT_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                bucket = i
+                break
+        with self._lock:
+            self.checkouts += 1
+            self.checkout_time_ms_sum += elapsed_ms
+            self.checkout_time_ms_max = max(self.checkout_time_ms_max, elapsed_ms)
+            self.checkout_buckets[bucket] += 1
+            self.in_use += 1
+            self.in_use_peak = max(self.in_use_peak, self.in_use)
+            in_use = self.in_use_by_address.get(event.address, 0) + 1
+            self.in_use_by_address[event.address] = in_use
+            if self.max_pool_size and in_use >= self.max_pool_size:  # maxPoolSize tính theo từng pool
+                self.exhausted += 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures[event.reason] = self.checkout_failures.get(event.reason, 0) + 1
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                self.exhausted += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use = max(0, self.in_use - 1)
+            self.in_use_by_address[event.address] = max(0, self.in_use_by_address.get(event.address, 0) - 1)
+
+    # --- Vòng đời kết nối (churn) ---
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_created += 1
+            self.connections_open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_closed[event.reason] = self.connections_closed.get(event.reason, 0) + 1
+            self.connections_open = max(0, self.connections_open - 1)
+
+    # --- Vòng đời pool ---
+    def pool_created(self, event):
+        if self.max_pool_size is None:
+            self.max_pool_size = (event.options or {}).get('maxPoolSize')
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_cleared += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def snapshot(self):
+        """Trả về dict số liệu hiện tại (dùng cho endpoint admin)."""
+        with self._lock:
+            buckets = {f'le_{bound}ms': count for bound, count in zip(CHECKOUT_BUCKETS_MS, self.checkout_buckets)}
+            buckets['le_inf'] = self.checkout_buckets[-1]
+            return {
+                'pid': os.getpid(),
+                'max_pool_size': self.max_pool_size,
+                'in_use': self.in_use,
+                'in_use_by_address': {f'{host}:{port}': count
+                                      for (host, port), count in self.in_use_by_address.items()},
+                'in_use_peak': self.in_use_peak,
+                'connections_open': self.connections_open,
+                'connections_created': self.connections_created,
+                'connections_closed': dict(self.connections_closed),
+                'pool_cleared': self.pool_cleared,
+                'exhausted': self.exhausted,
+                'checkout': {
+                    'count': self.checkouts,
+                    'failures': dict(self.checkout_failures),
+                    'avg_ms': round(self.checkout_time_ms_sum / self.checkouts, 3) if self.checkouts else 0.0,
+                    'max_ms': round(self.checkout_time_ms_max, 3),
+                    'buckets': buckets,
+                },
+            }
+
+
+# Một listener dùng chung cho cả process
+pool_stats = PoolStats()
+
+
+def connect_kwargs(listeners=()):
+    """Tham số truyền thêm vào mongoengine.connect(): cấu hình pool + các listener."""
+    settings = pool_settings()
+    pool_stats.max_pool_size = settings['maxPoolSize']
+    kwargs = {key: value for key, value in settings.items() if value is not None}
+    kwargs['event_listeners'] = [pool_stats, *listeners]
+    return kwargs
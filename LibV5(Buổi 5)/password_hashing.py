@@ -0,0 +1,132 @@
+"""
+Băm/kiểm tra mật khẩu bcrypt trên một pool thread giới hạn.
+
+bcrypt cố ý chậm (~0.1-0.3s mỗi lần ở cost 10-12). Khi nhiều người đăng nhập cùng lúc,
+mỗi request giữ một thread của server suốt thời gian băm và các request khác phải
+chờ CPU. Module này:
+    - chỉ cho tối đa BCRYPT_WORKERS phép băm chạy song song (mặc định = số CPU),
+      các request khác (đọc sách, mượn/trả) vẫn còn CPU;
+    - giới hạn số phép băm đang chờ (BCRYPT_MAX_PENDING); vượt quá thì trả 503 +
+      Retry-After ngay thay vì để request xếp hàng tới timeout;
+    - cost đọc từ BCRYPT_LOG_ROUNDS (mặc định 12). Khi đổi cost, hash cũ vẫn đăng nhập
+      được và được băm lại với cost mới ngay sau lần đăng nhập thành công (chạy nền).
+
+Biến môi trường:
+    BCRYPT_LOG_ROUNDS    Cost (4-31), mặc định 12
+    BCRYPT_WORKERS       Số thread băm, mặc định số CPU
+    BCRYPT_MAX_PENDING   Số phép băm tối đa đang chạy + chờ, mặc định 4 x BCRYPT_WORKERS
+    BCRYPT_TIMEOUT_S     Thời gian tối đa một request chờ kết quả, mặc định 10
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import bcrypt
+from flask import jsonify
+
+import metrics
+import request_timing
+
+log = logging.getLogger('password_hashing')
+
+
+class HasherBusy(Exception):
+    """Pool băm mật khẩu đang quá tải."""
+
+
+class PasswordHasher:
+    def __init__(self, rounds=12, workers=None, max_pending=None, timeout=10.0):
+        self.rounds = rounds
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+
+    @classmethod
+    def from_env(cls):
+        workers = int(os.getenv('BCRYPT_WORKERS', 0)) or None
+        max_pending = int(os.getenv('BCRYPT_MAX_PENDING', 0)) or None
+        return cls(int(os.getenv('BCRYPT_LOG_ROUNDS', 12)), workers, max_pending,
+                   float(os.getenv('BCRYPT_TIMEOUT_S', 10)))
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            metrics.password_hash_rejected.inc()
+            raise HasherBusy()
+        try:
+            future = self._pool.submit(fn, *args)
+        except RuntimeError:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _run(self, fn, *args):
+        future = self._submit(fn, *args)
+        with request_timing.phase('bcrypt'):
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeout:
+                future.cancel()
+                metrics.password_hash_rejected.inc()
+                raise HasherBusy()
+
+    def _hash(self, password):
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(self.rounds)).decode('utf-8')
+
+    @staticmethod
+    def _check(hashed, password):
+        try:
+            return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+        except ValueError:  # Hash trong DB không phải bcrypt hợp lệ
+            return False
+
+    def hash(self, password):
+        return self._run(self._hash, password)
+
+    def check(self, hashed, password):
+        if not hashed or password is None:
+            return False
+        return self._run(self._check, hashed, password)
+
+    def needs_rehash(self, hashed):
+        """True nếu hash được tạo với cost khác cost hiện tại ($2b$<cost>$...)."""
+        try:
+            return int(hashed.split('$')[2]) != self.rounds
+        except (AttributeError, IndexError, ValueError):
+            return True
+
+    def rehash_in_background(self, hashed, password, save):
+        """Băm lại với cost hiện tại rồi gọi save(new_hash); bỏ qua nếu pool đang bận."""
+        if not self.needs_rehash(hashed):
+            return
+        try:
+            future = self._submit(self._hash, password)
+        except HasherBusy:
+            return  # Lần đăng nhập sau sẽ thử lại
+
+        def done(f):
+            if f.cancelled() or f.exception() is not None:
+                return
+            try:
+                save(f.result())
+            except Exception:
+                log.exception('Không lưu được hash mới')
+
+        future.add_done_callback(done)
+
+
+hasher = PasswordHasher.from_env()
+
+
+def init_app(app):
+    """Trả 503 + Retry-After khi pool băm mật khẩu quá tải."""
+
+    @app.errorhandler(HasherBusy)
+    def _hasher_busy(e):
+        response = jsonify({'message': 'Server đang bận xử lý đăng nhập, vui lòng thử lại sau'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
@@ -0,0 +1,125 @@
+"""
+Profile một request theo yêu cầu, bật bằng header.
+
+Chỉ hoạt động khi PROFILING_ENABLED=1 và PROFILE_ADMIN_TOKEN được đặt. Request cần profile gửi kèm:
+
+    X-Profile: 1
+    X-Profile-Token: <PROFILE_ADMIN_TOKEN>
+
+Kết quả được ghi vào PROFILE_DIR (mặc định ./profiles), tên file theo request id
+(header X-Request-ID), và tên file được trả lại trong header X-Profile-File:
+
+    PROFILE_MODE=sample   (mặc định) lấy mẫu stack mỗi PROFILE_INTERVAL_MS (mặc định 1ms),
+                          ghi file <request_id>.folded dạng "collapsed stack", mở bằng
+                          flamegraph.pl hoặc https://www.speedscope.app
+    PROFILE_MODE=cprofile profiler tất định (cProfile), ghi <request_id>.prof (pstats, snakeviz)
+
+Request không có header X-Profile chỉ tốn một lần tra header; khi tắt tính năng thì không đăng ký hook nào.
+"""
+import cProfile
+import hmac
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+
+_SAFE_NAME = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+class StackSampler:
+    """Profiler thống kê: một thread nền đọc stack của thread đang xử lý request."""
+
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                self.samples[';'.join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+class DeterministicProfiler:
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def write(self, path):
+        self.profile.dump_stats(path)
+
+
+def enabled():
+    return os.getenv('PROFILING_ENABLED', '0').lower() in ('1', 'true', 'yes') and bool(os.getenv('PROFILE_ADMIN_TOKEN'))
+
+
+def init_app(app):
+    if not enabled():
+        return
+    admin_token = os.getenv('PROFILE_ADMIN_TOKEN')
+    mode = os.getenv('PROFILE_MODE', 'sample')
+    interval = float(os.getenv('PROFILE_INTERVAL_MS', 1)) / 1000
+    output_dir = os.getenv('PROFILE_DIR', 'profiles')
+
+    @app.before_request
+    def _start_profile():
+        if request.headers.get('X-Profile') != '1':
+            return
+        # So sánh bytes: compare_digest với str chỉ nhận ASCII, header có ký tự khác sẽ raise TypeError
+        token = request.headers.get('X-Profile-Token', '').encode('utf-8')
+        if not hmac.compare_digest(token, admin_token.encode('utf-8')):
+            return
+        profiler = DeterministicProfiler() if mode == 'cprofile' else StackSampler(threading.get_ident(), interval)
+        g._profiler = profiler
+        profiler.start()
+
+    @app.after_request
+    def _finish_profile(response):
+        profiler = g.pop('_profiler', None)
+        if profiler is None:
+            return response
+        profiler.stop()
+        request_id = _SAFE_NAME.sub('_', g.get('request_id') or str(time.time_ns()))
+        extension = 'prof' if isinstance(profiler, DeterministicProfiler) else 'folded'
+        os.makedirs(output_dir, exist_ok=True)
+        filename = f'{request_id}.{extension}'
+        profiler.write(os.path.join(output_dir, filename))
+        response.headers['X-Profile-File'] = filename
+        return response
+
+    @app.teardown_request
+    def _abort_profile(exc):
+        # Request lỗi trước after_request: vẫn phải dừng profiler
+        profiler = g.pop('_profiler', None)
+        if profiler is not None:
+            profiler.stop()
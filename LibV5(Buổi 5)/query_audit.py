@@ -0,0 +1,232 @@
+"""
+Audit query plan cho mọi truy vấn mà các route gửi xuống MongoDB.
+
+Các truy vấn được dựng bằng chính model của appV7.py (appV7 blueprint.py dùng
+cùng model và cùng kiểu truy vấn cho V1/V2), sau đó chạy explain() và so với
+baseline đã lưu để phát hiện truy vấn mới bị quét toàn bộ collection.
+
+    # Seed một DB local riêng, audit và ghi baseline lần đầu
+    python query_audit.py --mongo-uri mongodb://localhost:27017/library_audit --seed --update-baseline
+
+    # Các lần sau: exit code 1 nếu có truy vấn bị hồi quy
+    python query_audit.py --mongo-uri mongodb://localhost:27017/library_audit
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+import borrow_history
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'query_plan_baseline.json')
+DEFAULT_TOLERANCE = 2.0  # docs/keys examined được phép tăng tối đa bao nhiêu lần so với baseline
+
+
+def seed(models, books=5000, users=200, records=20000, rng_seed=42):
+    """Thêm dữ liệu mẫu nếu DB còn trống, đủ lớn để planner chọn index thật sự."""
+    User, Book, BorrowRecord = models
+    if Book.objects.count():
+        print('DB đã có dữ liệu, bỏ qua seed.')
+        return
+    rng = random.Random(rng_seed)
+    words = ['Lão', 'Hạc', 'Số', 'Đỏ', 'Mắt', 'Biếc', 'Nhà', 'Giả', 'Kim', 'War', 'Peace', 'Old', 'Sea', 'Night']
+    authors = ['Nam Cao', 'Tô Hoài', 'Nguyễn Nhật Ánh', 'Vũ Trọng Phụng', 'Leo Tolstoy', 'George Orwell']
+
+    book_docs = [{'title': f"{rng.choice(words)} {rng.choice(words)} {i}", 'author': rng.choice(authors),
+                  'quantity': rng.randint(0, 20)} for i in range(books)]
+    book_ids = Book._get_collection().insert_many(book_docs).inserted_ids
+    user_docs = [{'username': f'audit_user_{i}', 'password': 'x', 'roles': ['user']} for i in range(users)]
+    user_ids = User._get_collection().insert_many(user_docs).inserted_ids
+
+    start = datetime.utcnow() - timedelta(days=365)
+    record_docs = []
+    for i in range(records):
+        book_index = rng.randrange(books)
+        user_index = rng.randrange(users)
+        returned = rng.random() < 0.8
+        borrow_date = start + timedelta(minutes=rng.randrange(365 * 24 * 60))
+        record_docs.append({
+            'user_id': str(user_ids[user_index]), 'username': f'audit_user_{user_index}',
+            'book_id': str(book_ids[book_index]), 'book_title': book_docs[book_index]['title'],
+            'borrow_date': borrow_date, 'returned': returned,
+            'return_date': borrow_date + timedelta(days=7) if returned else None,
+        })
+    BorrowRecord._get_collection().insert_many(record_docs)
+    print(f'Đã seed {books} sách, {users} user, {records} phiếu mượn.')
+
+
+def query_shapes(models):
+    """{tên: (loại, QuerySet)} cho mọi truy vấn mà các route gửi xuống."""
+    User, Book, BorrowRecord = models
+    user = User.objects.first()
+    book = Book.objects.first()
+    record = BorrowRecord.objects.first()
+    user_id = str(record.user_id if record else user.id)
+    book_id = str(book.id)
+    title_term = book.title.split()[0].lower()
+    author_term = book.author.split()[-1].lower()
+    # Trang giữa lịch sử mượn (dữ liệu seed trải đều trong 365 ngày)
+    history_cursor = {'status': 'all', 'since': None, 'until': None, 'limit': 20,
+                      'cursor': (datetime.utcnow() - timedelta(days=180), ObjectId())}
+
+    return {
+        # token_required và login
+        'users.by_id': ('find', User.objects(id=user_id).limit(1)),
+        'users.by_username': ('find', User.objects(username=user.username).limit(1)),
+        # GET /books: count + trang dữ liệu, có/không có title, author
+        'books.count': ('count', Book.objects()),
+        'books.count.title': ('count', Book.objects(title__icontains=title_term)),
+        'books.count.author': ('count', Book.objects(author__icontains=author_term)),
+        'books.list': ('find', Book.objects().skip(0).limit(5)),
+        'books.list.deep_page': ('find', Book.objects().skip(1000).limit(5)),
+        'books.list.title': ('find', Book.objects(title__icontains=title_term).skip(0).limit(5)),
+        'books.list.author': ('find', Book.objects(author__icontains=author_term).skip(0).limit(5)),
+        'books.list.title_author': ('find', Book.objects(title__icontains=title_term,
+                                                         author__icontains=author_term).skip(0).limit(5)),
+        # POST /borrow-records và PUT /borrow-records/<id>
+        'books.by_id': ('find', Book.objects(id=book_id).limit(1)),
+        # Trả sách: modify có điều kiện (stock_shards.return_record); find theo id chỉ khi không khớp
+        'borrow_records.return': ('modify', BorrowRecord.objects(
+            id=str(record.id), user_id=record.user_id, returned=False)) if record else None,
+        'borrow_records.by_id': ('find', BorrowRecord.objects(id=str(record.id)).limit(1)) if record else None,
+        'borrow_records.active_by_book': ('find', BorrowRecord.objects(book_id=book_id, returned=False)),
+        # GET /borrow-records: trang đầu (count + limit 21), trang sau theo cursor, lọc theo trạng thái
+        'borrow_records.count_by_user': ('count', BorrowRecord.objects(user_id=user_id)),
+        'borrow_records.by_user': ('find', BorrowRecord.objects(
+            user_id=user_id).order_by('-borrow_date', '-id').limit(21)),
+        'borrow_records.by_user.cursor': ('find', BorrowRecord.objects(
+            __raw__=borrow_history.build_query(user_id, history_cursor)).order_by('-borrow_date', '-id').limit(21)),
+        'borrow_records.active_by_user': ('find', BorrowRecord.objects(
+            user_id=user_id, returned=False).order_by('-borrow_date', '-id').limit(21)),
+    }
+
+
+def _explain_count(queryset):
+    """
+    Explain đúng lệnh mà QuerySet.count() gửi đi: không có filter thì mongoengine dùng
+    estimated_document_count (lệnh count không query, đọc metadata), còn lại là count_documents,
+    tức aggregate $match + $group.
+    """
+    collection = queryset._document._get_collection()
+    if not queryset._query:
+        command = {'count': collection.name}
+    else:
+        command = {'aggregate': collection.name, 'cursor': {},
+                   'pipeline': [{'$match': queryset._query}, {'$group': {'_id': 1, 'n': {'$sum': 1}}}]}
+    raw = collection.database.command('explain', command, verbosity='executionStats')
+    # Pipeline không đẩy hết xuống query engine: plan của $match nằm trong stage $cursor đầu tiên
+    stages = raw.get('stages') or [{}]
+    return stages[0].get('$cursor', raw)
+
+
+def _explain_modify(queryset):
+    """Explain lệnh findAndModify của QuerySet.modify() (explain không ghi gì vào DB)."""
+    collection = queryset._document._get_collection()
+    command = {'findAndModify': collection.name, 'query': queryset._query,
+               'update': {'$set': {'returned': True, 'return_date': datetime.utcnow()}}}
+    return collection.database.command('explain', command, verbosity='executionStats')
+
+
+def explain(kind, queryset):
+    from query_plans import plan_summary
+
+    started = time.perf_counter()
+    if kind == 'count':
+        raw = _explain_count(queryset)
+    elif kind == 'modify':
+        raw = _explain_modify(queryset)
+    else:
+        raw = queryset.explain()
+    summary = plan_summary(raw)
+    summary['wall_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return summary
+
+
+def compare(name, current, baseline, tolerance):
+    """Trả về danh sách mô tả hồi quy của một truy vấn so với baseline."""
+    if baseline is None:
+        return []
+    problems = []
+    if current['collscan'] and not baseline['collscan']:
+        problems.append('chuyển sang COLLSCAN')
+    if baseline['indexes'] and current['indexes'] != baseline['indexes']:
+        problems.append(f"đổi index {baseline['indexes']} -> {current['indexes']}")
+    for key in ('docs_examined', 'keys_examined'):
+        before, after = baseline.get(key) or 0, current.get(key) or 0
+        if after > max(before, 1) * tolerance:
+            problems.append(f'{key} tăng {before} -> {after}')
+    return [f'{name}: {p}' for p in problems]
+
+
+def print_report(results):
+    header = f"{'query':34} {'plan':28} {'keys':>8} {'docs':>8} {'ret':>6} {'ms':>6}"
+    print(header)
+    print('-' * len(header))
+    for name, r in results.items():
+        plan = '>'.join(r['stages'])
+        print(f"{name:34} {plan[:28]:28} {r['keys_examined'] or 0:>8} {r['docs_examined'] or 0:>8} "
+              f"{r['returned'] or 0:>6} {r['millis'] or 0:>6}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Audit query plan của các truy vấn API.')
+    parser.add_argument('--mongo-uri', default='mongodb://localhost:27017/library_audit',
+                        help='Nên trỏ tới DB local riêng, không dùng DB thật')
+    parser.add_argument('--seed', action='store_true', help='Seed dữ liệu mẫu nếu DB trống')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--json', action='store_true', help='In kết quả dạng JSON')
+    args = parser.parse_args(argv)
+
+    # create_app() kết nối theo MONGO_URI và tạo index, giống khi chạy app thật
+    os.environ['MONGO_URI'] = args.mongo_uri
+    os.environ.setdefault('MONGO_INDEX_CHECK', 'off')
+    from appV7 import User, Book, BorrowRecord, create_app
+    create_app()
+    models = (User, Book, BorrowRecord)
+
+    if args.seed:
+        seed(models)
+    if not Book.objects.count() or not User.objects.count():
+        print('DB trống, hãy chạy với --seed.')
+        return 2
+
+    results = {name: explain(*shape) for name, shape in query_shapes(models).items() if shape}
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    regressions = []
+    for name, summary in results.items():
+        regressions += compare(name, summary, baseline.get(name), args.tolerance)
+    new_collscans = [n for n, r in results.items() if r['collscan'] and n not in baseline]
+
+    if args.json:
+        print(json.dumps({'results': results, 'regressions': regressions}, ensure_ascii=False, indent=2))
+    else:
+        print_report(results)
+        if not baseline:
+            print(f'\nChưa có baseline ({args.baseline}), chạy với --update-baseline để lưu.')
+        for name in new_collscans:
+            print(f'WARN: truy vấn mới {name} đang COLLSCAN')
+        for line in regressions:
+            print(f'REGRESSION: {line}')
+
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f'Đã lưu baseline vào {args.baseline}')
+        return 0
+    return 1 if regressions or new_collscans else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
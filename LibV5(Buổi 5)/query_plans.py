@@ -0,0 +1,89 @@
+"""
+Tạo index khi khởi động và kiểm tra query plan của các truy vấn "nóng".
+
+Các model khai báo index trong meta với 'auto_create_index': False, nên index
+chỉ được tạo một lần ở đây (createIndexes là idempotent, chạy lại không sao).
+
+Biến môi trường MONGO_INDEX_CHECK:
+    off     Không kiểm tra
+    warn    In cảnh báo nếu có truy vấn nóng phải COLLSCAN (mặc định)
+    strict  Raise CollscanError, app không khởi động được
+"""
+import logging
+import os
+
+log = logging.getLogger('query_plans')
+
+
+class CollscanError(RuntimeError):
+    """Có truy vấn nóng không dùng được index nào."""
+
+
+def ensure_indexes(*models):
+    """
+    Tạo các index khai báo trong meta của từng model. Index cũ không còn khai báo không bị xóa,
+    phải xóa tay, ví dụ index lịch sử mượn trước khi có phân trang bằng cursor:
+        db.borrow_records.dropIndex('user_id_1_returned_1_borrow_date_-1')
+    """
+    for model in models:
+        model.ensure_indexes()
+
+
+def _walk(stage):
+    """Duyệt cây plan (inputStage / inputStages / queryPlan)."""
+    if not stage:
+        return
+    yield stage
+    if 'queryPlan' in stage:  # Plan có SBE (MongoDB >= 5.1)
+        yield from _walk(stage['queryPlan'])
+    yield from _walk(stage.get('inputStage'))
+    for child in stage.get('inputStages', []):
+        yield from _walk(child)
+
+
+def plan_summary(explain):
+    """Rút gọn kết quả explain() thành các số liệu cần quan tâm."""
+    winning = explain.get('queryPlanner', {}).get('winningPlan', {})
+    stages = [s['stage'] for s in _walk(winning) if 'stage' in s]
+    indexes = [s['indexName'] for s in _walk(winning) if 'indexName' in s]
+    stats = explain.get('executionStats', {})
+    return {
+        'stages': stages,
+        'indexes': indexes,
+        'collscan': 'COLLSCAN' in stages,
+        'keys_examined': stats.get('totalKeysExamined'),
+        'docs_examined': stats.get('totalDocsExamined'),
+        'returned': stats.get('nReturned'),
+        'millis': stats.get('executionTimeMillis'),
+    }
+
+
+def explain_queryset(queryset):
+    return plan_summary(queryset.explain())
+
+
+def verify_hot_queries(hot_queries, mode=None):
+    """
+    Chạy explain() cho từng truy vấn trong hot_queries ({tên: hàm trả về QuerySet}).
+    Trả về danh sách tên truy vấn bị COLLSCAN.
+    """
+    mode = (mode or os.getenv('MONGO_INDEX_CHECK', 'warn')).lower()
+    if mode == 'off':
+        return []
+
+    collscans = []
+    for name, make_queryset in hot_queries.items():
+        try:
+            summary = explain_queryset(make_queryset())
+        except Exception as e:  # Ví dụ: DB giả lập không hỗ trợ explain
+            log.warning("Không explain được truy vấn '%s': %s", name, e)
+            continue
+        if summary['collscan']:
+            collscans.append(name)
+
+    if collscans:
+        message = f"Các truy vấn nóng đang COLLSCAN (thiếu index): {', '.join(collscans)}"
+        if mode == 'strict':
+            raise CollscanError(message)
+        log.warning(message)
+    return collscans
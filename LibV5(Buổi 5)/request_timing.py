@@ -0,0 +1,186 @@
+"""
+Đo thời gian từng phần của một request và trả về qua header Server-Timing.
+
+    Server-Timing: auth;dur=0.42, cache;dur=0.05, db;dur=3.10;desc="2 cmds", serialize;dur=0.31, app;dur=0.20, total;dur=4.30
+
+- Mỗi lệnh MongoDB được đo bằng CommandListener của pymongo và cộng vào request
+  đang chạy trên cùng thread (pymongo đồng bộ gọi listener ngay trên thread đó).
+- Thời gian của mỗi phase là thời gian "riêng" (exclusive): thời gian DB và của
+  phase con bên trong đã được trừ ra, nên tổng các phase ~ total.
+- Lệnh chạy lâu hơn SLOW_QUERY_MS (mặc định 100ms) được ghi vào logger 'slow_query'.
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import g
+from pymongo import monitoring
+
+import tracing
+
+slow_query_log = logging.getLogger('slow_query')
+
+_current = contextvars.ContextVar('request_timing', default=None)
+
+# Thứ tự các phase trong header
+PHASE_ORDER = ('auth', 'bcrypt', 'cache', 'db', 'serialize', 'app')
+
+
+class RequestTiming:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.db_ms = 0.0
+        self.db_count = 0
+        self.cache_hit = None
+        # Mỗi frame: [tên, thời điểm bắt đầu, thời gian của con]
+        self._stack = [['app', self.started, 0.0]]
+
+    def enter(self, name):
+        self._stack.append([name, time.perf_counter(), 0.0])
+
+    def exit(self):
+        name, started, child_ms = self._stack.pop()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.phases[name] = self.phases.get(name, 0.0) + max(0.0, elapsed_ms - child_ms)
+        self._stack[-1][2] += elapsed_ms
+        return elapsed_ms
+
+    def add_db(self, duration_ms):
+        self.db_ms += duration_ms
+        self.db_count += 1
+        self._stack[-1][2] += duration_ms
+
+    def header_value(self):
+        total_ms = (time.perf_counter() - self.started) * 1000
+        accounted = sum(self.phases.values()) + self.db_ms
+        phases = dict(self.phases)
+        phases['app'] = phases.get('app', 0.0) + max(0.0, total_ms - accounted)
+        parts = []
+        for name in PHASE_ORDER:
+            if name == 'db':
+                if self.db_count:
+                    parts.append(f'db;dur={self.db_ms:.2f};desc="{self.db_count} cmds"')
+            elif name in phases:
+                desc = ''
+                if name == 'cache' and self.cache_hit is not None:
+                    desc = ';desc="hit"' if self.cache_hit else ';desc="miss"'
+                parts.append(f'{name};dur={phases[name]:.2f}{desc}')
+        parts.append(f'total;dur={total_ms:.2f}')
+        return ', '.join(parts)
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def phase(name):
+    """Đo một đoạn code của request hiện tại (không làm gì nếu ngoài request), đồng thời mở span cùng tên."""
+    timing = _current.get()
+    with tracing.span(name):
+        if timing is None:
+            yield
+            return
+        timing.enter(name)
+        try:
+            yield
+        finally:
+            timing.exit()
+
+
+def timed_cached(cache, **cached_kwargs):
+    """
+    Thay cho @cache.cached(...): phase 'cache' chỉ gồm thời gian tra/ghi cache,
+    thời gian chạy view (khi miss) được tính cho các phase khác.
+    """
+    def decorator(f):
+        @wraps(f)
+        def view(*args, **kwargs):
+            timing = _current.get()
+            if timing is not None:
+                timing.cache_hit = False
+            with phase('app'):
+                return f(*args, **kwargs)
+
+        cached_view = cache.cached(**cached_kwargs)(view)
+
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            timing = _current.get()
+            if timing is not None:
+                timing.cache_hit = True  # view() sẽ đổi thành False nếu miss
+            with phase('cache'):
+                return cached_view(*args, **kwargs)
+
+        wrapper.uncached = f
+        wrapper.cached_view = cached_view
+        return wrapper
+    return decorator
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Cộng thời gian mỗi lệnh MongoDB vào request hiện tại, ghi log lệnh chậm."""
+
+    def __init__(self, slow_ms=None):
+        self.slow_ms = float(slow_ms if slow_ms is not None else os.getenv('SLOW_QUERY_MS', 100))
+        self._local = threading.local()
+
+    def started(self, event):
+        # Chỉ giữ lại lệnh của request đang chờ, để in ra nếu nó chậm
+        pending = getattr(self._local, 'pending', None)
+        if pending is None:
+            pending = self._local.pending = {}
+        pending[event.request_id] = event.command
+
+    def _finish(self, event, failed=False):
+        pending = getattr(self._local, 'pending', {})
+        command = pending.pop(event.request_id, None)
+        duration_ms = event.duration_micros / 1000
+        timing = _current.get()
+        if timing is not None:
+            timing.add_db(duration_ms)
+        if duration_ms >= self.slow_ms:
+            slow_query_log.warning(
+                'Slow MongoDB command %s on %s took %.1fms%s: %s',
+                event.command_name, event.database_name, duration_ms,
+                ' (failed)' if failed else '', _shorten(command))
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+
+def _shorten(command, limit=500):
+    text = repr(dict(command)) if command is not None else '?'
+    return text if len(text) <= limit else text[:limit] + '...'
+
+
+command_timer = CommandTimer()
+
+
+def init_app(app):
+    """Đăng ký hook để mỗi request có một RequestTiming và header Server-Timing."""
+
+    @app.before_request
+    def _start_request_timing():
+        g._request_timing_token = _current.set(RequestTiming())
+
+    @app.after_request
+    def _add_server_timing(response):
+        timing = _current.get()
+        if timing is not None:
+            response.headers['Server-Timing'] = timing.header_value()
+        return response
+
+    @app.teardown_request
+    def _end_request_timing(exc):
+        token = g.pop('_request_timing_token', None)
+        if token is not None:
+            _current.reset(token)
@@ -0,0 +1,173 @@
+"""
+Kiểm tra body JSON của request theo schema Swagger viết trong docstring của route (flasgger).
+
+init_app(app) được gọi sau khi mọi route đã đăng ký: đọc docstring của từng view một lần
+(hoặc spec đã build sẵn, xem api_spec.py), lấy tham số `in: body`, giải $ref tới các schema
+có `id` (Login, Register, Borrow, ...) và biên dịch mỗi schema thành một hàm Python thuần chỉ
+làm đúng các phép kiểm tra cần thiết (kiểu, trường bắt buộc, độ dài, pattern đã compile sẵn). Schema dùng từ khóa chưa hỗ trợ
+thì dùng validator của jsonschema, cũng chỉ tạo một lần.
+
+Hook chạy trong before_request, trước view và các decorator của nó (token_required), nên
+body sai bị trả 400 mà không phải decode token hay truy vấn DB:
+
+    {"message": "Invalid request body", "errors": ["body.username is required"]}
+"""
+import logging
+import re
+import textwrap
+
+from flask import jsonify, request
+
+log = logging.getLogger('request_validation')
+
+_TYPES = {
+    'object': dict,
+    'array': list,
+    'string': str,
+    'integer': int,
+    'number': (int, float),
+    'boolean': bool,
+}
+# Từ khóa được biên dịch; còn lại (hoặc chỉ để làm tài liệu) xem _DOC_KEYWORDS
+_KEYWORDS = {'type', 'required', 'properties', 'minLength', 'maxLength', 'pattern', 'enum'}
+_DOC_KEYWORDS = {'id', 'description', 'default', 'example', 'title'}
+
+
+def compile_schema(schema, path='body'):
+    """Trả về hàm check(value) -> danh sách lỗi (rỗng nếu hợp lệ)."""
+    if set(schema) - _KEYWORDS - _DOC_KEYWORDS:
+        from jsonschema import Draft4Validator  # Import nặng (~0.05s), chỉ cần cho schema phức tạp
+
+        # 'id' trong Swagger là tên schema, với jsonschema draft 4 lại là base URI nên bỏ đi
+        validator = Draft4Validator({k: v for k, v in schema.items() if k != 'id'})
+        return lambda value: [f'{path}: {e.message}' for e in validator.iter_errors(value)]
+
+    kind = schema.get('type') or ('object' if 'properties' in schema or 'required' in schema else None)
+    expected = _TYPES.get(kind)
+    numeric = kind in ('integer', 'number')
+    required = tuple(schema.get('required', ()))
+    properties = tuple((name, compile_schema(sub, f'{path}.{name}'))
+                       for name, sub in schema.get('properties', {}).items())
+    min_length = schema.get('minLength')
+    max_length = schema.get('maxLength')
+    pattern = re.compile(schema['pattern']) if 'pattern' in schema else None
+    enum = schema.get('enum')
+
+    def check(value):
+        if expected is not None and (not isinstance(value, expected) or (numeric and isinstance(value, bool))):
+            return [f'{path} must be of type {kind}']
+        errors = []
+        if isinstance(value, dict):
+            for name in required:
+                if name not in value:
+                    errors.append(f'{path}.{name} is required')
+            for name, check_property in properties:
+                if name in value:
+                    errors.extend(check_property(value[name]))
+        elif isinstance(value, str):
+            if min_length is not None and len(value) < min_length:
+                errors.append(f'{path} must have at least {min_length} characters')
+            if max_length is not None and len(value) > max_length:
+                errors.append(f'{path} must have at most {max_length} characters')
+            if pattern is not None and not pattern.search(value):
+                errors.append(f'{path} has an invalid format')
+        if enum is not None and value not in enum:
+            errors.append(f'{path} must be one of {enum}')
+        return errors
+
+    return check
+
+
+def _body_parameter(view):
+    """Tham số `in: body` trong phần YAML (sau '---') của docstring, hoặc None."""
+    doc = view.__doc__ or ''
+    if '---' not in doc:
+        return None
+    import yaml  # Chỉ cần khi không có spec build sẵn
+
+    try:
+        spec = yaml.safe_load(textwrap.dedent(doc.split('---', 1)[1]))
+    except yaml.YAMLError as e:
+        log.warning('Không đọc được docstring Swagger của %s: %s', view.__name__, e)
+        return None
+    for parameter in (spec or {}).get('parameters') or ():
+        if parameter.get('in') == 'body' and parameter.get('schema'):
+            return parameter
+    return None
+
+
+def _swagger_path(rule):
+    """'/api/borrow-records/<string:record_id>' -> '/api/borrow-records/{record_id}' như trong spec."""
+    return re.sub(r'<(?:[^<>:]+:)?([^<>]+)>', r'{\1}', rule)
+
+
+def _docstring_parameters(app):
+    parameters = {}
+    definitions = {}
+    for endpoint, view in app.view_functions.items():
+        parameter = _body_parameter(view)
+        if parameter is None:
+            continue
+        parameters[endpoint] = parameter
+        schema = parameter['schema']
+        if 'id' in schema:
+            definitions.setdefault(schema['id'], schema)
+    return parameters, definitions
+
+
+def _spec_parameters(app, spec):
+    parameters = {}
+    paths = spec.get('paths', {})
+    for rule in app.url_map.iter_rules():
+        operations = paths.get(_swagger_path(rule.rule), {})
+        for method in rule.methods - {'HEAD', 'OPTIONS'}:
+            for parameter in operations.get(method.lower(), {}).get('parameters', ()):
+                if parameter.get('in') == 'body' and parameter.get('schema'):
+                    parameters[rule.endpoint] = parameter
+    return parameters, spec.get('definitions', {})
+
+
+def compile_app(app, spec=None):
+    """
+    {endpoint: (check, body bắt buộc?)} cho mọi route có tham số body.
+    Schema lấy từ spec đã build (api_spec.py) nếu có, không thì từ docstring của view.
+    """
+    if spec is None:
+        parameters, definitions = _docstring_parameters(app)
+    else:
+        parameters, definitions = _spec_parameters(app, spec)
+
+    validators = {}
+    for endpoint, parameter in parameters.items():
+        schema = parameter['schema']
+        ref = schema.get('$ref', '')
+        if ref:
+            name = ref.rsplit('/', 1)[-1]
+            if name not in definitions:
+                log.warning('%s: không tìm thấy schema %s, bỏ qua kiểm tra body', endpoint, ref)
+                continue
+            schema = definitions[name]
+        validators[endpoint] = (compile_schema(schema), bool(parameter.get('required')))
+    return validators
+
+
+def init_app(app, spec=None):
+    """Biên dịch schema của mọi route đã đăng ký và kiểm tra body trước khi vào view."""
+    validators = compile_app(app, spec)
+    app.extensions['request_validation'] = validators
+
+    @app.before_request
+    def _validate_body():
+        rule = validators.get(request.endpoint)
+        if rule is None:
+            return None
+        check, required = rule
+        data = request.get_json(silent=True)
+        if data is None:
+            if not required and not request.get_data():
+                return None
+            return jsonify({'message': 'Request body must be JSON'}), 400
+        errors = check(data)
+        if errors:
+            return jsonify({'message': 'Invalid request body', 'errors': errors}), 400
+        return None
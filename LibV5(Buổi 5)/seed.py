@@ -0,0 +1,142 @@
+"""
+Seed sách mẫu từ file fixture, chạy một lần như một lệnh riêng (không chạy khi app khởi động):
+
+    python seed.py                          # fixtures/books.ndjson
+    python seed.py fixtures/books.csv --batch-size 1000
+    python seed.py --reset-stock            # Ghi đè quantity theo fixture (chỉ dùng cho DB dev; bỏ qua sách chia shard)
+
+Chạy lại bao nhiêu lần cũng được, không xóa dữ liệu:
+    - Upsert theo khóa tự nhiên (title, author) bằng bulk_write, mỗi batch một lần ghi.
+    - quantity chỉ được đặt khi sách mới được tạo ($setOnInsert), nên tồn kho thật
+      (đã mượn/trả, đã nhập thêm) không bị fixture ghi đè.
+    - Hash nội dung của từng dòng lưu ngay trên document sách (seed_hash); dòng có sách cùng
+      (title, author) mang đúng hash đó thì bỏ qua, không ghi gì. Sách bị xóa (hoặc DB mới)
+      không còn hash nên được tạo lại ở lần seed sau.
+
+File fixture đọc theo stream và kiểm tra từng dòng giống book_import.py (CSV hoặc NDJSON).
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+
+from pymongo import ASCENDING, MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+
+import book_import
+
+DEFAULT_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'books.ndjson')
+DEFAULT_BATCH_SIZE = 500
+
+
+def content_hash(doc):
+    return hashlib.sha256(json.dumps(doc, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _update(doc, digest, reset_stock):
+    update = {'$set': {'seed_hash': digest}}
+    update.setdefault('$set' if reset_stock else '$setOnInsert', {})['quantity'] = doc['quantity']
+    return update
+
+
+def _flush(books, batch, reset_stock, report):
+    if not batch:
+        return
+    # Một lần đọc theo index (title, author) cho cả batch: sách nào đã có và đã seed bằng hash nào
+    titles = list({doc['title'] for _, doc in batch})
+    existing = {(b['title'], b['author']): b for b in books.find(
+        {'title': {'$in': titles}}, {'title': 1, 'author': 1, 'seed_hash': 1, 'stock_shards': 1})}
+    # --reset-stock ghi lại mọi dòng, vì hash không đổi nhưng quantity trong DB có thể đã khác fixture
+    changed, skipped = [], 0
+    for line_no, doc in batch:
+        book = existing.get((doc['title'], doc['author'])) or {}
+        if reset_stock and book.get('stock_shards'):
+            # Tồn kho của sách chia shard không nằm ở quantity (xem stock_shards.sharded_books)
+            book_import._add_error(report, line_no, book_import.SHARDED_STOCK_ERROR)
+            skipped += 1
+            continue
+        digest = content_hash(doc)
+        if reset_stock or book.get('seed_hash') != digest:
+            changed.append((line_no, doc, digest))
+    report['unchanged'] += len(batch) - len(changed) - skipped
+    report['batches'] += 1
+    if not changed:
+        return
+
+    # seed_hash được ghi cùng lần upsert, dòng lỗi không có hash và sẽ được thử lại ở lần seed sau
+    ops = [UpdateOne({'title': doc['title'], 'author': doc['author']}, _update(doc, digest, reset_stock), upsert=True)
+           for _, doc, digest in changed]
+    try:
+        result = books.bulk_write(ops, ordered=False)
+        report['inserted'] += result.upserted_count
+        report['existing'] += result.matched_count
+    except BulkWriteError as e:
+        details = e.details or {}
+        report['inserted'] += details.get('nUpserted', 0)
+        report['existing'] += details.get('nMatched', 0)
+        for err in details.get('writeErrors', []):
+            book_import._add_error(report, changed[err['index']][0], err.get('errmsg', 'Lỗi ghi'))
+
+
+def seed_books(stream, db, fmt='ndjson', batch_size=DEFAULT_BATCH_SIZE, reset_stock=False):
+    """Upsert sách từ stream vào db.books, trả về report giống book_import.import_books."""
+    if fmt not in book_import.SUPPORTED_FORMATS:
+        raise ValueError(f"Định dạng không hỗ trợ: {fmt}")
+    batch_size = max(1, int(batch_size))
+    books = db['books']
+    # Upsert lọc theo (title, author); index này app cũng tạo, tạo lại cùng spec không tốn gì
+    books.create_index([('title', ASCENDING), ('author', ASCENDING)])
+
+    report = {'format': fmt, 'batch_size': batch_size, 'stock': 'reset' if reset_stock else 'insert-only',
+              'rows': 0, 'inserted': 0, 'existing': 0, 'unchanged': 0, 'failed': 0, 'batches': 0, 'errors': []}
+    started = time.perf_counter()
+
+    batch = []
+    for line_no, row, error in book_import.iter_rows(stream, fmt):
+        report['rows'] += 1
+        if error is None:
+            doc, error = book_import.validate_row(row)
+        if error is not None:
+            book_import._add_error(report, line_no, error)
+            continue
+        batch.append((line_no, doc))
+        if len(batch) >= batch_size:
+            _flush(books, batch, reset_stock, report)
+            batch = []
+    _flush(books, batch, reset_stock, report)
+
+    report['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+    report['errors_truncated'] = report['failed'] > len(report['errors'])
+    return report
+
+
+# --- DÒNG LỆNH ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Seed sách mẫu từ file fixture (upsert, không xóa dữ liệu).')
+    parser.add_argument('file', nargs='?', default=DEFAULT_FIXTURE, help="File CSV/NDJSON, '-' để đọc từ stdin")
+    parser.add_argument('--format', choices=book_import.SUPPORTED_FORMATS, help='Mặc định đoán theo đuôi file')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--reset-stock', action='store_true',
+                        help='Ghi đè quantity của sách đã có bằng giá trị trong fixture')
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017/library_db'))
+    args = parser.parse_args(argv)
+
+    fmt = args.format or book_import.detect_format(filename=args.file)
+    db = MongoClient(args.mongo_uri)['library_db']
+
+    if args.file == '-':
+        stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+        report = seed_books(stream, db, fmt, args.batch_size, args.reset_stock)
+    else:
+        with open(args.file, encoding='utf-8-sig', newline='') as stream:
+            report = seed_books(stream, db, fmt, args.batch_size, args.reset_stock)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 1 if report['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
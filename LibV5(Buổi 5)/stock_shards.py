@@ -0,0 +1,188 @@
+"""
+Tồn kho chia shard cho sách "nóng".
+
+Bình thường mọi lần mượn/trả một quyển đều ghi vào trường quantity của cùng một document Book,
+nên khi tải cao các request của quyển đó xếp hàng trên một document. Sách được đánh dấu nóng
+(Book.stock_shards = N > 0) giữ tồn kho ở N document của collection book_stock_shards
+(_id '<book_id>:<i>'), còn Book.quantity bằng 0:
+
+    - Mượn: giảm có điều kiện (count > 0) một shard chọn ngẫu nhiên; shard đó hết thì thử
+      lần lượt các shard còn lại, hết cả thì sách đã hết.
+    - Trả: tăng một shard chọn ngẫu nhiên. return_record() đánh dấu phiếu mượn đã trả bằng một
+      lần ghi có điều kiện (returned = False) trước, chỉ lần ghi thắng mới trả sách về kho, nên
+      hai request trả cùng một phiếu không cộng kho hai lần.
+    - Đọc: cộng các shard (một aggregate theo index book_id), kết quả cache trong process
+      STOCK_SUM_TTL_S giây (mặc định 1), nên số hiển thị có thể trễ chừng đó.
+
+Các lần ghi rơi vào N document khác nhau, nên thông lượng mượn/trả một quyển tăng theo N.
+Sách thường vẫn dùng Book.quantity, mượn cũng bằng một lần giảm có điều kiện (quantity > 0).
+
+Đánh dấu nóng / bỏ đánh dấu bằng reshard(); tồn kho được chuyển nguyên vẹn giữa Book.quantity
+và các shard. Trong lúc chuyển (vài ms) một lần mượn có thể bị báo hết sách. Mỗi quyển chỉ một
+reshard chạy tại một thời điểm trên mọi process: reshard giữ một khóa trong collection
+stock_reshard_locks (tự hết hạn sau RESHARD_LOCK_S giây nếu process chết giữa chừng), lần
+reshard khác cùng quyển trong lúc đó nhận ReshardInProgress.
+"""
+import os
+import random
+import secrets
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+_NOT_SHARDED = {'$not': {'$gt': 0}}  # stock_shards = 0 hoặc chưa có trường này (sách cũ)
+LOCK_COLLECTION = 'stock_reshard_locks'
+RESHARD_LOCK_S = 60
+
+
+class ReshardInProgress(RuntimeError):
+    """Một reshard khác của cùng quyển đang chạy (có thể ở process khác)."""
+
+
+def shard_id(book_id, index):
+    return f'{book_id}:{index}'
+
+
+def sharded_books(books, docs):
+    """
+    (title, author) của các sách trong docs đang chia shard (đọc một lần theo index title).
+    Ghi thẳng Book.quantity của các sách này (import, seed --reset-stock) sẽ cộng thêm vào tồn kho
+    đang nằm ở shard, nên phải bỏ qua chúng hoặc gộp shard về 0 bằng reshard() trước.
+    """
+    titles = list({doc['title'] for doc in docs})
+    return {(b['title'], b['author'])
+            for b in books.find({'title': {'$in': titles}, 'stock_shards': {'$gt': 0}}, {'title': 1, 'author': 1})}
+
+
+def split(total, shards):
+    """Chia đều total cho shards phần, các phần đầu nhận thêm phần dư."""
+    base, extra = divmod(total, shards)
+    return [base + (1 if i < extra else 0) for i in range(shards)]
+
+
+class ShardedStock:
+    """Tồn kho của model Book (quantity, stock_shards) và model shard (id, book_id, count)."""
+
+    def __init__(self, book_model, shard_model, sum_ttl=None):
+        self.book_model = book_model
+        self.shard_model = shard_model
+        self.sum_ttl = float(os.getenv('STOCK_SUM_TTL_S', 1)) if sum_ttl is None else sum_ttl
+        self._sums = {}  # book_id -> (hết hạn lúc, tổng)
+        self.shard_misses = 0  # Số lần shard được chọn đã hết, phải thử shard khác
+
+    def claim(self, book):
+        """Lấy một quyển khỏi kho; False nếu đã hết."""
+        shards = book.stock_shards or 0
+        if not shards:
+            return bool(self.book_model.objects(id=book.id, quantity__gt=0).update_one(dec__quantity=1))
+        book_id = str(book.id)
+        start = random.randrange(shards)
+        for i in range(shards):
+            if self.shard_model.objects(id=shard_id(book_id, (start + i) % shards), count__gt=0).update_one(dec__count=1):
+                self._sums.pop(book_id, None)
+                return True
+            self.shard_misses += 1
+        return False
+
+    def release(self, book_id):
+        """Trả một quyển về kho."""
+        book_id = str(book_id)
+        for _ in range(3):
+            if self.book_model.objects(id=book_id, __raw__={'stock_shards': _NOT_SHARDED}).update_one(inc__quantity=1):
+                return
+            book = self.book_model.objects(id=book_id).only('stock_shards').first()
+            if book is None:
+                return
+            if book.stock_shards and self.shard_model.objects(
+                    id=shard_id(book_id, random.randrange(book.stock_shards))).update_one(inc__count=1):
+                self._sums.pop(book_id, None)
+                return
+            # Sách vừa được reshard giữa hai bước trên, thử lại theo trạng thái mới
+        self.book_model.objects(id=book_id).update_one(inc__quantity=1)
+
+    def return_record(self, record_model, record_id, user_id):
+        """
+        Trả phiếu mượn record_id của user_id. Trả về (phiếu, True) nếu lần gọi này đã trả sách,
+        (phiếu, False) nếu phiếu thuộc người khác hoặc đã trả từ trước, (None, False) nếu không có phiếu.
+        """
+        record = record_model.objects(id=record_id, user_id=str(user_id), returned=False).modify(
+            set__returned=True, set__return_date=datetime.utcnow())
+        if record is None:
+            return record_model.objects(id=record_id).first(), False
+        self.release(record.book_id)
+        return record, True
+
+    def total(self, book):
+        """Tồn kho hiện tại của book (document đã tải)."""
+        if not book.stock_shards:
+            return book.quantity
+        book_id = str(book.id)
+        now = time.monotonic()
+        cached = self._sums.get(book_id)
+        if cached and cached[0] > now:
+            return cached[1]
+        total = self.shard_model.objects(book_id=book_id).sum('count')
+        self._sums[book_id] = (now + self.sum_ttl, total)
+        return total
+
+    def reshard(self, book_id, shards):
+        """
+        Chia tồn kho của một quyển thành shards phần (0 = gộp về Book.quantity); trả về tổng tồn kho.
+        Raise ReshardInProgress nếu quyển này đang được reshard ở nơi khác.
+        """
+        book_id = str(book_id)
+        shards = max(0, int(shards))
+        books = self.book_model._get_collection()
+        shard_docs = self.shard_model._get_collection()
+        locks = shard_docs.database[LOCK_COLLECTION]
+        token = self._acquire(locks, book_id)
+        try:
+            self._sums.pop(book_id, None)
+            # 1. Gộp các shard cũ (nếu có) về Book.quantity. Lần trả nào rơi vào shard vừa xóa
+            #    sẽ không khớp document và được release() cộng thẳng vào Book.
+            books.update_one({'_id': ObjectId(book_id)}, {'$set': {'stock_shards': 0}})
+            for doc in list(shard_docs.find({'book_id': book_id}, {'_id': 1})):
+                removed = shard_docs.find_one_and_delete({'_id': doc['_id']})
+                if removed and removed.get('count'):
+                    books.update_one({'_id': ObjectId(book_id)}, {'$inc': {'quantity': removed['count']}})
+            book = books.find_one({'_id': ObjectId(book_id)}, {'quantity': 1})
+            if book is None:
+                raise ValueError(f'Không tìm thấy sách {book_id}')
+            if not shards:
+                return book.get('quantity', 0)
+
+            # 2. Tạo shard theo tồn kho đọc được, rồi chuyển cờ + đưa quantity về 0 trong một lần ghi.
+            #    Tồn kho đổi giữa hai bước (có người mượn/trả) được bù vào shard 0.
+            expected = book.get('quantity', 0)
+            shard_docs.insert_many([{'_id': shard_id(book_id, i), 'book_id': book_id, 'count': count}
+                                    for i, count in enumerate(split(expected, shards))])
+            before = books.find_one_and_update(
+                {'_id': ObjectId(book_id)}, {'$set': {'quantity': 0, 'stock_shards': shards}},
+                projection={'quantity': 1}, return_document=ReturnDocument.BEFORE)
+            actual = before.get('quantity', 0)
+            if actual != expected:
+                shard_docs.update_one({'_id': shard_id(book_id, 0)}, {'$inc': {'count': actual - expected}})
+            return actual
+        finally:
+            locks.delete_one({'_id': book_id, 'token': token})
+
+    @staticmethod
+    def _acquire(locks, book_id):
+        """Lấy khóa reshard của book_id (insert theo _id, hoặc chiếm khóa đã hết hạn); trả về token."""
+        token = secrets.token_hex(8)
+        now = datetime.utcnow()
+        lock = {'token': token, 'expires_at': now + timedelta(seconds=RESHARD_LOCK_S)}
+        try:
+            locks.insert_one(dict(lock, _id=book_id))
+            return token
+        except DuplicateKeyError:
+            pass
+        if locks.find_one_and_update({'_id': book_id, 'expires_at': {'$lt': now}}, {'$set': lock}) is None:
+            raise ReshardInProgress(f'Sách {book_id} đang được reshard')
+        return token
+
+    def stats(self):
+        return {'cached_sums': len(self._sums), 'sum_ttl_seconds': self.sum_ttl, 'shard_misses': self.shard_misses}
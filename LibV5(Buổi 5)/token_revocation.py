@@ -0,0 +1,141 @@
+"""
+Thu hồi access token (logout) mà không thêm truy vấn DB vào mọi request.
+
+Access token có claim 'jti'. Token bị thu hồi được ghi vào collection revoked_tokens
+(nguồn dữ liệu chính, TTL index xóa bản ghi khi token hết hạn) và vào một Bloom filter
+trong bộ nhớ của mỗi process:
+
+    - jti không có trong filter (gần như mọi request): chắc chắn chưa bị thu hồi,
+      kiểm tra bằng k phép tính bit, không I/O.
+    - jti "có thể có" trong filter: hỏi DB theo _id để loại trường hợp dương tính giả.
+
+Process thu hồi token thêm jti vào filter của mình ngay lập tức. Các process khác
+(gunicorn -w N) đọc các bản ghi mới mỗi REVOCATION_SYNC_S giây, nên token bị thu hồi
+ở worker khác có thể còn dùng được tối đa chừng đó giây. Bloom filter không xóa được
+phần tử, nên filter được dựng lại từ các bản ghi còn hạn mỗi REVOCATION_REBUILD_S giây
+(hoặc khi đầy) để jti đã hết hạn không làm tăng tỉ lệ dương tính giả.
+
+Biến môi trường:
+    REVOCATION_CAPACITY    Số jti dự kiến, mặc định 100000 (~180KB với tỉ lệ sai 0.1%)
+    REVOCATION_SYNC_S      Chu kỳ đọc bản ghi mới từ DB, mặc định 5
+    REVOCATION_REBUILD_S   Chu kỳ dựng lại filter, mặc định 3600
+"""
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+log = logging.getLogger('token_revocation')
+
+# Đọc lùi thêm một khoảng khi sync, bù cho lệch đồng hồ giữa các process
+SYNC_OVERLAP = timedelta(seconds=2)
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.size = max(64, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+        self._lock = threading.Lock()  # Chỉ cho add(); đọc không cần khóa
+
+    def _positions(self, key):
+        # Double hashing: k vị trí từ một lần băm blake2b 128 bit
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        positions = self._positions(key)
+        with self._lock:
+            for p in positions:
+                self._bits[p >> 3] |= 1 << (p & 7)
+            self.count += 1
+
+    def __contains__(self, key):
+        bits = self._bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+
+class RevocationList:
+    """Bloom filter trong bộ nhớ đứng trước model RevokedToken (id = jti, expires_at, revoked_at)."""
+
+    def __init__(self, model, capacity=None, error_rate=0.001, sync_seconds=None, rebuild_seconds=None):
+        self.model = model
+        self.capacity = capacity or int(os.getenv('REVOCATION_CAPACITY', 100000))
+        self.error_rate = error_rate
+        self.sync_seconds = sync_seconds or float(os.getenv('REVOCATION_SYNC_S', 5))
+        self.rebuild_seconds = rebuild_seconds or float(os.getenv('REVOCATION_REBUILD_S', 3600))
+        self.filter = BloomFilter(self.capacity, error_rate)
+        self.db_lookups = 0  # Số lần filter báo "có thể có" và phải hỏi DB
+        self._synced_at = datetime.utcnow()
+        self._rebuilt_at = time.monotonic()
+        self._thread = None
+
+    def start(self):
+        """Nạp các jti còn hạn từ DB rồi chạy thread sync nền."""
+        if self._thread is None:
+            self.rebuild()
+            self._thread = threading.Thread(target=self._run, name='revocation-sync', daemon=True)
+            self._thread.start()
+
+    def revoke(self, jti, expires_at):
+        """Thu hồi token có jti tới thời điểm expires_at (UTC, naive); bản ghi tự xóa sau đó."""
+        if not jti:
+            return
+        self.model.objects(id=jti).update_one(
+            upsert=True, set__expires_at=expires_at, set__revoked_at=datetime.utcnow())
+        self.filter.add(jti)
+
+    def is_revoked(self, jti):
+        if not jti or jti not in self.filter:
+            return False
+        self.db_lookups += 1
+        return self.model.objects(id=jti).only('id').first() is not None
+
+    def sync(self):
+        """Thêm vào filter các jti được thu hồi (ở bất kỳ process nào) từ lần sync trước."""
+        now = datetime.utcnow()
+        for doc in self.model.objects(revoked_at__gte=self._synced_at - SYNC_OVERLAP).only('id'):
+            self.filter.add(doc.id)
+        self._synced_at = now
+
+    def rebuild(self):
+        """Dựng filter mới chỉ với các jti còn hạn rồi thay filter cũ."""
+        now = datetime.utcnow()
+        active = [doc.id for doc in self.model.objects(expires_at__gt=now).only('id')]
+        bloom = BloomFilter(max(self.capacity, len(active) * 2), self.error_rate)
+        for jti in active:
+            bloom.add(jti)
+        self.filter = bloom
+        self._synced_at = now
+        self._rebuilt_at = time.monotonic()
+
+    def _run(self):
+        while True:
+            time.sleep(self.sync_seconds)
+            try:
+                full = self.filter.count >= self.filter.capacity
+                if full or time.monotonic() - self._rebuilt_at >= self.rebuild_seconds:
+                    self.rebuild()
+                else:
+                    self.sync()
+            except Exception:
+                log.exception('Không đồng bộ được danh sách token bị thu hồi')
+
+    def stats(self):
+        bloom = self.filter
+        return {
+            'entries': bloom.count,
+            'capacity': bloom.capacity,
+            'size_bytes': len(bloom._bits),
+            'hashes': bloom.hashes,
+            'db_lookups': self.db_lookups,
+            'synced_at': self._synced_at.isoformat() + 'Z',
+        }
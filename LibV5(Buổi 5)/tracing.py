@@ -0,0 +1,316 @@
+"""
+Tracing nhẹ trong process, không cần collector bên ngoài.
+
+Mỗi request (khi bật) có một root span; bên trong là span cho các phase của
+request_timing (auth, cache, serialize...), to_dict, jsonify và mỗi lệnh MongoDB.
+Trace context được nhận qua header W3C `traceparent` và được trả lại trong
+response để đối chiếu một request chậm trong k6 với trace của nó.
+
+Biến môi trường:
+    TRACING_ENABLED     1 để bật (mặc định tắt, khi tắt gần như không tốn gì)
+    TRACE_SAMPLE_RATE   Tỉ lệ request được trace khi không có traceparent (mặc định 1.0)
+    TRACE_EXPORTER      memory (mặc định) hoặc file
+    TRACE_FILE          File NDJSON cho exporter file (mặc định traces.ndjson)
+    TRACE_BATCH_SIZE    Số span mỗi lần ghi (mặc định 256)
+    TRACE_FLUSH_SECONDS Thời gian tối đa giữ span trong batch (mặc định 2)
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from flask import g, request
+from pymongo import monitoring
+
+log = logging.getLogger('tracing')
+_current_span = contextvars.ContextVar('current_span', default=None)
+_TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+
+def _new_id(nbytes):
+    return f'{random.getrandbits(nbytes * 8):0{nbytes * 2}x}'
+
+
+class Span:
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'start_ns', 'end_ns', 'attributes', 'status')
+
+    def __init__(self, trace_id, parent_id, name, attributes=None):
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes or {}
+        self.status = 'ok'
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def end(self):
+        self.end_ns = time.time_ns()
+        exporter.export(self)
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start_ns': self.start_ns,
+            'duration_ms': round((self.end_ns - self.start_ns) / 1e6, 3) if self.end_ns else None,
+            'status': self.status,
+            'attributes': self.attributes,
+        }
+
+
+class _NoopSpan:
+    def set_attribute(self, key, value):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+# --- EXPORTER ---
+class MemorySink:
+    """Giữ các span gần nhất trong RAM (đọc qua endpoint admin)."""
+
+    def __init__(self, maxlen=20000):
+        self._spans = deque(maxlen=maxlen)
+
+    def write(self, batch):
+        self._spans.extend(span.to_dict() for span in batch)
+
+    def spans(self, trace_id=None, limit=1000):
+        items = [s for s in list(self._spans) if trace_id is None or s['trace_id'] == trace_id]
+        return items[-limit:]
+
+    def snapshot(self):
+        """Bản sao mọi span đang giữ (thread export vẫn có thể ghi thêm trong lúc đọc)."""
+        return list(self._spans)
+
+    def __len__(self):
+        return len(self._spans)
+
+
+class FileSink:
+    """Ghi span dạng NDJSON, mỗi batch một lần mở file."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, batch):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + '\n' for span in batch))
+
+
+class BatchExporter:
+    """Gom span vào queue, thread nền ghi theo batch (theo số lượng hoặc thời gian)."""
+
+    def __init__(self, sink, batch_size=256, flush_seconds=2.0, max_queue=50000):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending = []
+        self._last_write = time.monotonic()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def export(self, span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            try:
+                span = self._queue.get(timeout=self.flush_seconds)
+            except queue.Empty:
+                span = None
+            batch = None
+            with self._lock:
+                if span is not None:
+                    self._pending.append(span)
+                overdue = time.monotonic() - self._last_write >= self.flush_seconds
+                if len(self._pending) >= self.batch_size or (self._pending and overdue):
+                    batch, self._pending = self._pending, []
+                    self._last_write = time.monotonic()
+            if batch:
+                self._write(batch)
+
+    def flush(self):
+        """Ghi ngay mọi span đang chờ (trong queue và batch dở)."""
+        with self._lock:
+            while True:
+                try:
+                    self._pending.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            batch, self._pending = self._pending, []
+            self._last_write = time.monotonic()
+        if batch:
+            self._write(batch)
+
+    def _write(self, batch):
+        try:
+            self.sink.write(batch)
+        except OSError as e:
+            log.warning('Không ghi được trace: %s', e)
+
+
+def _build_exporter():
+    if os.getenv('TRACE_EXPORTER', 'memory') == 'file':
+        sink = FileSink(os.getenv('TRACE_FILE', 'traces.ndjson'))
+    else:
+        sink = MemorySink()
+    return BatchExporter(sink, int(os.getenv('TRACE_BATCH_SIZE', 256)), float(os.getenv('TRACE_FLUSH_SECONDS', 2)))
+
+
+exporter = _build_exporter()
+
+
+def buffered_spans():
+    """Các span đang giữ trong RAM; rỗng khi exporter ghi ra file."""
+    sink = exporter.sink
+    return sink.snapshot() if isinstance(sink, MemorySink) else []
+
+
+# --- API DÙNG TRONG CODE ---
+def current_span():
+    return _current_span.get()
+
+
+@contextmanager
+def span(name, **attributes):
+    """Tạo span con của span hiện tại; không làm gì nếu request không được trace."""
+    parent = _current_span.get()
+    if parent is None:
+        yield NOOP_SPAN
+        return
+    child = Span(parent.trace_id, parent.span_id, name, attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except Exception as e:
+        child.status = 'error'
+        child.attributes['error'] = repr(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        child.end()
+
+
+def format_traceparent(s):
+    return f'00-{s.trace_id}-{s.span_id}-01'
+
+
+def parse_traceparent(value):
+    """Trả về (trace_id, parent_span_id, sampled) hoặc None nếu header không hợp lệ."""
+    match = _TRACEPARENT.match((value or '').strip().lower())
+    if not match or match.group(1) == '0' * 32:
+        return None
+    return match.group(1), match.group(2), int(match.group(3), 16) & 1 == 1
+
+
+class MongoSpanListener(monitoring.CommandListener):
+    """Một span cho mỗi lệnh MongoDB, con của span đang mở trên thread đó."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def started(self, event):
+        parent = _current_span.get()
+        if parent is None:
+            return
+        pending = getattr(self._local, 'pending', None)
+        if pending is None:
+            pending = self._local.pending = {}
+        collection = event.command.get(event.command_name)
+        pending[event.request_id] = Span(parent.trace_id, parent.span_id, f'mongo.{event.command_name}', {
+            'db.name': event.database_name,
+            'db.collection': collection if isinstance(collection, str) else None,
+        })
+
+    def _finish(self, event, status):
+        pending = getattr(self._local, 'pending', None)
+        s = pending.pop(event.request_id, None) if pending else None
+        if s is not None:
+            s.status = status
+            s.attributes['db.duration_ms'] = event.duration_micros / 1000
+            s.end()
+
+    def succeeded(self, event):
+        self._finish(event, 'ok')
+
+    def failed(self, event):
+        self._finish(event, 'error')
+
+
+mongo_listener = MongoSpanListener()
+
+
+def enabled():
+    return os.getenv('TRACING_ENABLED', '0').lower() in ('1', 'true', 'yes')
+
+
+def init_app(app):
+    """Mở root span cho mỗi request được trace và trả traceparent trong response."""
+    if not enabled():
+        return
+    exporter.start()
+    sample_rate = float(os.getenv('TRACE_SAMPLE_RATE', 1.0))
+
+    @app.before_request
+    def _start_trace():
+        incoming = parse_traceparent(request.headers.get('traceparent'))
+        if incoming:
+            trace_id, parent_id, sampled = incoming
+        else:
+            trace_id, parent_id, sampled = _new_id(16), None, random.random() < sample_rate
+        if not sampled:
+            return
+        root = Span(trace_id, parent_id, f'{request.method} {request.path}', {
+            'http.method': request.method,
+            'request_id': g.get('request_id'),
+        })
+        g._trace_root = root
+        g._trace_token = _current_span.set(root)
+
+    @app.after_request
+    def _finish_trace_headers(response):
+        root = g.get('_trace_root')
+        if root is not None:
+            root.name = f'{request.method} {request.url_rule.rule if request.url_rule else request.path}'
+            root.set_attribute('http.status_code', response.status_code)
+            response.headers['traceparent'] = format_traceparent(root)
+        return response
+
+    @app.teardown_request
+    def _end_trace(exc):
+        root = g.pop('_trace_root', None)
+        token = g.pop('_trace_token', None)
+        if root is None:
+            return
+        if exc is not None:
+            root.status = 'error'
+            root.set_attribute('error', repr(exc))
+        _current_span.reset(token)
+        root.end()
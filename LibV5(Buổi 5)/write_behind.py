@@ -0,0 +1,228 @@
+"""
+Ghi phiếu mượn kiểu write-behind: request mượn sách không chờ lệnh insert vào MongoDB.
+
+Khi bật, save() gán _id (ObjectId tạo phía client), ghi document vào file journal cục bộ
+(NDJSON, mỗi process một file journal/<tên>-<pid>-<n>.ndjson) rồi trả về ngay. Thread nền gom các
+document đang chờ và ghi bằng một lệnh insert_many khi đủ BORROW_FLUSH_BATCH document hoặc
+sau BORROW_FLUSH_MS ms. Ghi xong thì file journal của batch đó bị xóa.
+
+    - Đọc lịch sử: pending() trả về các document chưa flush của process này để gộp với kết quả từ DB.
+    - Trả sách theo id của một phiếu chưa flush: ensure_flushed() flush ngay trước khi tìm trong DB.
+    - Process chết giữa chừng: lần khởi động sau đọc lại các file journal không còn process nào
+      giữ (khóa fcntl) và insert lại. _id có sẵn trong journal nên document đã ghi rồi chỉ bị
+      báo trùng khóa và được bỏ qua, không bị ghi hai lần.
+
+Phiếu chỉ thấy được từ process đã nhận request cho tới khi flush (tối đa BORROW_FLUSH_MS ms),
+process khác (gunicorn -w N) đọc DB nên thấy trễ chừng đó.
+
+Biến môi trường:
+    BORROW_WRITE_BEHIND    off (mặc định): save() như cũ | on
+    BORROW_JOURNAL_DIR     Thư mục journal, mặc định journal/ cạnh file này
+    BORROW_FLUSH_BATCH     Số document tối đa chờ trước khi flush, mặc định 200
+    BORROW_FLUSH_MS        Thời gian chờ tối đa trước khi flush, mặc định 200
+    BORROW_JOURNAL_FSYNC   1 (mặc định): fsync mỗi lần ghi journal, mất điện không mất phiếu;
+                           0: chỉ ghi vào page cache của OS (nhanh hơn, chỉ an toàn khi process chết)
+"""
+import atexit
+import glob
+import itertools
+import logging
+import os
+import threading
+
+from bson import ObjectId, json_util
+from pymongo.errors import BulkWriteError
+
+try:
+    import fcntl
+except ImportError:  # Windows: không khóa được file, coi như chỉ có một process
+    fcntl = None
+
+log = logging.getLogger('write_behind')
+
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'journal')
+DUPLICATE_KEY = 11000
+_instances = itertools.count(1)  # Hai writer cùng tên trong một process không dùng chung file
+
+
+def _locked_by_other_process(path):
+    """File journal đang được một process còn sống giữ."""
+    if fcntl is None or not os.path.exists(path):
+        return False
+    with open(path, 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        fcntl.flock(f, fcntl.LOCK_UN)
+    return False
+
+
+class WriteBehindWriter:
+    """Ghi document của model qua journal cục bộ + insert_many theo batch (khi bật)."""
+
+    def __init__(self, model, name, enabled=None, directory=None, batch_size=None, flush_seconds=None, fsync=None):
+        self.model = model
+        self.name = name
+        if enabled is None:
+            enabled = os.getenv('BORROW_WRITE_BEHIND', 'off').lower() in ('1', 'on', 'true')
+        self.enabled = enabled
+        self.directory = directory or os.getenv('BORROW_JOURNAL_DIR', DEFAULT_DIR)
+        self.batch_size = batch_size or int(os.getenv('BORROW_FLUSH_BATCH', 200))
+        self.flush_seconds = flush_seconds or int(os.getenv('BORROW_FLUSH_MS', 200)) / 1000
+        self.fsync = os.getenv('BORROW_JOURNAL_FSYNC', '1') != '0' if fsync is None else fsync
+        self.path = os.path.join(self.directory, f'{name}-{os.getpid()}-{next(_instances)}.ndjson')
+        self.flushed = 0  # Số document đã insert
+        self.flushes = 0  # Số lần insert_many
+        self.replayed = 0  # Số document đọc lại từ journal của process đã chết
+        self._pending = {}  # str(_id) -> (document, SON); dict giữ thứ tự thêm vào
+        self._sealed = []  # File journal đã đóng, xóa khi batch của chúng được ghi xong
+        self._segments = 0
+        self._file = None
+        self._lock = threading.Lock()  # Journal đang mở + _pending
+        self._flush_lock = threading.Lock()  # Mỗi lúc chỉ một lần flush
+        self._wake = threading.Event()
+        self._thread = None
+
+    # --- VÒNG ĐỜI ---
+    def start(self):
+        """
+        Insert lại journal còn sót, mở journal của process này và chạy thread flush.
+        Journal còn sót được insert lại cả khi write-behind đã tắt (vừa chuyển từ on sang off).
+        """
+        if self._thread is not None:
+            return
+        if not self.enabled:
+            if os.path.isdir(self.directory):
+                self.recover()
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.recover()
+        self._open()
+        self._thread = threading.Thread(target=self._run, name=f'{self.name}-flush', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _open(self):
+        self._file = open(self.path, 'a', encoding='utf-8')
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _seal(self):
+        """Đóng journal hiện tại (chứa đúng các document đang chờ) và mở file mới; gọi khi giữ _lock."""
+        self._file.close()
+        self._segments += 1
+        sealed = f'{self.path}.{self._segments}.sealed'
+        os.replace(self.path, sealed)
+        self._sealed.append(sealed)
+        self._open()
+
+    def recover(self):
+        """
+        Insert các document trong journal của process đã dừng (kể cả process trước có cùng pid).
+        Gọi trước khi mở journal của process này.
+        """
+        for path in sorted(glob.glob(os.path.join(self.directory, f'{self.name}-*.ndjson*'))):
+            if _locked_by_other_process(path.split('.ndjson')[0] + '.ndjson'):
+                continue
+            documents = []
+            try:
+                with open(path, encoding='utf-8') as f:
+                    for line_no, line in enumerate(f, start=1):
+                        try:
+                            documents.append(json_util.loads(line))
+                        except ValueError:
+                            # Dòng cuối ghi dở khi process chết: request đó chưa nhận được 201
+                            log.warning('Bỏ qua dòng hỏng %s:%d', path, line_no)
+            except FileNotFoundError:
+                continue  # Worker khác khởi động cùng lúc đã ghi lại file này
+            self._insert(documents)
+            self.replayed += len(documents)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            log.info('Đã ghi lại %d document từ %s', len(documents), path)
+
+    # --- GHI ---
+    def save(self, document):
+        """Lưu document: ghi thẳng vào DB, hoặc vào journal khi bật write-behind."""
+        if not self.enabled:
+            document.save()
+            return document
+        if document.id is None:
+            document.id = ObjectId()
+        son = document.to_mongo()
+        line = json_util.dumps(son) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._pending[str(document.id)] = (document, son)
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+        return document
+
+    def flush(self):
+        """Ghi mọi document đang chờ bằng insert_many; trả về số document đã ghi."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch = list(self._pending.items())
+                self._seal()
+            self._insert([son for _, (_, son) in batch])
+            with self._lock:
+                for key, _ in batch:
+                    self._pending.pop(key, None)
+                sealed, self._sealed = self._sealed, []
+            for path in sealed:
+                os.remove(path)
+            self.flushed += len(batch)
+            self.flushes += 1
+            return len(batch)
+
+    def _insert(self, documents):
+        if not documents:
+            return
+        try:
+            self.model._get_collection().insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            # Trùng _id: document đã được ghi ở lần trước (flush bị ngắt giữa chừng), bỏ qua
+            errors = [err for err in e.details.get('writeErrors', []) if err.get('code') != DUPLICATE_KEY]
+            if errors:
+                raise
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                # Document vẫn nằm trong journal và _pending, lần sau thử lại
+                log.exception('Không ghi được batch %s xuống MongoDB', self.name)
+
+    # --- ĐỌC ---
+    def pending(self, **filters):
+        """Các document chưa flush của process này khớp filters (so sánh bằng)."""
+        with self._lock:
+            documents = [document for document, _ in self._pending.values()]
+        return [d for d in documents if all(getattr(d, field) == value for field, value in filters.items())]
+
+    def ensure_flushed(self, document_id):
+        """Flush ngay nếu document_id còn chờ, để truy vấn DB ngay sau đó thấy nó."""
+        if str(document_id) in self._pending:
+            self.flush()
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'pending': len(self._pending),
+            'flushed': self.flushed,
+            'flushes': self.flushes,
+            'replayed': self.replayed,
+            'journal': self.path if self.enabled else None,
+        }